@@ -0,0 +1,230 @@
+"""
+書き込み数の分析
+全サイトの日次データを1度に読み込み、移動平均・曜日ごとの平常値（過去の同じ曜日の平均と標準偏差）・
+平常値からの外れ（zスコア）・男女比の推移をまとめて計算する
+NumPy がインストールされていればサイト×日付の配列で一括に計算し、無ければ同じ計算を Python で行う
+結果は日次データが保存されるまで（db_manager.get_daily_data_version() が変わるまで）使い回す
+"""
+import math
+import threading
+from datetime import date, timedelta
+import db_manager
+import metrics
+from config import (
+    ANALYTICS_HISTORY_DAYS,
+    ANALYTICS_ROLLING_DAYS,
+    ANALYTICS_BASELINE_WEEKS,
+    ANALYTICS_MIN_SAMPLES,
+    ANALYTICS_ZSCORE_THRESHOLD
+)
+from payload import encode_json
+from scraper_utils import get_jst_now
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 計算に使う実装
+ENGINE = 'numpy' if np is not None else 'python'
+
+# エンコード済みの分析結果（key は (DBのパス, 日次データのバージョン, 対象日)）
+_cached = None
+_lock = threading.Lock()
+
+
+def _build_series(rows, start_date, days):
+    """日次データを サイト名 -> 日付順の [(合計, 男性, 女性) または None] に変換"""
+    series = {}
+    for row in rows:
+        values = series.get(row['site_name'])
+        if values is None:
+            values = series[row['site_name']] = [None] * days
+        index = (date.fromisoformat(row['record_date']) - start_date).days
+        if 0 <= index < days:
+            values[index] = (row['total_count'], row['male_count'] or 0, row['female_count'] or 0)
+    return series
+
+
+def _classify(zscore):
+    """zスコアから 'high'（いつもより多い）・'low'（いつもより少ない）・None を判定"""
+    if zscore is None:
+        return None
+    if zscore >= ANALYTICS_ZSCORE_THRESHOLD:
+        return 'high'
+    if zscore <= -ANALYTICS_ZSCORE_THRESHOLD:
+        return 'low'
+    return None
+
+
+def _site_result(start_date, latest, total, rolling_avg, samples, baseline, baseline_std, zscore,
+                 female_ratio, previous_female_ratio):
+    """1サイト分の分析結果（APIで返す形式）"""
+    def rounded(value, digits=2):
+        return None if value is None else round(value, digits)
+
+    return {
+        'date': (start_date + timedelta(days=latest)).isoformat(),
+        'total_count': total,
+        'rolling_avg': rounded(rolling_avg),
+        'baseline': rounded(baseline),
+        'baseline_std': rounded(baseline_std),
+        'baseline_samples': samples,
+        'zscore': rounded(zscore),
+        'anomaly': _classify(zscore),
+        'female_ratio': rounded(female_ratio, 4),
+        'female_ratio_change': rounded(
+            None if female_ratio is None or previous_female_ratio is None else female_ratio - previous_female_ratio,
+            4
+        )
+    }
+
+
+def _analyze_python(series, start_date):
+    """サイトごとに Python で計算（NumPy が無い場合）"""
+    window = ANALYTICS_ROLLING_DAYS
+    results = {}
+    for site_name, values in series.items():
+        latest = max(index for index, value in enumerate(values) if value is not None)
+        total = values[latest][0]
+
+        # 直前の window 日（当日を含まない）の平均
+        previous = [value[0] for value in values[max(latest - window, 0):latest] if value is not None]
+        rolling_avg = sum(previous) / len(previous) if previous else None
+
+        # 過去の同じ曜日の平均・標準偏差（不偏）と、当日の外れ具合
+        same_weekday = [
+            values[index][0]
+            for index in range(latest - 7, latest - 7 * ANALYTICS_BASELINE_WEEKS - 1, -7)
+            if index >= 0 and values[index] is not None
+        ]
+        samples = len(same_weekday)
+        baseline = baseline_std = zscore = None
+        if samples >= max(ANALYTICS_MIN_SAMPLES, 2):
+            baseline = sum(same_weekday) / samples
+            baseline_std = math.sqrt(sum((value - baseline) ** 2 for value in same_weekday) / (samples - 1))
+            if baseline_std > 0:
+                zscore = (total - baseline) / baseline_std
+
+        # 直近 window 日（当日を含む）とその前の window 日の女性の割合（男女が判別できた投稿のうち）
+        def female_ratio(begin, end):
+            male = female = 0
+            for value in values[max(begin, 0):max(end, 0)]:
+                if value is not None:
+                    male += value[1]
+                    female += value[2]
+            return female / (male + female) if male + female else None
+
+        results[site_name] = _site_result(
+            start_date, latest, total, rolling_avg, samples, baseline, baseline_std, zscore,
+            female_ratio(latest - window + 1, latest + 1),
+            female_ratio(latest - 2 * window + 1, latest - window + 1)
+        )
+    return results
+
+
+def _analyze_numpy(series, start_date):
+    """サイト×日付の配列で全サイトを一括に計算"""
+    names = list(series)
+    if not names:
+        return {}
+    window = ANALYTICS_ROLLING_DAYS
+    data = np.array(
+        [[value if value is not None else (np.nan, 0, 0) for value in series[name]] for name in names],
+        dtype=float
+    )
+    totals, males, females = data[:, :, 0], data[:, :, 1], data[:, :, 2]
+    recorded = ~np.isnan(totals)
+    rows = np.arange(len(names))
+    days = totals.shape[1]
+    latest = days - 1 - np.argmax(recorded[:, ::-1], axis=1)
+    current = totals[rows, latest]
+
+    # 累積和から任意の区間 [begin, end) の合計を求める
+    def cumulative(values):
+        return np.concatenate([np.zeros((len(names), 1)), np.cumsum(values, axis=1)], axis=1)
+
+    def window_sum(sums, begin, end):
+        begin, end = np.clip(begin, 0, days), np.clip(end, 0, days)
+        return sums[rows, end] - sums[rows, begin]
+
+    total_sums = cumulative(np.where(recorded, totals, 0))
+    count_sums = cumulative(recorded)
+    male_sums = cumulative(males)
+    female_sums = cumulative(females)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 直前の window 日（当日を含まない）の平均
+        previous_count = window_sum(count_sums, latest - window, latest)
+        rolling_avg = window_sum(total_sums, latest - window, latest) / previous_count
+
+        # 過去の同じ曜日の平均・標準偏差（不偏）と、当日の外れ具合
+        offsets = latest[:, None] - 7 * np.arange(1, ANALYTICS_BASELINE_WEEKS + 1)[None, :]
+        same_weekday = np.where(offsets >= 0, totals[rows[:, None], np.clip(offsets, 0, None)], np.nan)
+        samples = np.sum(~np.isnan(same_weekday), axis=1)
+        baseline = np.nansum(same_weekday, axis=1) / samples
+        baseline_std = np.sqrt(np.nansum((same_weekday - baseline[:, None]) ** 2, axis=1) / (samples - 1))
+        enough = samples >= max(ANALYTICS_MIN_SAMPLES, 2)
+        zscore = np.where(enough & (baseline_std > 0), (current - baseline) / baseline_std, np.nan)
+
+        # 直近 window 日（当日を含む）とその前の window 日の女性の割合
+        def female_ratio(begin, end):
+            female = window_sum(female_sums, begin, end)
+            return female / (window_sum(male_sums, begin, end) + female)
+
+        recent_ratio = female_ratio(latest - window + 1, latest + 1)
+        previous_ratio = female_ratio(latest - 2 * window + 1, latest - window + 1)
+
+    def value(array, index, valid=True):
+        return float(array[index]) if valid and not np.isnan(array[index]) else None
+
+    return {
+        name: _site_result(
+            start_date,
+            int(latest[index]),
+            int(current[index]),
+            value(rolling_avg, index),
+            int(samples[index]),
+            value(baseline, index, enough[index]),
+            value(baseline_std, index, enough[index]),
+            value(zscore, index),
+            value(recent_ratio, index),
+            value(previous_ratio, index)
+        )
+        for index, name in enumerate(names)
+    }
+
+
+def analyze(rows, target_date):
+    """
+    日次データ（get_daily_data_range() の形式）を分析する
+    各サイトは target_date 以前で最後にデータがある日を対象にする（当日のバッチ前は前日の結果になる）
+    """
+    start_date = target_date - timedelta(days=ANALYTICS_HISTORY_DAYS - 1)
+    series = _build_series(rows, start_date, ANALYTICS_HISTORY_DAYS)
+    sites = _analyze_numpy(series, start_date) if np is not None else _analyze_python(series, start_date)
+    return {'date': target_date.isoformat(), 'engine': ENGINE, 'sites': sites}
+
+
+def get_encoded_analytics(target_date=None):
+    """
+    全サイトの分析結果をエンコード済みのJSON（EncodedPayload）で返す
+    日次データが保存されるまでは前回の結果をそのまま返す
+    """
+    global _cached
+    target_date = target_date or get_jst_now().date()
+    key = (db_manager.DB_PATH, db_manager.get_daily_data_version(), target_date.isoformat())
+    cached = _cached
+    if cached is not None and cached.key == key:
+        metrics.inc('analytics_cache_total', result='hit')
+        return cached
+    with _lock:
+        if _cached is not None and _cached.key == key:
+            metrics.inc('analytics_cache_total', result='hit')
+            return _cached
+        metrics.inc('analytics_cache_total', result='miss')
+        with metrics.timer('analytics_seconds', engine=ENGINE):
+            start_date = target_date - timedelta(days=ANALYTICS_HISTORY_DAYS - 1)
+            rows = db_manager.get_daily_data_range(start_date.isoformat(), target_date.isoformat())
+            _cached = encode_json(analyze(rows, target_date), key)
+        return _cached
@@ -1,99 +1,195 @@
-from flask import Flask, jsonify, render_template, request
-from apscheduler.schedulers.background import BackgroundScheduler
+"""
+掲示板の書き込み数ダッシュボード（Flask）
+gunicorn では app:app（または app:create_app()）を指定する。モジュールの読み込み時にはDB・スケジューラーに触れず、
+app 属性を初めて参照した時（create_app()）にスキーマの確認・サイト設定の読み込み・スケジューラーの起動を行う
+"""
+from flask import Blueprint, Flask, Response, jsonify, render_template, request, stream_with_context, url_for
 import atexit
+import json
+import threading
+from datetime import datetime, timedelta
 import db_manager
 from daily_batch import run_daily_batch
-from config import TARGET_SITES, JST, BATCH_HOUR, BATCH_MINUTE, CACHE_EXPIRATION
-from scraper_utils import (
-    get_jst_now,
-    get_post_count_from_element,
-    get_today_post_count_from_paging_site,
-    get_today_post_count_with_gender
-)
+from config import BATCH_HOUR, BATCH_MINUTE, JOB_POLL_INTERVAL
+from scraper_utils import get_jst_now
+from result_cache import ScrapeResultCache
+from payload import choose_encoding, encode_json, make_etag
+import site_registry
+import job_queue
+import metrics
+import analytics
 
-app = Flask(__name__)
+bp = Blueprint('dashboard', __name__)
 
-# データベース初期化
-db_manager.init_db()
+# 定時バッチを1日1回に制限するリースの有効期限（秒）
+SCHEDULED_BATCH_LEASE_TTL = 12 * 60 * 60
 
-# スケジューラー設定
-scheduler = BackgroundScheduler(timezone='Asia/Tokyo')
+# このプロセスのスケジューラー（start_scheduler() で起動）
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# app 属性で参照されるアプリケーション（初回の参照時に作成）
+_app = None
+_app_lock = threading.Lock()
 
 def scheduled_batch_job():
-    """スケジューラーから呼ばれるジョブ"""
+    """スケジューラーから呼ばれるジョブ（各ワーカーのスケジューラーから呼ばれるため、1日1回だけ実行する）"""
     print("Scheduled batch job triggered")
-    run_daily_batch()
-
-# 毎日指定時刻に実行
-scheduler.add_job(
-    func=scheduled_batch_job,
-    trigger='cron',
-    hour=BATCH_HOUR,
-    minute=BATCH_MINUTE,
-    id='daily_batch_job',
-    name='Daily post count batch',
-    replace_existing=True
-)
-
-scheduler.start()
-
-# アプリケーション終了時にスケジューラーを停止
-atexit.register(lambda: scheduler.shutdown())
-
-# 状態管理のための辞書
-SCRAPED_DATA_CACHE = {
-    'last_updated': None,
-    'data': None
-}
+    lease_name = f"scheduled_batch:{get_jst_now().strftime('%Y-%m-%d')}"
+    owner = db_manager.make_lease_owner()
+    if not db_manager.acquire_lease(lease_name, owner, SCHEDULED_BATCH_LEASE_TTL):
+        print("Today's scheduled batch has already been run by another worker. Skipping.")
+        return
+    if run_daily_batch() is None:
+        # 他のバッチ（手動で登録したバッチ等）が実行中で今回は実行していないため、今日の定時バッチを実行済みにしない
+        db_manager.release_lease(lease_name, owner)
+        print("Scheduled batch did not run because another batch is running. Released today's lease.")
+
+def start_scheduler():
+    """スケジューラーを作成して起動する（プロセスごとに1度だけ。起動済みならそれを返す）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return _scheduler
+
+        # APSchedulerはスケジューラーを起動するプロセスでのみ読み込む
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        scheduler = BackgroundScheduler(timezone='Asia/Tokyo')
+
+        # 毎日指定時刻に実行
+        scheduler.add_job(
+            func=scheduled_batch_job,
+            trigger='cron',
+            hour=BATCH_HOUR,
+            minute=BATCH_MINUTE,
+            id='daily_batch_job',
+            name='Daily post count batch',
+            replace_existing=True
+        )
+
+        # 日中の推移の記録を1時間ごとに間引く
+        scheduler.add_job(
+            func=db_manager.compact_intraday_samples,
+            trigger='cron',
+            minute=5,
+            id='compact_intraday_job',
+            name='Compact intraday samples',
+            replace_existing=True
+        )
+
+        # 手動のバッチ実行・強制更新のジョブを取り出して実行（どのワーカーが登録したジョブも実行する）
+        scheduler.add_job(
+            func=job_queue.run_pending_jobs,
+            trigger='interval',
+            seconds=JOB_POLL_INTERVAL,
+            id='job_queue',
+            name='Run queued jobs',
+            replace_existing=True
+        )
+
+        scheduler.start()
+
+        # アプリケーション終了時にスケジューラーを停止
+        atexit.register(lambda: scheduler.shutdown())
+        _scheduler = scheduler
+        return scheduler
+
+def create_app(with_scheduler=True):
+    """
+    Flaskアプリケーションを作成
+    データベースのスキーマを確認し、サイト設定を読み込んでアダプター（セレクター・日付書式）を準備する
+    with_scheduler=False ではスケジューラーを起動しない（別のプロセスで定時バッチ・ジョブを実行する場合）
+    """
+    from site_adapters import build_adapters
+
+    db_manager.init_db()
+    build_adapters(site_registry.get_sites())
+
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    if with_scheduler:
+        start_scheduler()
+    return flask_app
+
+def __getattr__(name):
+    """app 属性（gunicorn の app:app など）を初めて参照した時にアプリケーションを作成する"""
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+        return _app
+
+# 履歴APIの上限
+HISTORY_MAX_DAYS = 3660
+HISTORY_MAX_PER_PAGE = 500
+
+# サイトごとのスクレイピング結果キャッシュ
+RESULT_CACHE = ScrapeResultCache()
 
 def scrape_data(force_run=False):
-    """ データをスクレイピングし、結果の辞書を返すメイン関数（キャッシュ機能付き） """
-    
-    global SCRAPED_DATA_CACHE
-    cache = SCRAPED_DATA_CACHE
-    
-    # キャッシュの有効期限をチェック
-    now_jst = get_jst_now()
-    is_cache_stale = (cache['last_updated'] is None or 
-                      (now_jst - cache['last_updated']).total_seconds() > CACHE_EXPIRATION)
-    
-    if not force_run and not is_cache_stale:
-        print("Returning data from cache.")
-        return cache['data']
+    """ スクレイピング結果を返すメイン関数（期限切れの場合は古い結果を返しつつバックグラウンドで更新） """
+    if force_run:
+        print("Executing full scrape...")
+        return RESULT_CACHE.refresh()
+    return RESULT_CACHE.get_snapshot()
 
-    print("Executing full scrape...")
-    results = []
+@job_queue.register_job('refresh')
+def refresh_job(progress):
+    """全サイトを強制的に更新するジョブ"""
+    progress({site['name']: 'pending' for site in RESULT_CACHE.sites})
+    for result in RESULT_CACHE.stream(force=True, include_cached=False):
+        # 取得に失敗したサイトは前回の結果が残る（古い結果になる）
+        progress({result.site_name: 'error' if result.stale else 'done'})
+    return {'last_updated': RESULT_CACHE.build_snapshot()['last_updated']}
 
-    for site in TARGET_SITES:
-        try:
-            if site['type'] == 'element':
-                result = get_post_count_from_element(site)
-            elif site['type'] == 'paging_bbs':
-                result = get_today_post_count_from_paging_site(site)
-            elif site['type'] == 'paging_bbs_gender':
-                result = get_today_post_count_with_gender(site)
-            
-            results.append(result)
-        except Exception as e:
-            print(f"An unexpected error occurred for {site['display_name']}: {e}")
-            results.append({
-                'display_name': site['display_name'],
-                'count': '処理エラー',
-                'url': site.get('url') or site.get('base_url', 'N/A'),
-                'type': site['type'],
-                'image_url': site['image_url']
-            })
-
-    final_data = {
-        'last_updated': now_jst.strftime('%Y-%m-%d %H:%M:%S'),
-        'post_data': results
-    }
-    
-    # キャッシュを更新
-    SCRAPED_DATA_CACHE['last_updated'] = now_jst
-    SCRAPED_DATA_CACHE['data'] = final_data
-    
-    return final_data
+@job_queue.register_job('batch')
+def batch_job(progress):
+    """日次バッチを実行するジョブ"""
+    progress({site['name']: 'pending' for site in site_registry.get_sites()})
+    results = run_daily_batch(
+        on_result=lambda result: progress({result.site_name: 'error' if result.error else 'done'})
+    )
+    if results is None:
+        raise RuntimeError('別のワーカーでバッチを実行中です')
+    return [result.to_dict() for result in results]
+
+@job_queue.register_job('backfill')
+def backfill_job(progress, start, end, sites=None, overwrite=False, restart=False):
+    """過去の日付の書き込み数を取得してDBに保存するジョブ"""
+    # バックフィル（requests・BeautifulSoup）はジョブを実行する時に読み込む（import app を速くする）
+    from backfill import parse_date_range, run_backfill, select_sites
+
+    start_date, end_date = parse_date_range(start, end)
+    progress({site['name']: 'pending' for site in select_sites(sites)})
+    results = run_backfill(
+        start_date,
+        end_date,
+        sites,
+        overwrite=overwrite,
+        restart=restart,
+        on_result=lambda result: progress({result['site_name']: 'error' if 'error' in result else 'done'})
+    )
+    if results is None:
+        raise RuntimeError('別のワーカーでバックフィルを実行中です')
+    return results
+
+def enqueue_job(kind, params=None):
+    """
+    ジョブを登録し、ジョブIDと状態を確認するURLを返す
+    同じ種類・同じ引数のジョブが実行待ち・実行中ならそれを返す
+    """
+    job, created = job_queue.enqueue(kind, params)
+    if created and _scheduler is not None and not job_queue.is_running():
+        # 次の定期確認を待たずにこのワーカーで実行を始める
+        _scheduler.add_job(func=job_queue.run_pending_jobs, id='job_queue_now', replace_existing=True)
+    return jsonify({
+        'status': job['status'],
+        'job_id': job['id'],
+        'status_url': url_for('.job_status', job_id=job['id'])
+    }), 202
 
 def calculate_comparison(current_count, past_count):
     """前回との比較を計算"""
@@ -120,92 +216,312 @@ def calculate_comparison(current_count, past_count):
 
 # --- Flask ルート定義 ---
 
-@app.route('/')
+@bp.route('/')
 def index():
     """トップページ（index.html）を表示する"""
     return render_template('index.html')
 
-@app.route('/api/posts')
+def cache_headers(etag, weak=False):
+    """
+    ETag・Cache-Controlヘッダー
+    ブラウザ・プロキシに保存させるが、使う前に毎回ETagで確認させる（強制更新・前日以前の件数の更新を直ちに反映する）
+    """
+    return {
+        'ETag': f'W/"{etag}"' if weak else f'"{etag}"',
+        'Cache-Control': 'public, no-cache',
+        'Vary': 'Accept-Encoding'
+    }
+
+def not_modified(etag, weak=False):
+    """If-None-MatchがETagと一致すれば304レスポンスを返す（一致しなければNone）"""
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=cache_headers(etag, weak))
+    return None
+
+def payload_response(payload, etag=None):
+    """
+    エンコード済みのJSON（EncodedPayload）をレスポンスにする
+    Accept-Encodingに応じて圧縮し、If-None-MatchがETagと一致すれば304を返す
+    etagを指定した場合は本文のハッシュの代わりに弱いETagとして使う
+    """
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    body, encoding = payload.encode(encoding)
+    weak = etag is not None
+    if etag is None:
+        etag = payload.etag_for(encoding)
+    response = not_modified(etag, weak)
+    if response is not None:
+        return response
+    headers = cache_headers(etag, weak)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
+
+@bp.route('/api/posts')
 def get_posts():
     """キャッシュされた、または新規にスクレイピングしたデータを返すAPI"""
     try:
-        data = scrape_data(force_run=False)
-        return jsonify(data)
+        return payload_response(RESULT_CACHE.get_encoded_snapshot())
     except Exception as e:
         print(f"API Error in get_posts: {e}")
         return jsonify({'error': f'データの取得中にエラーが発生しました: {e}'}), 500
 
-@app.route('/api/refresh')
+@bp.route('/api/refresh')
 def force_refresh():
-    """強制的にスクレイピングを実行し、最新のデータを返すAPI"""
+    """全サイトの強制更新をジョブとして登録し、ジョブIDを返すAPI（結果は /api/jobs/<job_id> で確認）"""
     try:
-        data = scrape_data(force_run=True)
-        return jsonify(data)
+        return enqueue_job('refresh')
     except Exception as e:
         print(f"API Error in force_refresh: {e}")
         return jsonify({'error': f'強制更新中にエラーが発生しました: {e}'}), 500
 
-@app.route('/api/comparison')
+def format_sse(event, data):
+    """Server-Sent Eventsの1イベント分の文字列"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@bp.route('/api/stream')
+def stream_posts():
+    """
+    サイトごとの結果を取得でき次第送信するAPI（Server-Sent Events）
+    最初に 'sites' でサイト一覧、続いてサイトごとに 'site'、最後に 'done' を送る
+    ?refresh=1 で全サイトを強制的に更新する
+    """
+    force = request.args.get('refresh') == '1'
+
+    def generate():
+        yield format_sse('sites', [
+            {'site_name': site['name'], 'display_name': site['display_name'], 'image_url': site['image_url']}
+            for site in RESULT_CACHE.sites
+        ])
+        last_updated = None
+        try:
+            for result in RESULT_CACHE.stream(force=force):
+                if last_updated is None or result.last_updated > last_updated:
+                    last_updated = result.last_updated
+                yield format_sse('site', result.to_dict())
+        except Exception as e:
+            print(f"API Error in stream_posts: {e}")
+            yield format_sse('error', {'error': f'データの取得中にエラーが発生しました: {e}'})
+        yield format_sse('done', {'last_updated': last_updated})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/api/comparison')
 def get_comparison():
-    """前日・前週同曜日との比較データを返すAPI"""
+    """
+    前日・前週同曜日などとの比較データを返すAPI
+    offsets パラメータで比較対象を指定可能（例: ?offsets=yesterday,last_week,28,last_year）
+    """
+    try:
+        offsets = db_manager.resolve_comparison_offsets(
+            request.args.get('offsets', 'yesterday,last_week').split(',')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     try:
         today = get_jst_now().strftime('%Y-%m-%d')
-        comparisons = db_manager.get_all_sites_comparison(today)
+        # データが変わっていなければ比較を計算せずに304を返す
+        etag = make_etag('comparison', db_manager.get_daily_data_version(), today, list(offsets.items()))
+        response = not_modified(etag, weak=True)
+        if response is not None:
+            return response
+
+        comparisons = db_manager.get_comparison_rows(today, offsets)
         
-        # 現在のデータも含めて返す
+        # 今日のデータがあるサイトのみ返す
         result = {}
-        for site_name, comp_data in comparisons.items():
-            # 今日のデータを取得
-            today_data = db_manager.get_data_by_date(site_name, today)
-            
-            if today_data:
-                # 前日との比較
-                yesterday_comp = calculate_comparison(
-                    today_data['total_count'],
-                    comp_data['yesterday']['total_count'] if comp_data['yesterday'] else None
-                )
-                
-                # 前週同曜日との比較
-                last_week_comp = calculate_comparison(
+        for site_name, rows in comparisons.items():
+            today_data = rows['today']
+            if not today_data:
+                continue
+
+            site_result = {'today': today_data}
+            for key in offsets:
+                past_data = rows[key]
+                site_result[key] = past_data
+                site_result[f'{key}_comparison'] = calculate_comparison(
                     today_data['total_count'],
-                    comp_data['last_week']['total_count'] if comp_data['last_week'] else None
+                    past_data['total_count'] if past_data else None
                 )
-                
-                result[site_name] = {
-                    'today': today_data,
-                    'yesterday': comp_data['yesterday'],
-                    'last_week': comp_data['last_week'],
-                    'yesterday_comparison': yesterday_comp,
-                    'last_week_comparison': last_week_comp
-                }
+            result[site_name] = site_result
         
-        return jsonify(result)
+        return payload_response(encode_json(result), etag)
     except Exception as e:
         print(f"API Error in get_comparison: {e}")
         return jsonify({'error': f'比較データの取得中にエラーが発生しました: {e}'}), 500
 
-@app.route('/api/history/<site_name>')
+@bp.route('/api/analytics')
+def get_analytics():
+    """
+    サイトごとの移動平均・曜日ごとの平常値との比較（zスコアと anomaly: high / low）・男女比の推移を返すAPI
+    分析結果は日次データが保存されるまで使い回す
+    """
+    try:
+        return payload_response(analytics.get_encoded_analytics())
+    except Exception as e:
+        print(f"API Error in get_analytics: {e}")
+        return jsonify({'error': f'分析データの取得中にエラーが発生しました: {e}'}), 500
+
+@bp.route('/api/history/<site_name>')
 def get_history(site_name):
-    """特定サイトの履歴データを返すAPI"""
+    """
+    特定サイト（'all' で全サイト合計）の履歴データを返すAPI
+    期間（days）に応じて日次・週次・月次の集計を自動で選び、ページ単位で返す
+    """
+    days = min(max(request.args.get('days', 7, type=int), 1), HISTORY_MAX_DAYS)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), HISTORY_MAX_PER_PAGE)
+    granularity = request.args.get('granularity', 'auto')
+    if granularity != 'auto' and granularity not in db_manager.HISTORY_SOURCES:
+        return jsonify({'error': f'不明な粒度です: {granularity}'}), 400
+
     try:
-        days = request.args.get('days', 7, type=int)
-        history = db_manager.get_recent_history(site_name, days)
-        return jsonify(history)
+        etag = make_etag(
+            'history', db_manager.get_daily_data_version(), get_jst_now().strftime('%Y-%m-%d'),
+            site_name, days, granularity, page, per_page
+        )
+        response = not_modified(etag, weak=True)
+        if response is not None:
+            return response
+
+        history = db_manager.get_history(site_name, days, granularity, page, per_page)
+        return payload_response(encode_json(history), etag)
     except Exception as e:
         print(f"API Error in get_history: {e}")
         return jsonify({'error': f'履歴データの取得中にエラーが発生しました: {e}'}), 500
 
-@app.route('/api/batch/run')
+@bp.route('/api/history/<site_name>/weekday')
+def get_weekday_profile(site_name):
+    """特定サイトの曜日別の平均書き込み数を返すAPI"""
+    try:
+        return jsonify(db_manager.get_weekday_profile(site_name))
+    except Exception as e:
+        print(f"API Error in get_weekday_profile: {e}")
+        return jsonify({'error': f'曜日別データの取得中にエラーが発生しました: {e}'}), 500
+
+@bp.route('/api/intraday/<site_name>')
+def get_intraday(site_name):
+    """
+    特定サイトの1時間ごとの書き込み数を返すAPI
+    date（省略時は今日）と、比較対象 compare（例: last_week, 7）を指定可能
+    """
+    target_date = request.args.get('date') or get_jst_now().strftime('%Y-%m-%d')
+    try:
+        current = datetime.strptime(target_date, '%Y-%m-%d')
+        offsets = db_manager.resolve_comparison_offsets(
+            [name for name in request.args.get('compare', '').split(',') if name]
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        result = {
+            'site_name': site_name,
+            'date': target_date,
+            'hours': db_manager.get_hourly_posts(site_name, target_date)
+        }
+        for key, days in offsets.items():
+            compare_date = (current - timedelta(days=days)).strftime('%Y-%m-%d')
+            result[key] = {
+                'date': compare_date,
+                'hours': db_manager.get_hourly_posts(site_name, compare_date)
+            }
+        return jsonify(result)
+    except Exception as e:
+        print(f"API Error in get_intraday: {e}")
+        return jsonify({'error': f'推移データの取得中にエラーが発生しました: {e}'}), 500
+
+@bp.route('/api/batch/run')
 def manual_batch_run():
-    """手動でバッチを実行するAPI（テスト用）"""
+    """手動でバッチをジョブとして登録し、ジョブIDを返すAPI（テスト用、結果は /api/jobs/<job_id> で確認）"""
     try:
-        results = run_daily_batch()
-        return jsonify({'status': 'success', 'results': results})
+        return enqueue_job('batch')
     except Exception as e:
         print(f"Batch Error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@bp.route('/api/sites')
+def get_sites():
+    """現在のサイト設定とそのバージョン番号を返すAPI（変更は site_registry.py で行う）"""
+    try:
+        return jsonify({'version': site_registry.get_sites_version(), 'sites': site_registry.get_sites()})
+    except Exception as e:
+        print(f"API Error in get_sites: {e}")
+        return jsonify({'error': f'サイト設定の取得中にエラーが発生しました: {e}'}), 500
+
+@bp.route('/api/jobs/<int:job_id>')
+def job_status(job_id):
+    """ジョブの状態とサイトごとの進捗（pending / done / error）を返すAPI"""
+    try:
+        job = job_queue.get_job_status(job_id)
+        if job is None:
+            return jsonify({'error': f'不明なジョブです: {job_id}'}), 404
+        return jsonify(job)
+    except Exception as e:
+        print(f"API Error in job_status: {e}")
+        return jsonify({'error': f'ジョブの状態の取得中にエラーが発生しました: {e}'}), 500
+
+@bp.route('/api/backfill', methods=['POST'])
+def backfill():
+    """
+    過去の日付の書き込み数の取得をジョブとして登録し、ジョブIDを返すAPI（結果は /api/jobs/<job_id> で確認）
+    引数（クエリ文字列またはフォーム）: start=YYYY-MM-DD&end=YYYY-MM-DD&sites=a,b&overwrite=1&restart=1
+    """
+    from backfill import parse_date_range
+
+    start, end = request.values.get('start', ''), request.values.get('end')
+    sites = request.values.get('sites')
+    site_names = sites.split(',') if sites else None
+    try:
+        start_date, end_date = parse_date_range(start, end)
+        if site_names is not None:
+            unknown = set(site_names) - {site['name'] for site in site_registry.get_sites()}
+            if unknown:
+                raise ValueError(f"不明なサイトです: {', '.join(sorted(unknown))}")
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    try:
+        return enqueue_job('backfill', {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'sites': site_names,
+            'overwrite': request.values.get('overwrite') == '1',
+            'restart': request.values.get('restart') == '1'
+        })
+    except Exception as e:
+        print(f"Backfill Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@bp.route('/api/stats/http')
+def http_stats():
+    """掲示板取得の通信状況（304・解析結果の再利用など）を返すAPI"""
+    from http_client import get_http_stats
+
+    return jsonify(get_http_stats())
+
+@bp.route('/api/batch/runs')
+def batch_runs():
+    """最近のバッチ実行の計測結果（サイト・処理段階ごとの所要時間など）を返すAPI"""
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        return jsonify(db_manager.get_batch_runs(limit))
+    except Exception as e:
+        print(f"Batch Runs Error: {e}")
+        return jsonify({'error': f'バッチ実行履歴の取得中にエラーが発生しました: {e}'}), 500
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus形式の計測値"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    app = create_app()
     print(f"Scheduler started. Next batch run at {BATCH_HOUR}:00 JST")
-    print(f"Jobs: {scheduler.get_jobs()}")
+    print(f"Jobs: {start_scheduler().get_jobs()}")
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+過去の日付の書き込み数の取得（バックフィル）
+バッチが動かなかった日の欠損を埋める。各掲示板を1回だけ巡回し、投稿を日付ごとに振り分けて集計する
+途中経過はページごとに保存し、中断しても続きから再開できる
+
+使い方: python backfill.py 2026-10-01 2026-10-15 [--sites 440,canelo] [--overwrite] [--restart]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import db_manager
+from config import SCRAPE_MAX_WORKERS, BACKFILL_MAX_PAGES, BACKFILL_LEASE_TTL
+from scraper_utils import get_jst_now
+from site_adapters import get_adapter
+from site_registry import get_sites
+
+# バックフィルの排他に使うリース名
+BACKFILL_LEASE_NAME = 'backfill'
+
+
+def parse_date_range(start, end=None):
+    """'YYYY-MM-DD' の期間を検証してdateの組で返す（終了日省略時は昨日）"""
+    start_date = date.fromisoformat(start)
+    end_date = date.fromisoformat(end) if end else get_jst_now().date() - timedelta(days=1)
+    if start_date > end_date:
+        raise ValueError(f'開始日が終了日より後です: {start_date} > {end_date}')
+    if end_date > get_jst_now().date():
+        raise ValueError(f'未来の日付は指定できません: {end_date}')
+    return start_date, end_date
+
+
+def select_sites(names=None):
+    """対象サイト（過去の日付を取得できるサイトのみ）"""
+    sites = [site for site in get_sites() if names is None or site['name'] in names]
+    if names is not None:
+        unknown = set(names) - {site['name'] for site in sites}
+        if unknown:
+            raise ValueError(f"不明なサイトです: {', '.join(sorted(unknown))}")
+    return [site for site in sites if get_adapter(site).supports_backfill]
+
+
+def backfill_site(site, start_date, end_date, overwrite=False, restart=False, max_pages=BACKFILL_MAX_PAGES):
+    """1サイト分のバックフィルを実行し、保存した日数などを返す"""
+    start_str, end_str = start_date.isoformat(), end_date.isoformat()
+    checkpoint = None if restart else db_manager.get_backfill_checkpoint(site['name'], start_str, end_str)
+
+    def save_checkpoint(state):
+        db_manager.save_backfill_checkpoint(site['name'], start_str, end_str, state)
+
+    result = get_adapter(site).backfill(start_date, end_date, max_pages, checkpoint, save_checkpoint)
+
+    rows = []
+    if result['complete_from'] is not None:
+        skip = set() if overwrite else db_manager.get_recorded_dates(site['name'], start_str, end_str)
+        day = max(start_date, result['complete_from'])
+        while day <= end_date:
+            record_date = day.isoformat()
+            if record_date not in skip:
+                total, male, female, unknown = result['buckets'].get(record_date, (0, 0, 0, 0))
+                rows.append({
+                    'site_name': site['name'],
+                    'record_date': record_date,
+                    'total_count': total,
+                    'male_count': male,
+                    'female_count': female,
+                    'unknown_count': unknown
+                })
+            day += timedelta(days=1)
+
+    if rows:
+        db_manager.save_daily_data_many(rows)
+    db_manager.delete_backfill_checkpoint(site['name'], start_str, end_str)
+
+    return {
+        'site_name': site['name'],
+        'saved_days': len(rows),
+        'complete_from': result['complete_from'].isoformat() if result['complete_from'] else None,
+        'stop_reason': result['stop_reason'],
+        'resumed': checkpoint is not None
+    }
+
+
+def run_backfill(start_date, end_date, site_names=None, overwrite=False, restart=False, on_result=None):
+    """
+    期間内の書き込み数を取得してDBに保存（既存の日付は overwrite 指定時のみ上書き）
+    他のワーカー・プロセスが実行中の場合は何もせずにNoneを返す
+    on_result を指定すると、サイトごとの結果（backfill_site の戻り値、失敗時は error を含む）を終わり次第渡す
+    """
+    db_manager.init_db()
+    sites = select_sites(site_names)
+
+    owner = db_manager.make_lease_owner()
+    if not db_manager.acquire_lease(BACKFILL_LEASE_NAME, owner, BACKFILL_LEASE_TTL):
+        print("Backfill is already running in another worker. Skipping.")
+        return None
+
+    def run(site):
+        try:
+            result = backfill_site(site, start_date, end_date, overwrite, restart)
+        except Exception as e:
+            # 途中経過は保存済みのため、再実行すれば続きから再開する
+            print(f"✗ Backfill failed for {site['display_name']}: {e}")
+            result = {'site_name': site['name'], 'error': str(e)}
+        finally:
+            db_manager.acquire_lease(BACKFILL_LEASE_NAME, owner, BACKFILL_LEASE_TTL)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix='backfill') as executor:
+            results = list(executor.map(run, sites))
+    finally:
+        db_manager.release_lease(BACKFILL_LEASE_NAME, owner)
+
+    for result in results:
+        if 'error' not in result:
+            print(f"✓ {result['site_name']}: {result['saved_days']}日分")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='過去の日付の書き込み数を取得してDBに保存')
+    parser.add_argument('start', help='開始日 (YYYY-MM-DD)')
+    parser.add_argument('end', nargs='?', help='終了日 (YYYY-MM-DD、省略時は昨日)')
+    parser.add_argument('--sites', help='対象サイト名（カンマ区切り、省略時は全サイト）')
+    parser.add_argument('--overwrite', action='store_true', help='保存済みの日付も上書きする')
+    parser.add_argument('--restart', action='store_true', help='途中経過を使わず最初から巡回する')
+    args = parser.parse_args()
+
+    site_names = args.sites.split(',') if args.sites else None
+    try:
+        start_date, end_date = parse_date_range(args.start, args.end)
+        db_manager.init_db()
+        select_sites(site_names)
+    except ValueError as e:
+        parser.error(str(e))
+    if run_backfill(start_date, end_date, site_names, args.overwrite, args.restart) is None:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
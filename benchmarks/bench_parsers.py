@@ -0,0 +1,128 @@
+"""
+HTML解析バックエンドのベンチマーク
+保存済みのフィクスチャページ（benchmarks/fixtures/<サイト名>/*.html）を各バックエンドで解析し、
+1秒あたりの解析ページ数と、従来の処理（html.parserで全体を解析）と抽出結果が一致するかを表示する
+
+使い方: python benchmarks/bench_parsers.py [--repeat 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from config import TARGET_SITES
+import page_parser
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# サイト種別ごとの投稿要素のセレクター
+POST_SELECTORS = {
+    'paging_bbs': 'table.layer_pop',
+    'paging_bbs_gender': 'dl.contributor',
+}
+
+
+def baseline_parse(html, post_selector, field_selectors):
+    """従来の処理（html.parserで全体を解析してからselect）"""
+    soup = BeautifulSoup(html, 'html.parser')
+    posts = []
+    for post in soup.select(post_selector):
+        fields = {}
+        for field, selector in field_selectors.items():
+            element = post.select_one(selector)
+            fields[field] = element.text.strip() if element else None
+        posts.append(fields)
+    return posts
+
+
+def baseline_select_text(html, selector):
+    """従来の処理（html.parserで全体を解析してからselect_one）"""
+    element = BeautifulSoup(html, 'html.parser').select_one(selector)
+    return element.text.strip() if element else None
+
+
+def load_fixtures():
+    """フィクスチャページと解析条件の一覧を読み込む"""
+    sites = {site['name']: site for site in TARGET_SITES}
+    fixtures = []
+    for site_name in sorted(os.listdir(FIXTURE_DIR)):
+        site = sites.get(site_name)
+        site_dir = os.path.join(FIXTURE_DIR, site_name)
+        if site is None or not os.path.isdir(site_dir):
+            continue
+        for file_name in sorted(os.listdir(site_dir)):
+            if not file_name.endswith('.html'):
+                continue
+            with open(os.path.join(site_dir, file_name), encoding='utf-8') as f:
+                fixtures.append((site, file_name, f.read()))
+    return fixtures
+
+
+def make_job(site):
+    """サイト設定から (解析関数, 引数) を作成"""
+    if site['type'] == 'element':
+        return 'select_text', (site['selector'],)
+
+    field_selectors = {'date': site['date_selector']}
+    if site['type'] == 'paging_bbs_gender':
+        field_selectors['gender'] = site['gender_selector']
+    else:
+        field_selectors['user_name'] = 'div.user-name'
+    return 'parse_posts', (POST_SELECTORS[site['type']], field_selectors)
+
+
+def run_backend(parse_functions, fixtures, repeat):
+    """全フィクスチャを指定回数解析し、(ページ/秒, 抽出結果) を返す"""
+    outputs = []
+    started = time.perf_counter()
+    for i in range(repeat):
+        for site, _, html in fixtures:
+            method, args = make_job(site)
+            result = parse_functions[method](html, *args)
+            if i == 0:
+                outputs.append(result)
+    elapsed = time.perf_counter() - started
+    return len(fixtures) * repeat / elapsed, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTML解析バックエンドのベンチマーク')
+    parser.add_argument('--repeat', type=int, default=50, help='各フィクスチャの解析回数')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"No fixture pages found in {FIXTURE_DIR}")
+        return 1
+    print(f"{len(fixtures)} fixture pages, repeat={args.repeat}\n")
+
+    baseline_rate, expected = run_backend(
+        {'select_text': baseline_select_text, 'parse_posts': baseline_parse},
+        fixtures, args.repeat
+    )
+    print(f"{'backend':<24}{'pages/sec':>12}{'speedup':>10}  identical")
+    print(f"{'baseline (html.parser)':<24}{baseline_rate:>12.1f}{1.0:>9.2f}x  -")
+
+    mismatched = False
+    for name in page_parser.available_backends():
+        backend = page_parser.get_backend(name)
+        rate, outputs = run_backend(
+            {'select_text': backend.select_text, 'parse_posts': backend.parse_posts},
+            fixtures, args.repeat
+        )
+        identical = outputs == expected
+        mismatched = mismatched or not identical
+        print(f"{name:<24}{rate:>12.1f}{rate / baseline_rate:>9.2f}x  {'yes' if identical else 'NO'}")
+        if not identical:
+            for (site, file_name, _), got, want in zip(fixtures, outputs, expected):
+                if got != want:
+                    print(f"    mismatch in {site['name']}/{file_name}")
+
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
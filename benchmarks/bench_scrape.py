@@ -0,0 +1,191 @@
+"""
+スクレイピング処理のベンチマーク
+スタブサーバーからフィクスチャページを返し、scrape_data と run_daily_batch について
+所要時間・取得ページ数・1ページあたりの解析時間・最大メモリ使用量を計測する
+結果の件数はフィクスチャから直接数えた件数と比較し、一致しない場合は終了コード1を返す
+
+使い方: python benchmarks/bench_scrape.py [--latency 0.2] [--jitter 0.1] [--error-rate 0.0]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+import db_manager
+import host_guard
+import http_client
+import page_parser
+from config import TARGET_SITES, JST
+from stub_server import StubServer, load_fixture_pages, rebase_dates, make_stub_sites
+
+
+def count_reference(pages, site, target_date):
+    """フィクスチャから直接数えた期待値 (合計, 男性, 女性, 不明)"""
+    if site['type'] == 'element':
+        element = BeautifulSoup(pages.get(f"/{site['name']}/page_0", ''), 'html.parser').select_one(site['selector'])
+        digits = ''.join(filter(str.isdigit, element.text)) if element else ''
+        return (int(digits) if digits else 0, 0, 0, 0)
+
+    target_str = target_date.strftime(site['date_format'])
+    post_selector = 'dl.contributor' if site['type'] == 'paging_bbs_gender' else 'table.layer_pop'
+    counts = [0, 0, 0, 0]
+    for page_num in range(site['start_page'], site['max_page'] + 1, site['step']):
+        html = pages.get(f"/{site['name']}/page_{page_num}")
+        if html is None:
+            break
+        for post in BeautifulSoup(html, 'html.parser').select(post_selector):
+            date_element = post.select_one(site['date_selector'])
+            if not date_element or target_str not in date_element.text:
+                continue
+            if site['name'] == '440':
+                user_name = post.select_one('div.user-name')
+                if user_name and '440' in user_name.text:
+                    continue
+            counts[0] += 1
+            if site['type'] == 'paging_bbs_gender':
+                gender = post.select_one(site['gender_selector'])
+                text = gender.text.strip() if gender else ''
+                if '男' in text or 'male' in text.lower():
+                    counts[1] += 1
+                elif '女' in text or 'female' in text.lower():
+                    counts[2] += 1
+                else:
+                    counts[3] += 1
+    return tuple(counts)
+
+
+class ParseTimer:
+    """解析バックエンドの処理時間を計測"""
+
+    def __init__(self):
+        self.backend = page_parser.get_backend()
+        self.calls = 0
+        self.seconds = 0.0
+        for name in ('parse_posts', 'select_text'):
+            setattr(self.backend, name, self._wrap(getattr(self.backend, name)))
+
+    def _wrap(self, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.calls += 1
+        return timed
+
+    def reset(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+
+def use_fresh_database(tmp_dir, label):
+    """シナリオごとに空のデータベースを使う"""
+    db_manager.DB_PATH = os.path.join(tmp_dir, f'{label}.db')
+    db_manager.init_db()
+
+
+def run_scenario(label, func, stub, timer):
+    """1シナリオを実行し、計測結果と各サイトの件数を返す"""
+    stub.reset_stats()
+    timer.reset()
+    http_before = http_client.get_http_stats()
+    tracemalloc.start()
+    started = time.perf_counter()
+    results = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    http_after = http_client.get_http_stats()
+
+    # バッチはSiteResult、キャッシュはAPIの形式（dict）で返す
+    results = [result.to_dict() if hasattr(result, 'to_dict') else result for result in results or []]
+    counts = {
+        result['site_name']: (
+            result.get('total_count'),
+            result.get('male_count'),
+            result.get('female_count'),
+            result.get('unknown_count')
+        )
+        for result in results
+    }
+    return {
+        'label': label,
+        'elapsed': elapsed,
+        'requests': stub.stats['requests'],
+        'downloaded': http_after['downloaded'] - http_before['downloaded'],
+        'not_modified': http_after['not_modified'] - http_before['not_modified'],
+        'parsed': timer.calls,
+        'parse_ms': timer.seconds * 1000 / timer.calls if timer.calls else 0.0,
+        'peak_kb': peak / 1024,
+        'counts': counts
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='スクレイピング処理のベンチマーク')
+    parser.add_argument('--latency', type=float, default=0.2, help='スタブサーバーの応答遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.1, help='遅延のランダムな揺らぎの上限（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='スタブサーバーが503を返す割合')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='ホストごとの流量制限（件/秒）。省略時は全サイトが同じスタブサーバーを使うため 設定値×サイト数')
+    args = parser.parse_args()
+
+    target_date = datetime.now(JST).date()
+    pages = rebase_dates(load_fixture_pages(), target_date)
+    stub = StubServer(pages, args.latency, args.jitter, args.error_rate, seed=1).start()
+    TARGET_SITES[:] = make_stub_sites(stub.base_url, TARGET_SITES)
+    rate_limit = args.rate_limit or host_guard.HTTP_RATE_LIMIT * len(TARGET_SITES)
+    host_guard.HTTP_RATE_LIMIT = host_guard.HTTP_RATE_BURST = rate_limit
+    host_guard.reset_host_guards()
+    expected = {site['name']: count_reference(pages, site, target_date) for site in TARGET_SITES}
+
+    tmp_dir = tempfile.mkdtemp(prefix='bbs_bench_')
+    db_manager.DB_PATH = os.path.join(tmp_dir, 'app.db')
+    import app
+    from daily_batch import run_daily_batch
+    timer = ParseTimer()
+
+    def scrape():
+        return app.scrape_data(force_run=True)['post_data']
+
+    def cold(label, func):
+        use_fresh_database(tmp_dir, label)
+        http_client.clear_conditional_cache()
+        return run_scenario(label, func, stub, timer)
+
+    reports = [
+        cold('scrape_data (cold)', scrape),
+        run_scenario('scrape_data (warm)', scrape, stub, timer),
+        cold('run_daily_batch (cold)', run_daily_batch),
+    ]
+
+    print(f"\nlatency={args.latency}s jitter={args.jitter}s error_rate={args.error_rate} "
+          f"parser={page_parser.get_backend().name}\n")
+    print(f"{'scenario':<24}{'seconds':>9}{'requests':>10}{'200':>6}{'304':>6}"
+          f"{'parsed':>8}{'ms/page':>9}{'peak KB':>10}  counts")
+    failed = False
+    for report in reports:
+        mismatched = [name for name, want in expected.items() if report['counts'].get(name) != want]
+        ok = not mismatched
+        failed = failed or (not ok and args.error_rate == 0)
+        print(f"{report['label']:<24}{report['elapsed']:>9.3f}{report['requests']:>10}"
+              f"{report['downloaded']:>6}{report['not_modified']:>6}{report['parsed']:>8}"
+              f"{report['parse_ms']:>9.2f}{report['peak_kb']:>10.0f}  "
+              f"{'identical' if ok else 'MISMATCH: ' + ', '.join(mismatched)}")
+
+    if failed:
+        for name, want in expected.items():
+            print(f"  expected {name}: {want}")
+    stub.stop()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+起動時間のベンチマーク
+モジュールごとに新しいPythonプロセスで import にかかる時間と、その時点で読み込まれた重いライブラリを計測する
+あわせて init_db（空のDB・スキーマが最新のDB）と create_app の所要時間を計測する（cron・サーバーレスのコールドスタートを想定）
+
+使い方: python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時に読み込まれていないことを確認するライブラリ
+HEAVY_MODULES = ('requests', 'bs4', 'lxml', 'selectolax', 'flask', 'apscheduler')
+
+# 計測するモジュール（バッチ・CLI・Webアプリの入口）
+TARGETS = ['daily_batch', 'site_registry', 'backfill', 'app']
+
+# 子プロセスで実行する計測処理（結果をJSONで標準出力に書く）
+MEASURE_IMPORT = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+MEASURE_STARTUP = '''
+import contextlib, io, json, sys, time
+sys.path.insert(0, {root!r})
+import db_manager
+db_manager.DB_PATH = {db_path!r}
+timings = {{}}
+with contextlib.redirect_stdout(io.StringIO()):
+    started = time.perf_counter()
+    db_manager.init_db()
+    timings['init_db'] = time.perf_counter() - started
+    import app
+    started = time.perf_counter()
+    app.create_app(with_scheduler=False)
+    timings['create_app'] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+
+def run_child(code):
+    """新しいPythonプロセスでコードを実行し、最後の行のJSONを返す"""
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_imports(repeat):
+    """モジュールごとの import の所要時間（中央値）と読み込まれた重いライブラリ"""
+    reports = []
+    for module in TARGETS:
+        runs = [
+            run_child(MEASURE_IMPORT.format(root=ROOT_DIR, module=module, heavy=HEAVY_MODULES))
+            for _ in range(repeat)
+        ]
+        reports.append({
+            'label': f'import {module}',
+            'ms': statistics.median(run['seconds'] for run in runs) * 1000,
+            'loaded': runs[-1]['loaded']
+        })
+    return reports
+
+
+def measure_startup(repeat):
+    """空のDBとスキーマが最新のDBでの init_db・create_app の所要時間（中央値）"""
+    timings = {'cold': [], 'warm': []}
+    for _ in range(repeat):
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bbs_bench_'), 'app.db')
+        for state in timings:
+            timings[state].append(run_child(MEASURE_STARTUP.format(root=ROOT_DIR, db_path=db_path)))
+    return [
+        {
+            'label': f'{step} ({state})',
+            'ms': statistics.median(run[step] for run in runs) * 1000,
+            'loaded': None
+        }
+        for state, runs in timings.items()
+        for step in ('init_db', 'create_app')
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='起動時間のベンチマーク')
+    parser.add_argument('--repeat', type=int, default=5, help='計測する回数（中央値を表示）')
+    args = parser.parse_args()
+
+    reports = measure_imports(args.repeat) + measure_startup(args.repeat)
+
+    print(f"\nrepeat={args.repeat} python={sys.version.split()[0]}\n")
+    print(f"{'step':<24}{'ms':>9}  heavy modules loaded")
+    for report in reports:
+        loaded = '' if report['loaded'] is None else ', '.join(report['loaded']) or '-'
+        print(f"{report['label']:<24}{report['ms']:>9.1f}  {loaded}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
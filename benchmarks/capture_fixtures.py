@@ -0,0 +1,78 @@
+"""
+実際の掲示板ページを取得してフィクスチャとして保存する
+対象はアプリと同じサイト設定（python site_registry.py set <site.json> で追加・更新したサイトを含む）
+保存先: benchmarks/fixtures/<サイト名>/page_<ページ番号>.html
+（リポジトリに含まれるフィクスチャは合成したページ。benchmarks/fixtures/README.md を参照）
+
+使い方: python benchmarks/capture_fixtures.py [--pages 3] [サイト名 ...]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import db_manager
+import site_registry
+from site_adapters import get_adapter
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 取得間隔（秒）。掲示板に負荷をかけないよう1ページずつ取得する
+CAPTURE_INTERVAL = 1.0
+
+
+def get_page_urls(site, pages):
+    """保存するページの (ページ番号, URL) の一覧"""
+    if site['type'] == 'element':
+        return [(0, site['url'])]
+
+    page_nums = range(site['start_page'], site['max_page'] + 1, site['step'])
+    return [
+        (page_num, site['base_url'] if page_num == site['start_page'] else f"{site['page_url_prefix']}{page_num}")
+        for page_num in list(page_nums)[:pages]
+    ]
+
+
+def capture_site(site, pages):
+    """1サイト分のページを保存"""
+    site_dir = os.path.join(FIXTURE_DIR, site['name'])
+    os.makedirs(site_dir, exist_ok=True)
+    # スクレイピング時と同じヘッダー（User-Agent）で取得する
+    headers = get_adapter(site).headers
+    for page_num, url in get_page_urls(site, pages):
+        response = requests.get(url, headers=headers, timeout=10)
+        response.raise_for_status()
+        path = os.path.join(site_dir, f'page_{page_num}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"  -> saved {path} ({len(response.content)} bytes)")
+        time.sleep(CAPTURE_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='掲示板ページをフィクスチャとして保存')
+    parser.add_argument('--pages', type=int, default=3, help='ページング型サイトで保存するページ数')
+    parser.add_argument('sites', nargs='*', help='保存するサイト名（省略時は全サイト）')
+    args = parser.parse_args()
+
+    db_manager.init_db()
+    sites = site_registry.get_sites()
+    unknown = set(args.sites) - {site['name'] for site in sites}
+    if unknown:
+        parser.error(f"不明なサイトです: {', '.join(sorted(unknown))}")
+
+    for site in sites:
+        if args.sites and site['name'] not in args.sites:
+            continue
+        print(f"Capturing '{site['display_name']}'...")
+        try:
+            capture_site(site, args.pages)
+        except requests.exceptions.RequestException as e:
+            print(f"  -> Error: {e}")
+
+
+if __name__ == '__main__':
+    main()
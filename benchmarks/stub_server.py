@@ -0,0 +1,188 @@
+"""
+保存済みのフィクスチャページを返すローカルのスタブHTTPサーバー
+実際の掲示板にアクセスせずにスクレイピング処理を計測・検証するために使用
+
+URLは /<サイト名>/page_<ページ番号> の形式で、benchmarks/fixtures/<サイト名>/page_<ページ番号>.html を返す
+フィクスチャの無いページは投稿の無い空のページとして返す
+
+使い方: python benchmarks/stub_server.py [--port 8000] [--latency 0.2] [--error-rate 0.1]
+"""
+import argparse
+import copy
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TARGET_SITES, JST
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+EMPTY_PAGE = b'<!DOCTYPE html>\n<html><body></body></html>\n'
+
+# フィクスチャ内の日付（YYYY/MM/DD）
+_DATE_PATTERN = re.compile(r'(\d{4})/(\d{2})/(\d{2})')
+
+
+def load_fixture_pages(fixture_dir=FIXTURE_DIR):
+    """フィクスチャページを {'/<サイト名>/page_<n>': 本文} の形式で読み込む"""
+    pages = {}
+    for site_name in sorted(os.listdir(fixture_dir)):
+        site_dir = os.path.join(fixture_dir, site_name)
+        if not os.path.isdir(site_dir):
+            continue
+        for file_name in sorted(os.listdir(site_dir)):
+            if file_name.endswith('.html'):
+                with open(os.path.join(site_dir, file_name), encoding='utf-8') as f:
+                    pages[f'/{site_name}/{file_name[:-5]}'] = f.read()
+    return pages
+
+
+def get_newest_fixture_date(pages):
+    """フィクスチャ内で最も新しい日付"""
+    dates = [
+        datetime(int(y), int(m), int(d)).date()
+        for html in pages.values()
+        for y, m, d in _DATE_PATTERN.findall(html)
+    ]
+    return max(dates) if dates else None
+
+
+def rebase_dates(pages, target_date):
+    """フィクスチャ内の最新の日付が target_date になるよう、全ての日付をずらす"""
+    newest = get_newest_fixture_date(pages)
+    if newest is None:
+        return dict(pages)
+    shift = target_date - newest
+
+    def replace(match):
+        day = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3))).date() + shift
+        return day.strftime('%Y/%m/%d')
+
+    return {path: _DATE_PATTERN.sub(replace, html) for path, html in pages.items()}
+
+
+class StubServer:
+    """フィクスチャページを返すスタブサーバー（遅延・エラーを設定可能）"""
+
+    def __init__(self, pages, latency=0.0, jitter=0.0, error_rate=0.0, port=0, seed=None):
+        self.pages = {path: html.encode('utf-8') for path, html in pages.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'ok': 0, 'not_modified': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def _count(self, key):
+        with self._lock:
+            self.stats['requests' if key is None else key] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                stub._count(None)
+                with stub._lock:
+                    delay = stub.latency + stub.random.uniform(0, stub.jitter)
+                    failed = stub.random.random() < stub.error_rate
+                if delay:
+                    time.sleep(delay)
+
+                if failed:
+                    stub._count('errors')
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                body = stub.pages.get(self.path.split('?')[0], EMPTY_PAGE)
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+                if self.headers.get('If-None-Match') == etag:
+                    stub._count('not_modified')
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                stub._count('ok')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='stub-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def make_stub_sites(base_url, sites=None):
+    """サイト設定のURLをスタブサーバーに向けたコピーを作成"""
+    stub_sites = []
+    for site in copy.deepcopy(TARGET_SITES if sites is None else sites):
+        prefix = f"{base_url}/{site['name']}/page_"
+        if site['type'] == 'element':
+            site['url'] = f'{prefix}0'
+        else:
+            site['base_url'] = f"{prefix}{site['start_page']}"
+            site['page_url_prefix'] = prefix
+        stub_sites.append(site)
+    return stub_sites
+
+
+def main():
+    parser = argparse.ArgumentParser(description='フィクスチャページを返すスタブHTTPサーバー')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='応答の遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='遅延に加えるランダムな揺らぎの上限（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='503を返す割合（0〜1）')
+    parser.add_argument('--keep-dates', action='store_true', help='フィクスチャの日付を今日にずらさない')
+    args = parser.parse_args()
+
+    pages = load_fixture_pages()
+    if not args.keep_dates:
+        pages = rebase_dates(pages, datetime.now(JST).date())
+    server = StubServer(pages, args.latency, args.jitter, args.error_rate, args.port).start()
+    print(f"Serving {len(pages)} fixture pages at {server.base_url}")
+    for site in make_stub_sites(server.base_url):
+        print(f"  {site['name']}: {site.get('url') or site['base_url']}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,7 +13,7 @@ JST = timezone(timedelta(hours=9))
 # 静的ファイルのベースURL
 BASE_URL_PLACEHOLDER = "/static"
 
-# 対象サイトの設定
+# 対象サイトの設定の初期値（DBの sites テーブルが空の場合に登録する。以降の変更は site_registry で行う）
 TARGET_SITES = [
     {
         'type': 'element',
@@ -34,6 +34,8 @@ TARGET_SITES = [
         'step': 1,
         'date_selector': 'div.user-meta',
         'date_format': '%Y/%m/%d',
+        # お店の書き込みは除く
+        'exclude': {'selector': 'div.user-name', 'contains': '440'},
         'image_url': BASE_URL_PLACEHOLDER + '/images/440.png'
     },
     {
@@ -90,10 +92,93 @@ TARGET_SITES = [
 
 # データベース設定
 DB_PATH = 'posts_data.db'
+DB_JOURNAL_MODE = 'WAL'  # 読み込みと書き込みが互いにブロックしない
+DB_SYNCHRONOUS = 'NORMAL'  # WALではコミットごとのfsyncを省略しても破損しない
+DB_BUSY_TIMEOUT = 5000  # ロック待ちの上限（ミリ秒）
+DB_CACHED_STATEMENTS = 128  # 接続ごとにキャッシュするプリペアドステートメント数
 
 # キャッシュ有効期限（秒）
-CACHE_EXPIRATION = 3600  # 1時間
+CACHE_EXPIRATION = 3600  # 1時間（サイト設定の 'cache_ttl' で個別に指定可能）
 
 # バッチ実行時刻
 BATCH_HOUR = 19  # 19時
-BATCH_MINUTE = 0
\ No newline at end of file
+BATCH_MINUTE = 0
+
+# 日中の書き込み数の推移の記録（スクレイピング結果を時系列で保存）
+INTRADAY_SAMPLING = True
+INTRADAY_RESOLUTION = 300  # 記録の間隔（秒）。同じ間隔内の結果は最新の値で上書き
+INTRADAY_RAW_RETENTION_DAYS = 14  # この日数を過ぎた記録は1時間単位に間引く
+INTRADAY_HOURLY_RETENTION_DAYS = 400  # この日数を過ぎた記録は削除
+
+# スクレイピング並列実行設定
+SCRAPE_MAX_WORKERS = 6  # 全体の同時実行数
+SCRAPE_PER_SITE_CONCURRENCY = 1  # 同一サイトへの同時スクレイピング数
+SCRAPE_DEADLINE = 30  # 全体の締め切り（秒）
+BATCH_SCRAPE_DEADLINE = 120  # バッチ実行時の締め切り（秒）
+
+# ワーカー間の排他（リース）の有効期限（秒）
+SCRAPE_LEASE_TTL = SCRAPE_DEADLINE + 30
+BATCH_LEASE_TTL = BATCH_SCRAPE_DEADLINE + 60
+
+# バッチのシャード分割（店舗が多い場合はホストごとにシャードに分け、プロセスを並列に実行する）
+BATCH_SHARD_SIZE = 50  # 1シャードあたりの店舗数の目安
+BATCH_MAX_PROCESSES = 4  # 店舗数から決めるシャード数（プロセス数）の上限
+BATCH_SHARD_STARTUP_GRACE = 30  # 子プロセスの起動を待つ猶予（秒、締め切りに加える）
+
+# 差分クロール設定（前回見た最新の投稿に達したら巡回を打ち切る）
+CRAWL_INCREMENTAL = True
+CRAWL_ANCHOR_SIZE = 3  # 既知の投稿の判定に使う先頭投稿の数
+
+# ページ送りの設定（指定日より古い投稿に達したら巡回を打ち切る。max_page は上限としてのみ使用）
+PAGINATION_ADAPTIVE = True  # サイト・曜日ごと（差分クロールは時間帯ごと）に取得したページ数を学習し、その分を先に並列取得する
+PAGINATION_PREFETCH_MAX = 5  # 先に並列取得するページ数の上限
+PAGINATION_PREFETCH_WORKERS = 4  # 並列取得に使うスレッド数（全サイト共通）
+PAGINATION_LEARNING_RATE = 0.3  # 学習したページ数の更新の重み（指数移動平均）
+
+# 過去の日付の取得（バックフィル）設定
+BACKFILL_MAX_PAGES = 100  # 1サイトあたりに巡回するページ数の上限
+BACKFILL_LEASE_TTL = 30 * 60  # 同時実行を防ぐリースの有効期限（秒）
+
+# HTML解析バックエンド（'auto' / 'selectolax' / 'lxml' / 'html.parser'）
+PARSER_BACKEND = 'auto'
+
+# 処理時間・件数の計測（/metrics で公開）
+METRICS_ENABLED = True
+
+# HTTP接続設定
+HTTP_TIMEOUT = 10  # 秒
+HTTP_CONNECT_TIMEOUT = 3  # 接続確立までの上限（秒）。応答の読み込みは HTTP_TIMEOUT まで待つ
+HTTP_POOL_CONNECTIONS = 4  # ホストごとに保持する接続プール数
+HTTP_POOL_MAXSIZE = 10  # 接続プールあたりの最大接続数
+HTTP_RETRY_TOTAL = 2  # 一時的なエラー時の再試行回数
+HTTP_RETRY_BACKOFF = 0.5  # 再試行間隔の係数（秒）
+HTTP_VALIDATOR_CACHE_SIZE = 300  # 条件付きGETのために検証子と前回の結果を保持するURLの数（古いものから破棄）
+
+# ホストごとの流量制限（トークンバケット）
+HTTP_RATE_LIMIT = 5  # 1秒あたりのリクエスト数
+HTTP_RATE_BURST = 5  # 連続して送れるリクエスト数
+
+# サーキットブレーカー（失敗が続いたホストへの取得を一時的に止め、前回の結果を返す）
+CIRCUIT_FAILURE_THRESHOLD = 2  # 連続してこの回数失敗したら止める
+CIRCUIT_RESET_TIMEOUT = 60  # 止めてから試行を再開するまでの秒数
+CIRCUIT_MAX_RESET_TIMEOUT = 600  # 試行に失敗し続けた場合の待ち時間の上限（秒）
+
+
+# ジョブキュー（手動のバッチ実行・強制更新をリクエストの外で実行する）
+JOB_POLL_INTERVAL = 5  # 待機中のジョブを確認する間隔（秒）
+JOB_TIMEOUT = 10 * 60  # 進捗がこの秒数更新されない実行中のジョブは失敗とみなす
+JOB_RETENTION_DAYS = 7  # 終了したジョブを残す日数
+
+# 巡回時に取得済みのページに載っている前日以前の投稿数で日次データを更新する
+DAILY_TOP_UP = True
+DAILY_TOP_UP_MAX_DAYS = 7  # 更新する過去の日数の上限
+
+# サイト設定の変更（DBのバージョン番号）を確認する間隔（秒）
+SITES_RELOAD_INTERVAL = 5
+
+# 書き込み数の分析（移動平均・曜日ごとの平常値からの外れ・男女比の推移。NumPyがあれば使う）
+ANALYTICS_HISTORY_DAYS = 120  # 分析に使う日次データの日数
+ANALYTICS_ROLLING_DAYS = 7  # 移動平均・男女比の推移に使う日数
+ANALYTICS_BASELINE_WEEKS = 8  # 曜日ごとの平常値に使う過去の同じ曜日の数
+ANALYTICS_MIN_SAMPLES = 4  # 平常値とみなすのに必要な過去の同じ曜日のデータ数
+ANALYTICS_ZSCORE_THRESHOLD = 2.0  # 平常値から標準偏差のこの倍数以上離れたら多い・少ないとみなす
\ No newline at end of file
@@ -1,62 +1,356 @@
 """
 毎日19時に実行されるバッチ処理
 各店舗の書き込み数を取得してDBに保存
+店舗が多い場合はホストごとにシャードに分けてプロセスプールで並列に取得し、結果をまとめて保存する
+
+使い方:
+  python daily_batch.py               全店舗（シャード数は店舗数から決める）
+  python daily_batch.py --shards 4    4シャードに分け、プロセスプールで並列に実行
+  python daily_batch.py --shard 0/4   4シャードのうち0番目のみを実行（ジョブを分けて実行する場合）
 """
+import argparse
+import json
+import math
+import multiprocessing
+import queue
+import time
+from urllib.parse import urlsplit
 import db_manager
-from config import TARGET_SITES
-from scraper_utils import (
-    get_jst_now,
-    get_post_count_from_element,
-    get_today_post_count_from_paging_site,
-    get_today_post_count_with_gender
+import metrics
+from config import (
+    BATCH_SCRAPE_DEADLINE,
+    BATCH_LEASE_TTL,
+    BATCH_SHARD_SIZE,
+    BATCH_MAX_PROCESSES,
+    BATCH_SHARD_STARTUP_GRACE,
+    INTRADAY_SAMPLING,
+    DAILY_TOP_UP
 )
+from scraper_utils import get_jst_now
+from site_registry import get_sites
+
+
+# バッチ実行の排他に使うリース名
+BATCH_LEASE_NAME = 'daily_batch'
+
+
+def get_site_host(site):
+    """サイトの取得先のホスト（流量制限・サーキットブレーカーと同じ単位）"""
+    return urlsplit(site.get('base_url') or site.get('url') or '').netloc
+
+
+def assign_hosts(sites, count):
+    """
+    ホストを count 個のシャードに振り分け、{ホスト: シャード番号} を返す
+    ホストを店舗数の多い順（同数ならホスト名順）に、その時点で店舗数が最も少ないシャード（同数なら番号の小さい方）へ割り当てる
+    サイト設定が同じなら常に同じ振り分けになるため、別々のプロセス（--shard i/n）で実行しても重ならない
+    """
+    host_sizes = {}
+    for site in sites:
+        host = get_site_host(site)
+        host_sizes[host] = host_sizes.get(host, 0) + 1
+    loads = [0] * count
+    assignment = {}
+    for host, size in sorted(host_sizes.items(), key=lambda item: (-item[1], item[0])):
+        shard = min(range(count), key=lambda index: (loads[index], index))
+        assignment[host] = shard
+        loads[shard] += size
+    return assignment
+
+
+def shard_sites(sites, index, count):
+    """
+    サイトを count 個のシャードに分け、index 番目のシャードのサイトを返す
+    同じホストのサイトは同じシャードにまとめ（ホストごとの流量制限をプロセス間で超えないように）、
+    各シャードの店舗数ができるだけ等しくなるようにする
+    """
+    assignment = assign_hosts(sites, count)
+    return [site for site in sites if assignment[get_site_host(site)] == index]
+
+
+def choose_shard_count(site_count):
+    """店舗数に応じたシャード数（1シャードあたり約 BATCH_SHARD_SIZE 店舗、最大 BATCH_MAX_PROCESSES）"""
+    return max(1, min(math.ceil(site_count / BATCH_SHARD_SIZE), BATCH_MAX_PROCESSES))
+
+
+def get_batch_lease_name(shard=None):
+    """バッチ実行の排他に使うリース名（シャードごとのバッチは 'daily_batch:i/n'）"""
+    return BATCH_LEASE_NAME if shard is None else f"{BATCH_LEASE_NAME}:{shard[0]}/{shard[1]}"
+
+
+def find_conflicting_batches(shard=None):
+    """
+    実行中の他のバッチのうち、同じホストを同時に取得する可能性があるもののリース名を返す
+    全店舗のバッチは全てのシャードと、シャードは全店舗のバッチ・シャード数の異なるシャードと重なる
+    """
+    own = get_batch_lease_name(shard)
+    conflicts = []
+    for name in db_manager.get_held_leases(BATCH_LEASE_NAME):
+        if name == own or not (name == BATCH_LEASE_NAME or name.startswith(f"{BATCH_LEASE_NAME}:")):
+            continue
+        if shard is not None and name != BATCH_LEASE_NAME and parse_shard(name.split(':', 1)[1])[1] == shard[1]:
+            continue
+        conflicts.append(name)
+    return conflicts
+
 
+def parse_shard(text):
+    """'i/n' 形式のシャード指定を (i, n) に変換"""
+    try:
+        index, count = (int(value) for value in text.split('/'))
+    except ValueError:
+        raise ValueError(f"シャードは i/n 形式で指定してください: {text}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"不正なシャード指定です: {text}")
+    return index, count
+
+
+def scrape_shard(label, sites, target_date, on_result=None, collect_metrics=False):
+    """1シャード分のサイトを取得し、結果と所要時間をまとめて返す"""
+    # スクレイパー（requests・BeautifulSoup）は取得するプロセスでのみ読み込む
+    from scrape_engine import scrape_sites
+
+    started = time.perf_counter()
+    before = metrics.snapshot() if collect_metrics else None
+    results = []
+    for data in scrape_sites(sites, target_date=target_date, deadline=BATCH_SCRAPE_DEADLINE):
+        if on_result is not None:
+            on_result(data)
+        results.append(data)
+    return {
+        'shard': label,
+        'sites': len(sites),
+        'errors': sum(1 for data in results if data.error),
+        'seconds': round(time.perf_counter() - started, 3),
+        'results': results,
+        'metrics': metrics.summarize(before, metrics.snapshot()) if collect_metrics else None
+    }
+
+
+def _init_shard_process(db_path):
+    """シャードを実行する子プロセスの初期化（親プロセスと同じDBを使う）"""
+    db_manager.DB_PATH = db_path
+
+
+def _scrape_shard_in_process(label, sites, target_date):
+    return scrape_shard(label, sites, target_date, collect_metrics=True)
+
+
+def _scrape_shards_in_processes(shards, target_date, on_result=None):
+    """
+    シャードごとに子プロセスで並列に取得し、終わったシャードから報告を集める
+    締め切り（と起動の猶予）までに終わらなかったシャードのサイトはタイムアウトとして扱い、子プロセスを止める
+    """
+    reports = []
+    started = time.perf_counter()
+    deadline = time.monotonic() + BATCH_SCRAPE_DEADLINE + BATCH_SHARD_STARTUP_GRACE
+    # 終わったシャードの (ラベル, 報告, 例外) が届く
+    finished = queue.Queue()
+    pending = dict(shards)
+
+    def failed_report(label, sites, message):
+        from site_adapters import build_error_result
+
+        return {
+            'shard': label,
+            'sites': len(sites),
+            'errors': len(sites),
+            'seconds': round(time.perf_counter() - started, 3),
+            'results': [build_error_result(site, message) for site in sites],
+            'metrics': None
+        }
+
+    def add_report(report):
+        if on_result is not None:
+            for data in report['results']:
+                on_result(data)
+        reports.append(report)
+
+    # スケジューラー等のスレッドが動いているプロセスからも安全に起動できるよう spawn を使う
+    pool = multiprocessing.get_context('spawn').Pool(
+        processes=len(shards),
+        initializer=_init_shard_process,
+        initargs=(db_manager.DB_PATH,)
+    )
+    try:
+        for label, sites in shards:
+            pool.apply_async(
+                _scrape_shard_in_process,
+                (label, sites, target_date),
+                callback=lambda report, label=label: finished.put((label, report, None)),
+                error_callback=lambda error, label=label: finished.put((label, None, error))
+            )
 
-def run_daily_batch():
-    """毎日のバッチ処理を実行"""
+        while pending:
+            try:
+                label, report, error = finished.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            sites = pending.pop(label)
+            if error is not None:
+                print(f"✗ Shard {label} failed: {error}")
+                report = failed_report(label, sites, '処理エラー')
+            add_report(report)
+
+        for label, sites in pending.items():
+            print(f"✗ Timed out waiting for shard {label}")
+            add_report(failed_report(label, sites, 'タイムアウト'))
+    finally:
+        # 終わらない子プロセスは待たずに止める
+        if pending:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+    return reports
+
+
+def _merge_shard_metrics(summary, reports):
+    """子プロセスで計測したシャードごとの計測値をバッチ全体の計測値に加える"""
+    for report in reports:
+        shard_summary = report.get('metrics')
+        if not shard_summary:
+            continue
+        for site, values in shard_summary['sites'].items():
+            summary['sites'].setdefault(site, {}).update(values)
+        for field, value in shard_summary['other'].items():
+            summary['other'][field] = round(summary['other'].get(field, 0) + value, 4)
+
+
+def run_daily_batch(on_result=None, shards=None, shard=None):
+    """
+    毎日のバッチ処理を実行
+    他のワーカー・プロセスが実行中の場合は何もせずにNoneを返す
+    on_result を指定すると、サイトごとの取得結果（SiteResult）を取得でき次第渡す
+    shards: シャード数（省略時は店舗数から決める。2以上の場合はプロセスプールで並列に取得する）
+    shard: (index, count) を指定すると、そのシャードのみをこのプロセスで実行して保存する
+    """
+    # データベース初期化
+    db_manager.init_db()
+
+    lease_name = get_batch_lease_name(shard)
+    owner = db_manager.make_lease_owner()
+    if not db_manager.acquire_lease(lease_name, owner, BATCH_LEASE_TTL):
+        print("Daily batch is already running in another worker. Skipping.")
+        return None
+    # 全店舗のバッチとシャードごとのバッチが同じホストを同時に取得しないよう、リースを取得してから重なりを確認する
+    # （同時に開始した場合はどちらかが必ず相手のリースを見つける）
+    conflicts = find_conflicting_batches(shard)
+    if conflicts:
+        db_manager.release_lease(lease_name, owner)
+        print(f"Daily batch is already running in another worker ({', '.join(conflicts)}). Skipping.")
+        return None
+
+    started_at = get_jst_now()
+    before = metrics.snapshot()
+    reports = []
+    try:
+        return _run_daily_batch(on_result, shards, shard, reports)
+    finally:
+        # 実行中の計測値の差分をサイトごとにまとめて保存
+        summary = metrics.summarize(before, metrics.snapshot())
+        _merge_shard_metrics(summary, reports)
+        summary['shards'] = [
+            {key: report[key] for key in ('shard', 'sites', 'errors', 'seconds')}
+            for report in reports
+        ]
+        try:
+            db_manager.save_batch_run(started_at, get_jst_now(), summary)
+        except Exception as e:
+            print(f"✗ Error saving batch metrics: {e}")
+        print(f"Batch metrics: {json.dumps(summary, ensure_ascii=False, sort_keys=True)}")
+        db_manager.release_lease(lease_name, owner)
+
+
+def _run_daily_batch(on_result=None, shards=None, shard=None, reports=None):
+    """バッチ処理の本体（reports にシャードごとの報告を追加する）"""
     print(f"\n{'='*50}")
     print(f"Daily Batch Started at {get_jst_now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*50}\n")
-    
-    # データベース初期化
-    db_manager.init_db()
-    
+
     # 今日の日付（JST）
-    today = get_jst_now().strftime('%Y-%m-%d')
-    today_formatted = get_jst_now().strftime('%Y/%m/%d')
-    
+    target_date = get_jst_now().date()
+    today = target_date.strftime('%Y-%m-%d')
+    reports = [] if reports is None else reports
+
+    sites = get_sites()
+    if shard is not None:
+        index, count = shard
+        groups = [(f'{index}/{count}', shard_sites(sites, index, count))]
+    else:
+        count = shards or choose_shard_count(len(sites))
+        groups = [(f'{index}/{count}', shard_sites(sites, index, count)) for index in range(count)]
+        groups = [(label, group) for label, group in groups if group]
+
+    if len(groups) > 1:
+        reports.extend(_scrape_shards_in_processes(groups, target_date, on_result))
+    elif groups:
+        label, group = groups[0]
+        reports.append(scrape_shard(label, group, target_date, on_result))
+
+    for report in sorted(reports, key=lambda report: report['shard']):
+        print(f"Shard {report['shard']}: {report['sites']} sites in {report['seconds']:.2f}s "
+              f"({report['errors']} errors)")
+
+    # サイトの並び順に戻す
+    order = {site['name']: position for position, site in enumerate(sites)}
     results = []
-    
-    for site in TARGET_SITES:
-        try:
-            if site['type'] == 'element':
-                data = get_post_count_from_element(site)
-            elif site['type'] == 'paging_bbs':
-                data = get_today_post_count_from_paging_site(site, today_formatted)
-            elif site['type'] == 'paging_bbs_gender':
-                data = get_today_post_count_with_gender(site, today_formatted)
-            
-            # DBに保存
-            db_manager.save_daily_data(
-                site_name=data['site_name'],
-                record_date=today,
-                total_count=data['total_count'],
-                male_count=data['male_count'],
-                female_count=data['female_count'],
-                unknown_count=data['unknown_count']
-            )
-            
-            results.append(data)
-            print(f"✓ {data['site_name']}: {data['total_count']}件")
-            
-        except Exception as e:
-            print(f"✗ Error processing {site['display_name']}: {e}")
-    
+    for data in sorted(
+        (data for report in reports for data in report['results']),
+        key=lambda data: order.get(data.site_name, len(order))
+    ):
+        if data.error:
+            print(f"✗ Error processing {data.display_name}: {data.error}")
+            continue
+        results.append(data)
+
+    # DBに1トランザクションでまとめて保存
+    try:
+        db_manager.save_daily_data_many([
+            {
+                'site_name': data.site_name,
+                'record_date': today,
+                'total_count': data.total_count,
+                'male_count': data.male_count,
+                'female_count': data.female_count,
+                'unknown_count': data.unknown_count
+            }
+            for data in results
+        ])
+        if INTRADAY_SAMPLING:
+            db_manager.record_intraday_samples(results)
+        if DAILY_TOP_UP:
+            # 前回のバッチ以降に増えた前日以前の投稿を反映
+            db_manager.top_up_daily_data(results)
+        for data in results:
+            print(f"✓ {data.site_name}: {data.total_count}件")
+    except Exception as e:
+        print(f"✗ Error saving daily data: {e}")
+        raise
+
     print(f"\n{'='*50}")
     print(f"Daily Batch Completed")
     print(f"{'='*50}\n")
-    
+
     return results
 
+
+def main():
+    parser = argparse.ArgumentParser(description='各店舗の書き込み数を取得してDBに保存')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--shards', type=int, help='シャード数（プロセスプールで並列に実行、省略時は店舗数から決める）')
+    group.add_argument('--shard', help='このプロセスで実行するシャード（i/n、例: 0/4）')
+    args = parser.parse_args()
+
+    if args.shards is not None and args.shards < 1:
+        parser.error('--shards は1以上を指定してください')
+    try:
+        shard = parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+    if run_daily_batch(shards=args.shards, shard=shard) is None:
+        raise SystemExit(1)
+
+
 if __name__ == '__main__':
-    run_daily_batch()
\ No newline at end of file
+    main()
@@ -1,26 +1,113 @@
+import json
+import os
+import socket
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 from contextlib import contextmanager
-from config import DB_PATH, JST
+import metrics
+from site_result import SiteResult
+from config import (
+    DB_PATH,
+    JST,
+    TARGET_SITES,
+    INTRADAY_RESOLUTION,
+    INTRADAY_RAW_RETENTION_DAYS,
+    INTRADAY_HOURLY_RETENTION_DAYS,
+    DB_JOURNAL_MODE,
+    DB_SYNCHRONOUS,
+    DB_BUSY_TIMEOUT,
+    DB_CACHED_STATEMENTS
+)
+
+# スレッドごとに使い回す接続
+_local = threading.local()
+
+def _open_connection():
+    """プラグマを設定した接続を作成"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT / 1000,
+        cached_statements=DB_CACHED_STATEMENTS
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+    return conn
+
+def get_thread_connection():
+    """現在のスレッドの接続を取得（fork後やDB_PATH変更時は作り直す）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != DB_PATH:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+        _local.depth = 0
+    return conn
+
+def close_thread_connection():
+    """現在のスレッドの接続を閉じる"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
 
 @contextmanager
 def get_db_connection():
-    """データベース接続のコンテキストマネージャー"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    データベース接続のコンテキストマネージャー
+    接続はスレッドごとに使い回し、最も外側のブロックの終了時にコミットする
+    """
+    conn = get_thread_connection()
+    _local.depth += 1
     try:
         yield conn
-        conn.commit()
+        if _local.depth == 1:
+            conn.commit()
     except Exception as e:
-        conn.rollback()
+        if _local.depth == 1:
+            conn.rollback()
         raise e
     finally:
-        conn.close()
+        _local.depth -= 1
+
+# スキーマのバージョン（PRAGMA user_version に保存。テーブル・インデックスを変更したら上げる）
+SCHEMA_VERSION = 4
 
+# このプロセスでスキーマを確認済みのDBのパス
+_schema_checked_path = None
+
+def get_schema_version():
+    """DBに保存されたスキーマのバージョン（未作成のDBは0）"""
+    with get_db_connection() as conn:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+@metrics.timed('db_query_seconds')
 def init_db():
-    """データベースを初期化"""
+    """
+    データベースを初期化
+    スキーマのバージョンが最新であれば何もしない（プロセスごとにも1度だけ確認する）
+    """
+    global _schema_checked_path
+    if _schema_checked_path == DB_PATH:
+        return
+    if get_schema_version() < SCHEMA_VERSION:
+        _create_schema()
+    _schema_checked_path = DB_PATH
+
+def _create_schema():
+    """テーブルを作成し、初期データの登録・集計の作成を行ってスキーマのバージョンを更新"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        # 他のプロセスが先に作成していれば何もしない
+        cursor.execute('PRAGMA user_version')
+        if cursor.fetchone()[0] >= SCHEMA_VERSION:
+            return
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS daily_posts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,12 +129,198 @@ def init_db():
             CREATE INDEX IF NOT EXISTS idx_record_date 
             ON daily_posts(record_date)
         ''')
-        print("Database initialized successfully")
+        # バージョン1・2のETag用のインデックス（日次データのバージョン番号に置き換えたため不要）
+        cursor.execute('DROP INDEX IF EXISTS idx_created_at')
+        for table in ROLLUP_TABLES:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    site_name VARCHAR(100) NOT NULL,
+                    period_start DATE NOT NULL,
+                    days INTEGER NOT NULL,
+                    total_count INTEGER NOT NULL,
+                    male_count INTEGER DEFAULT 0,
+                    female_count INTEGER DEFAULT 0,
+                    unknown_count INTEGER DEFAULT 0,
+                    avg_count REAL,
+                    PRIMARY KEY (site_name, period_start)
+                )
+            ''')
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_{table}_period 
+                ON {table}(period_start)
+            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS weekday_profile (
+                site_name VARCHAR(100) NOT NULL,
+                weekday INTEGER NOT NULL,
+                days INTEGER NOT NULL,
+                total_count INTEGER NOT NULL,
+                PRIMARY KEY (site_name, weekday)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS intraday_samples (
+                site_name VARCHAR(100) NOT NULL,
+                bucket INTEGER NOT NULL,
+                resolution INTEGER NOT NULL,
+                total_count INTEGER NOT NULL,
+                male_count INTEGER DEFAULT 0,
+                female_count INTEGER DEFAULT 0,
+                unknown_count INTEGER DEFAULT 0,
+                PRIMARY KEY (site_name, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_state (
+                site_name VARCHAR(100) PRIMARY KEY,
+                target_date VARCHAR(20) NOT NULL,
+                newest_keys TEXT NOT NULL,
+                total_count INTEGER NOT NULL,
+                male_count INTEGER DEFAULT 0,
+                female_count INTEGER DEFAULT 0,
+                unknown_count INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+                site_name VARCHAR(100) NOT NULL,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (site_name, start_date, end_date)
+            )
+        ''')
+        # バージョン3までのページ数の学習結果は時間帯の区別が無いため作り直す（主キーが変わる）
+        cursor.execute('PRAGMA table_info(page_stats)')
+        page_stats_columns = {row['name'] for row in cursor.fetchall()}
+        if page_stats_columns and 'slot' not in page_stats_columns:
+            cursor.execute('DROP TABLE page_stats')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS page_stats (
+                site_name VARCHAR(100) NOT NULL,
+                weekday INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                avg_pages REAL NOT NULL,
+                max_pages INTEGER NOT NULL,
+                PRIMARY KEY (site_name, weekday, slot)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_cache (
+                site_name VARCHAR(100) PRIMARY KEY,
+                result TEXT NOT NULL,
+                updated_at VARCHAR(40) NOT NULL,
+                checked_at VARCHAR(40) NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name VARCHAR(100) PRIMARY KEY,
+                owner VARCHAR(200) NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS batch_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at VARCHAR(40) NOT NULL,
+                finished_at VARCHAR(40) NOT NULL,
+                summary TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind VARCHAR(50) NOT NULL,
+                params TEXT NOT NULL DEFAULT '{}',
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                progress TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                error TEXT,
+                owner VARCHAR(200),
+                created_at VARCHAR(40) NOT NULL,
+                started_at VARCHAR(40),
+                finished_at VARCHAR(40),
+                heartbeat REAL NOT NULL
+            )
+        ''')
+        # バージョン1のDBにはジョブの引数の列が無い
+        cursor.execute('PRAGMA table_info(jobs)')
+        if 'params' not in {row['name'] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE jobs ADD COLUMN params TEXT NOT NULL DEFAULT '{}'")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status 
+            ON jobs(status, kind)
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sites (
+                name VARCHAR(100) PRIMARY KEY,
+                position INTEGER NOT NULL,
+                definition TEXT NOT NULL,
+                updated_at VARCHAR(40) NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS config_versions (
+                name VARCHAR(50) PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+
+        # サイト設定が一度も保存されていなければ config.TARGET_SITES を初期値として登録
+        seed_sites(TARGET_SITES)
+
+        # 集計テーブル導入前のデータがあれば集計を作成
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM daily_posts), EXISTS(SELECT 1 FROM weekly_posts)')
+        has_daily, has_rollups = cursor.fetchone()
+        if has_daily and not has_rollups:
+            rebuild_rollups()
+
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        print(f"Database initialized successfully (schema version {SCHEMA_VERSION})")
+
+def _week_start(day):
+    """dayを含む週（月曜始まり）の開始日"""
+    return day - timedelta(days=day.weekday())
+
+def _month_start(day):
+    """dayを含む月の開始日"""
+    return day.replace(day=1)
+
+def _next_month_start(day):
+    """dayの翌月の開始日"""
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+# 集計テーブル: テーブル名 -> (期間の開始日を求める関数, 次の期間の開始日を求める関数)
+ROLLUP_TABLES = {
+    'weekly_posts': (_week_start, lambda start: start + timedelta(days=7)),
+    'monthly_posts': (_month_start, _next_month_start),
+}
+
+def _refresh_rollup(cursor, table, site_name, period_start, period_end):
+    """1サイト・1期間分の集計行を日次データから作り直す"""
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO {table}
+        (site_name, period_start, days, total_count, male_count, female_count, unknown_count, avg_count)
+        SELECT site_name, ?, COUNT(*), SUM(total_count), SUM(male_count), SUM(female_count), SUM(unknown_count), AVG(total_count)
+        FROM daily_posts 
+        WHERE site_name = ? AND record_date >= ? AND record_date < ?
+        GROUP BY site_name
+    ''', (period_start.isoformat(), site_name, period_start.isoformat(), period_end.isoformat()))
+
+def _upsert_daily_rows(cursor, rows):
+    """日次データを保存し、週次・月次・曜日別の集計を差分更新する"""
+    periods = set()
+    for row in rows:
+        cursor.execute('''
+            SELECT total_count FROM daily_posts 
+            WHERE site_name = ? AND record_date = ?
+        ''', (row['site_name'], row['record_date']))
+        previous = cursor.fetchone()
 
-def save_daily_data(site_name, record_date, total_count, male_count=0, female_count=0, unknown_count=0):
-    """日次データを保存（既存データは上書き）"""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO daily_posts 
             (site_name, record_date, total_count, male_count, female_count, unknown_count)
@@ -59,9 +332,142 @@ def save_daily_data(site_name, record_date, total_count, male_count=0, female_co
                 female_count = excluded.female_count,
                 unknown_count = excluded.unknown_count,
                 created_at = CURRENT_TIMESTAMP
-        ''', (site_name, record_date, total_count, male_count, female_count, unknown_count))
+        ''', (
+            row['site_name'],
+            row['record_date'],
+            row['total_count'],
+            row.get('male_count', 0),
+            row.get('female_count', 0),
+            row.get('unknown_count', 0)
+        ))
+
+        # 曜日別の集計は前回値との差分で更新
+        day = datetime.strptime(row['record_date'], '%Y-%m-%d').date()
+        cursor.execute('''
+            INSERT INTO weekday_profile (site_name, weekday, days, total_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(site_name, weekday) 
+            DO UPDATE SET 
+                days = days + excluded.days,
+                total_count = total_count + excluded.total_count
+        ''', (
+            row['site_name'],
+            day.weekday(),
+            0 if previous else 1,
+            row['total_count'] - (previous['total_count'] if previous else 0)
+        ))
+
+        for table, (period_start, _) in ROLLUP_TABLES.items():
+            periods.add((table, row['site_name'], period_start(day)))
+
+    # 週次・月次の集計は影響を受けた期間だけ作り直す
+    for table, site_name, start in periods:
+        _refresh_rollup(cursor, table, site_name, start, ROLLUP_TABLES[table][1](start))
+
+    # 日次データを使う分析結果のキャッシュを無効にする
+    if rows:
+        _bump_config_version(cursor, DAILY_DATA_VERSION_NAME)
+
+@metrics.timed('db_query_seconds')
+def rebuild_rollups():
+    """全ての集計テーブルを日次データから作り直す"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM weekday_profile')
+        for table in ROLLUP_TABLES:
+            cursor.execute(f'DELETE FROM {table}')
+
+        cursor.execute('SELECT site_name, record_date, total_count FROM daily_posts')
+        periods = set()
+        profile = {}
+        for row in cursor.fetchall():
+            day = datetime.strptime(row['record_date'], '%Y-%m-%d').date()
+            key = (row['site_name'], day.weekday())
+            days, total = profile.get(key, (0, 0))
+            profile[key] = (days + 1, total + row['total_count'])
+            for table, (period_start, _) in ROLLUP_TABLES.items():
+                periods.add((table, row['site_name'], period_start(day)))
+
+        cursor.executemany('''
+            INSERT INTO weekday_profile (site_name, weekday, days, total_count)
+            VALUES (?, ?, ?, ?)
+        ''', [(site_name, weekday, days, total) for (site_name, weekday), (days, total) in profile.items()])
+        for table, site_name, start in periods:
+            _refresh_rollup(cursor, table, site_name, start, ROLLUP_TABLES[table][1](start))
+        print(f"Rebuilt rollups for {len(periods)} periods")
+
+@metrics.timed('db_query_seconds')
+def save_daily_data(site_name, record_date, total_count, male_count=0, female_count=0, unknown_count=0):
+    """日次データを保存（既存データは上書き）"""
+    with get_db_connection() as conn:
+        _upsert_daily_rows(conn.cursor(), [{
+            'site_name': site_name,
+            'record_date': record_date,
+            'total_count': total_count,
+            'male_count': male_count,
+            'female_count': female_count,
+            'unknown_count': unknown_count
+        }])
         print(f"Saved data for {site_name} on {record_date}")
 
+@metrics.timed('db_query_seconds')
+def save_daily_data_many(rows):
+    """複数サイトの日次データを1トランザクションでまとめて保存（既存データは上書き）"""
+    with get_db_connection() as conn:
+        _upsert_daily_rows(conn.cursor(), rows)
+        print(f"Saved {len(rows)} daily rows")
+
+@metrics.timed('db_query_seconds')
+def top_up_daily_data(results):
+    """
+    巡回で数え終えた前日以前の件数（SiteResult.day_counts）で日次データを更新
+    件数が変わった日・データが無かった日のみ保存し、更新した行数を返す
+    """
+    rows = [
+        {
+            'site_name': result.site_name,
+            'record_date': day.isoformat(),
+            'total_count': total,
+            'male_count': male,
+            'female_count': female,
+            'unknown_count': unknown
+        }
+        for result in results
+        if result.day_counts
+        for day, (total, male, female, unknown) in result.day_counts.items()
+    ]
+    if not rows:
+        return 0
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        changed = []
+        for row in rows:
+            cursor.execute('''
+                SELECT total_count, male_count, female_count, unknown_count FROM daily_posts 
+                WHERE site_name = ? AND record_date = ?
+            ''', (row['site_name'], row['record_date']))
+            existing = cursor.fetchone()
+            if existing is None or tuple(existing) != (
+                row['total_count'], row['male_count'], row['female_count'], row['unknown_count']
+            ):
+                changed.append(row)
+        if changed:
+            _upsert_daily_rows(cursor, changed)
+            print(f"Topped up {len(changed)} daily rows")
+        return len(changed)
+
+@metrics.timed('db_query_seconds')
+def get_recorded_dates(site_name, start_date, end_date):
+    """期間内でデータが保存済みの日付（YYYY-MM-DD）の集合"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT record_date FROM daily_posts 
+            WHERE site_name = ? AND record_date BETWEEN ? AND ?
+        ''', (site_name, start_date, end_date))
+        return {row['record_date'] for row in cursor.fetchall()}
+
+@metrics.timed('db_query_seconds')
 def get_data_by_date(site_name, target_date):
     """特定の日付のデータを取得"""
     with get_db_connection() as conn:
@@ -73,59 +479,696 @@ def get_data_by_date(site_name, target_date):
         row = cursor.fetchone()
         return dict(row) if row else None
 
-def get_comparison_data(site_name, current_date):
-    """前日と前週同曜日のデータを取得"""
-    current = datetime.strptime(current_date, '%Y-%m-%d')
-    yesterday = (current - timedelta(days=1)).strftime('%Y-%m-%d')
-    last_week = (current - timedelta(days=7)).strftime('%Y-%m-%d')
-    
+@metrics.timed('db_query_seconds')
+def get_latest_daily_data(site_name):
+    """サイトの最新の日次データを取得"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        
-        # 前日のデータ
         cursor.execute('''
             SELECT * FROM daily_posts 
-            WHERE site_name = ? AND record_date = ?
-        ''', (site_name, yesterday))
-        yesterday_data = cursor.fetchone()
-        
-        # 前週同曜日のデータ
+            WHERE site_name = ? 
+            ORDER BY record_date DESC LIMIT 1
+        ''', (site_name,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+# 日次データを保存するたびに進めるバージョン番号の名前（config_versions テーブル）
+DAILY_DATA_VERSION_NAME = 'daily_posts'
+
+@metrics.timed('db_query_seconds')
+def get_daily_data_version():
+    """
+    日次データの書き込み回数（保存のたびに1つ進む。他のワーカーの書き込みも反映される）
+    APIのETagと分析結果のキャッシュに使う
+    """
+    return get_config_version(DAILY_DATA_VERSION_NAME)
+
+@metrics.timed('db_query_seconds')
+def get_daily_data_range(start_date, end_date):
+    """期間内の全サイトの日次データをサイト名・日付順に取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute('''
+            SELECT site_name, record_date, total_count, male_count, female_count 
+            FROM daily_posts 
+            WHERE record_date BETWEEN ? AND ?
+            ORDER BY site_name, record_date
+        ''', (start_date, end_date))
+        return [dict(row) for row in cursor.fetchall()]
+
+# 比較対象日の名前付き指定（当日からの日数）
+COMPARISON_OFFSETS = {
+    'yesterday': 1,
+    'last_week': 7,
+    'last_month': 28,    # 4週間前の同曜日
+    'last_year': 364,    # 52週間前の同曜日
+}
+
+def resolve_comparison_offsets(names):
+    """比較対象日の指定（名前または日数）を {キー: 日数} に変換"""
+    offsets = {}
+    for name in names:
+        name = str(name).strip()
+        if name in COMPARISON_OFFSETS:
+            offsets[name] = COMPARISON_OFFSETS[name]
+        elif name.isdigit() and int(name) > 0:
+            offsets[f"{int(name)}_days_ago"] = int(name)
+        else:
+            raise ValueError(f"Unknown comparison offset: {name}")
+    return offsets
+
+@metrics.timed('db_query_seconds')
+def get_comparison_rows(current_date, offsets=None):
+    """
+    全サイトの当日と比較対象日のデータを1回のクエリで取得
+    戻り値: {site_name: {'today': 行, <比較キー>: 行, ...}}（データが無い日はNone）
+    """
+    if offsets is None:
+        offsets = {'yesterday': 1, 'last_week': 7}
+    current = datetime.strptime(current_date, '%Y-%m-%d')
+    date_keys = {current_date: ['today']}
+    for key, days in offsets.items():
+        date_keys.setdefault((current - timedelta(days=days)).strftime('%Y-%m-%d'), []).append(key)
+
+    placeholders = ', '.join('?' for _ in date_keys)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
             SELECT * FROM daily_posts 
-            WHERE site_name = ? AND record_date = ?
-        ''', (site_name, last_week))
-        last_week_data = cursor.fetchone()
-        
+            WHERE record_date IN ({placeholders})
+        ''', list(date_keys))
+        rows = cursor.fetchall()
+
+    result = {}
+    for row in rows:
+        site = result.setdefault(row['site_name'], dict.fromkeys(['today', *offsets]))
+        for key in date_keys[row['record_date']]:
+            site[key] = dict(row)
+    return result
+
+# 履歴APIの期間に応じた粒度（日数の上限 -> 粒度）
+HISTORY_GRANULARITIES = [
+    (92, 'daily'),
+    (731, 'weekly'),
+    (None, 'monthly'),
+]
+HISTORY_SOURCES = {
+    'daily': ('daily_posts', 'record_date'),
+    'weekly': ('weekly_posts', 'period_start'),
+    'monthly': ('monthly_posts', 'period_start'),
+}
+
+def choose_history_granularity(days):
+    """期間の長さから履歴の粒度を決める"""
+    for max_days, granularity in HISTORY_GRANULARITIES:
+        if max_days is None or days <= max_days:
+            return granularity
+
+@metrics.timed('db_query_seconds')
+def get_history(site_name, days=7, granularity='auto', page=1, per_page=100, end_date=None):
+    """
+    履歴データを期間に応じた粒度（日次・週次・月次）でページ単位に取得
+    site_name に 'all' を指定すると全サイトの合計を返す
+    """
+    if granularity == 'auto':
+        granularity = choose_history_granularity(days)
+    if granularity not in HISTORY_SOURCES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    table, date_column = HISTORY_SOURCES[granularity]
+
+    end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else datetime.now(JST).date()
+    start = end - timedelta(days=days - 1)
+    if granularity == 'weekly':
+        start = _week_start(start)
+    elif granularity == 'monthly':
+        start = _month_start(start)
+
+    if site_name == 'all':
+        columns = f'''
+            'all' AS site_name, {date_column} AS date, SUM(total_count) AS total_count,
+            SUM(male_count) AS male_count, SUM(female_count) AS female_count, SUM(unknown_count) AS unknown_count
+        '''
+        where = f'{date_column} BETWEEN ? AND ?'
+        params = [start.isoformat(), end.isoformat()]
+        group_by = f'GROUP BY {date_column}'
+    else:
+        columns = f'*, {date_column} AS date'
+        where = f'site_name = ? AND {date_column} BETWEEN ? AND ?'
+        params = [site_name, start.isoformat(), end.isoformat()]
+        group_by = ''
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {where} {group_by})
+        ''', params)
+        total = cursor.fetchone()[0]
+        cursor.execute(f'''
+            SELECT {columns} FROM {table} 
+            WHERE {where} {group_by}
+            ORDER BY {date_column} DESC 
+            LIMIT ? OFFSET ?
+        ''', params + [per_page, (page - 1) * per_page])
+        items = [dict(row) for row in cursor.fetchall()]
+
+    return {
+        'site_name': site_name,
+        'granularity': granularity,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'items': items
+    }
+
+@metrics.timed('db_query_seconds')
+def get_weekday_profile(site_name):
+    """曜日別（0=月曜）の日数・合計・平均を取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT weekday, days, total_count, CAST(total_count AS REAL) / days AS avg_count 
+            FROM weekday_profile 
+            WHERE site_name = ? AND days > 0
+            ORDER BY weekday
+        ''', (site_name,))
+        return [dict(row) for row in cursor.fetchall()]
+
+@metrics.timed('db_query_seconds')
+def record_intraday_samples(results, sampled_at=None):
+    """スクレイピング結果を日中の推移として記録（同じ間隔内の結果は最新の値で上書き）"""
+    sampled_at = sampled_at or time.time()
+    bucket = int(sampled_at) // INTRADAY_RESOLUTION * INTRADAY_RESOLUTION
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO intraday_samples 
+            (site_name, bucket, resolution, total_count, male_count, female_count, unknown_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (result.site_name, bucket, INTRADAY_RESOLUTION, *result.counts)
+            for result in results
+        ])
+
+@metrics.timed('db_query_seconds')
+def compact_intraday_samples(now=None):
+    """
+    古い記録を1時間単位（その時間内の最後の値）に間引き、保存期間を過ぎた記録を削除する
+    """
+    now = now or time.time()
+    raw_cutoff = int(now - INTRADAY_RAW_RETENTION_DAYS * 86400) // 3600 * 3600
+    hourly_cutoff = int(now - INTRADAY_HOURLY_RETENTION_DAYS * 86400)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # SQLiteではMAX()と同時に選んだ列はMAXとなった行の値になる
+        cursor.execute('''
+            INSERT OR REPLACE INTO intraday_samples 
+            (site_name, bucket, resolution, total_count, male_count, female_count, unknown_count)
+            SELECT site_name, bucket / 3600 * 3600, 3600, total_count, male_count, female_count, unknown_count
+            FROM (
+                SELECT site_name, MAX(bucket) AS bucket, total_count, male_count, female_count, unknown_count
+                FROM intraday_samples 
+                WHERE resolution < 3600 AND bucket < ?
+                GROUP BY site_name, bucket / 3600
+            )
+        ''', (raw_cutoff,))
+        cursor.execute('''
+            DELETE FROM intraday_samples 
+            WHERE resolution < 3600 AND bucket < ?
+        ''', (raw_cutoff,))
+        compacted = cursor.rowcount
+        cursor.execute('DELETE FROM intraday_samples WHERE bucket < ?', (hourly_cutoff,))
+        print(f"Compacted {compacted} intraday samples, removed {cursor.rowcount} expired samples")
+
+@metrics.timed('db_query_seconds')
+def get_intraday_series(site_name, target_date):
+    """指定日（JST）の記録を時刻順に取得"""
+    day_start = int(datetime.strptime(target_date, '%Y-%m-%d').replace(tzinfo=JST).timestamp())
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM intraday_samples 
+            WHERE site_name = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        ''', (site_name, day_start, day_start + 86400))
+        return [dict(row) for row in cursor.fetchall()]
+
+@metrics.timed('db_query_seconds')
+def get_hourly_posts(site_name, target_date):
+    """
+    指定日（JST）の1時間ごとの書き込み数を取得
+    記録は当日の累計なので、各時間の最後の値と前の時間の値の差を書き込み数とする
+    """
+    hours = {}
+    for sample in get_intraday_series(site_name, target_date):
+        hours[datetime.fromtimestamp(sample['bucket'], JST).hour] = sample['total_count']
+
+    result = []
+    previous = 0
+    for hour in sorted(hours):
+        result.append({
+            'hour': hour,
+            'total_count': hours[hour],
+            'posts': max(hours[hour] - previous, 0)
+        })
+        previous = hours[hour]
+    return result
+
+@metrics.timed('db_query_seconds')
+def get_crawl_state(site_name, target_date):
+    """差分クロール用の状態（既知の最新投稿と集計済みの件数）を取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM crawl_state 
+            WHERE site_name = ? AND target_date = ?
+        ''', (site_name, target_date))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        state = dict(row)
+        state['newest_keys'] = json.loads(state['newest_keys'])
+        return state
+
+@metrics.timed('db_query_seconds')
+def save_crawl_state(site_name, target_date, newest_keys, total_count, male_count=0, female_count=0, unknown_count=0):
+    """差分クロール用の状態を保存（サイトごとに1行）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO crawl_state 
+            (site_name, target_date, newest_keys, total_count, male_count, female_count, unknown_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(site_name) 
+            DO UPDATE SET 
+                target_date = excluded.target_date,
+                newest_keys = excluded.newest_keys,
+                total_count = excluded.total_count,
+                male_count = excluded.male_count,
+                female_count = excluded.female_count,
+                unknown_count = excluded.unknown_count,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (site_name, target_date, json.dumps(newest_keys), total_count, male_count, female_count, unknown_count))
+
+@metrics.timed('db_query_seconds')
+def get_backfill_checkpoint(site_name, start_date, end_date):
+    """中断したバックフィルの途中経過を取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT state FROM backfill_checkpoints 
+            WHERE site_name = ? AND start_date = ? AND end_date = ?
+        ''', (site_name, start_date, end_date))
+        row = cursor.fetchone()
+        return json.loads(row['state']) if row else None
+
+@metrics.timed('db_query_seconds')
+def save_backfill_checkpoint(site_name, start_date, end_date, state):
+    """バックフィルの途中経過を保存（ページごとに上書き）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO backfill_checkpoints (site_name, start_date, end_date, state)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(site_name, start_date, end_date) 
+            DO UPDATE SET 
+                state = excluded.state,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (site_name, start_date, end_date, json.dumps(state)))
+
+@metrics.timed('db_query_seconds')
+def delete_backfill_checkpoint(site_name, start_date, end_date):
+    """完了したバックフィルの途中経過を削除"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM backfill_checkpoints 
+            WHERE site_name = ? AND start_date = ? AND end_date = ?
+        ''', (site_name, start_date, end_date))
+
+@metrics.timed('db_query_seconds')
+def get_page_stats(site_name, weekday, slot):
+    """1回の巡回で何ページ取得したかの学習結果（曜日・時間帯別）を取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT samples, avg_pages, max_pages FROM page_stats 
+            WHERE site_name = ? AND weekday = ? AND slot = ?
+        ''', (site_name, weekday, slot))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+@metrics.timed('db_query_seconds')
+def record_page_count(site_name, weekday, slot, pages, learning_rate):
+    """1回の巡回で何ページ取得したかを記録（指数移動平均で更新）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO page_stats (site_name, weekday, slot, samples, avg_pages, max_pages)
+            VALUES (?, ?, ?, 1, ?, ?)
+            ON CONFLICT(site_name, weekday, slot) 
+            DO UPDATE SET 
+                samples = samples + 1,
+                avg_pages = avg_pages + ? * (excluded.avg_pages - avg_pages),
+                max_pages = MAX(max_pages, excluded.max_pages)
+        ''', (site_name, weekday, slot, pages, pages, learning_rate))
+
+@metrics.timed('db_query_seconds')
+def get_cached_results():
+    """全ワーカーで共有するスクレイピング結果を取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM scrape_cache')
         return {
-            'yesterday': dict(yesterday_data) if yesterday_data else None,
-            'last_week': dict(last_week_data) if last_week_data else None
+            row['site_name']: {
+                'result': SiteResult.from_record(json.loads(row['result'])),
+                'updated_at': datetime.fromisoformat(row['updated_at']),
+                'checked_at': datetime.fromisoformat(row['checked_at'])
+            }
+            for row in cursor.fetchall()
         }
 
-def get_all_sites_comparison(current_date):
-    """全サイトの比較データを取得"""
+# 共有キャッシュに保存するたびに進めるバージョン番号の名前（config_versions テーブル）
+SCRAPE_CACHE_VERSION_NAME = 'scrape_cache'
+
+@metrics.timed('db_query_seconds')
+def get_scrape_cache_version():
+    """共有キャッシュの書き込み回数（どのワーカーが保存しても1つ進む）"""
+    return get_config_version(SCRAPE_CACHE_VERSION_NAME)
+
+@metrics.timed('db_query_seconds')
+def get_cache_versions():
+    """共有キャッシュの各サイトの更新・確認時刻のみを取得（結果本体は読み込まない）"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT site_name FROM daily_posts')
-        sites = [row['site_name'] for row in cursor.fetchall()]
-        
-    result = {}
-    for site in sites:
-        result[site] = get_comparison_data(site, current_date)
-    
-    return result
+        cursor.execute('SELECT site_name, updated_at, checked_at FROM scrape_cache')
+        return {
+            row['site_name']: {
+                'updated_at': datetime.fromisoformat(row['updated_at']),
+                'checked_at': datetime.fromisoformat(row['checked_at'])
+            }
+            for row in cursor.fetchall()
+        }
 
-def get_recent_history(site_name, days=7):
-    """直近N日分のデータを取得"""
+@metrics.timed('db_query_seconds')
+def save_cached_result(result, updated_at, checked_at):
+    """スクレイピング結果（SiteResult）を共有キャッシュに保存"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT * FROM daily_posts 
-            WHERE site_name = ? 
-            ORDER BY record_date DESC 
-            LIMIT ?
-        ''', (site_name, days))
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+            INSERT INTO scrape_cache (site_name, result, updated_at, checked_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(site_name) 
+            DO UPDATE SET 
+                result = excluded.result,
+                updated_at = excluded.updated_at,
+                checked_at = excluded.checked_at
+        ''', (
+            result.site_name,
+            json.dumps(result.to_record(), ensure_ascii=False, separators=(',', ':')),
+            updated_at.isoformat(),
+            checked_at.isoformat()
+        ))
+        _bump_config_version(cursor, SCRAPE_CACHE_VERSION_NAME)
+
+@metrics.timed('db_query_seconds')
+def touch_cached_result(site_name, checked_at):
+    """取得に失敗した場合に確認時刻だけ更新（結果は前回のまま）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE scrape_cache SET checked_at = ? WHERE site_name = ?
+        ''', (checked_at.isoformat(), site_name))
+        _bump_config_version(cursor, SCRAPE_CACHE_VERSION_NAME)
+
+def make_lease_owner():
+    """リースの所有者ID（ホスト・プロセス・スレッド単位）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+@metrics.timed('db_query_seconds')
+def acquire_lease(name, owner, ttl):
+    """
+    リースを取得（期限切れか自分が所有している場合のみ成功する比較交換）
+    取得できた場合はTrueを返す
+    """
+    now = time.time()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO leases (name, owner, expires_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(name) 
+            DO UPDATE SET 
+                owner = excluded.owner,
+                expires_at = excluded.expires_at
+            WHERE leases.expires_at < ? OR leases.owner = excluded.owner
+        ''', (name, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+@metrics.timed('db_query_seconds')
+def release_lease(name, owner):
+    """自分が所有しているリースを解放"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+
+@metrics.timed('db_query_seconds')
+def is_lease_held(name):
+    """有効なリースが存在するか"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT 1 FROM leases WHERE name = ? AND expires_at >= ?
+        ''', (name, time.time()))
+        return cursor.fetchone() is not None
+
+@metrics.timed('db_query_seconds')
+def get_held_leases(prefix):
+    """名前が prefix で始まる有効なリースの名前を返す"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT name FROM leases 
+            WHERE substr(name, 1, length(?)) = ? AND expires_at >= ?
+        ''', (prefix, prefix, time.time()))
+        return [row['name'] for row in cursor.fetchall()]
+
+@metrics.timed('db_query_seconds')
+def save_batch_run(started_at, finished_at, summary):
+    """バッチ実行ごとの計測結果を保存"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO batch_runs (started_at, finished_at, summary)
+            VALUES (?, ?, ?)
+        ''', (started_at.isoformat(), finished_at.isoformat(), json.dumps(summary, ensure_ascii=False)))
+        return cursor.lastrowid
+
+@metrics.timed('db_query_seconds')
+def get_batch_runs(limit=10):
+    """最近のバッチ実行の計測結果を新しい順に取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM batch_runs ORDER BY id DESC LIMIT ?
+        ''', (limit,))
+        return [
+            {
+                'id': row['id'],
+                'started_at': row['started_at'],
+                'finished_at': row['finished_at'],
+                'summary': json.loads(row['summary'])
+            }
+            for row in cursor.fetchall()
+        ]
+
+# 終了していないジョブの状態
+ACTIVE_JOB_STATUSES = ('pending', 'running')
+
+def _expire_jobs(cursor, timeout):
+    """一定時間応答の無い実行中のジョブ（ワーカーが落ちたもの）を失敗にする"""
+    cursor.execute('''
+        UPDATE jobs SET status = 'error', error = 'timed out', finished_at = ? 
+        WHERE status = 'running' AND heartbeat < ?
+    ''', (datetime.now(JST).isoformat(), time.time() - timeout))
+
+def _job_from_row(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['progress'] = json.loads(job['progress'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    del job['heartbeat']
+    return job
+
+@metrics.timed('db_query_seconds')
+def enqueue_job(kind, timeout, params=None):
+    """
+    ジョブを登録（同じ種類・同じ引数の待機中・実行中のジョブがあればそれを使う）
+    戻り値: (ジョブ, 新規に登録したか)
+    """
+    params = json.dumps(params or {}, ensure_ascii=False, sort_keys=True)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # 他のワーカーと同時に登録しないよう最初に書き込みロックを取る
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        _expire_jobs(cursor, timeout)
+        cursor.execute('''
+            SELECT * FROM jobs WHERE kind = ? AND params = ? AND status IN (?, ?) ORDER BY id LIMIT 1
+        ''', (kind, params, *ACTIVE_JOB_STATUSES))
+        row = cursor.fetchone()
+        if row:
+            return _job_from_row(row), False
+        cursor.execute('''
+            INSERT INTO jobs (kind, params, created_at, heartbeat) VALUES (?, ?, ?, ?) RETURNING *
+        ''', (kind, params, datetime.now(JST).isoformat(), time.time()))
+        return _job_from_row(cursor.fetchone()), True
+
+@metrics.timed('db_query_seconds')
+def claim_next_job(owner, timeout):
+    """最も古い待機中のジョブを実行中にして返す（無ければNone）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        _expire_jobs(cursor, timeout)
+        cursor.execute('''
+            UPDATE jobs SET status = 'running', owner = ?, started_at = ?, heartbeat = ? 
+            WHERE id = (SELECT id FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1) 
+            AND status = 'pending'
+            RETURNING *
+        ''', (owner, datetime.now(JST).isoformat(), time.time()))
+        row = cursor.fetchone()
+        return _job_from_row(row) if row else None
+
+@metrics.timed('db_query_seconds')
+def update_job_progress(job_id, progress):
+    """ジョブの進捗（{サイト名: 状態}）を更新"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET progress = json_patch(progress, ?), heartbeat = ? WHERE id = ?
+        ''', (json.dumps(progress, ensure_ascii=False), time.time(), job_id))
+
+@metrics.timed('db_query_seconds')
+def finish_job(job_id, status, result=None, error=None):
+    """ジョブを終了状態にする"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, heartbeat = ? 
+            WHERE id = ?
+        ''', (
+            status,
+            json.dumps(result, ensure_ascii=False) if result is not None else None,
+            error,
+            datetime.now(JST).isoformat(),
+            time.time(),
+            job_id
+        ))
+
+@metrics.timed('db_query_seconds')
+def get_job(job_id):
+    """ジョブを取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        return _job_from_row(row) if row else None
+
+@metrics.timed('db_query_seconds')
+def delete_finished_jobs(retention_days):
+    """保存期間を過ぎた終了済みのジョブを削除"""
+    cutoff = time.time() - retention_days * 86400
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM jobs WHERE status NOT IN (?, ?) AND heartbeat < ?
+        ''', (*ACTIVE_JOB_STATUSES, cutoff))
+        return cursor.rowcount
+
+# サイト設定のバージョン番号の名前
+SITES_CONFIG_NAME = 'sites'
+
+def _bump_config_version(cursor, name):
+    """設定のバージョン番号を1つ進めて返す"""
+    cursor.execute('''
+        INSERT INTO config_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+        RETURNING version
+    ''', (name,))
+    return cursor.fetchone()['version']
+
+@metrics.timed('db_query_seconds')
+def get_config_version(name):
+    """設定のバージョン番号（一度も保存されていなければ0）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT version FROM config_versions WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        return row['version'] if row else 0
+
+@metrics.timed('db_query_seconds')
+def get_sites():
+    """保存済みのサイト設定を表示順に取得"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT definition FROM sites ORDER BY position, name')
+        return [json.loads(row['definition']) for row in cursor.fetchall()]
+
+@metrics.timed('db_query_seconds')
+def seed_sites(sites):
+    """サイト設定の初期値を登録（他のワーカーが先に登録していれば何もしない）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT version FROM config_versions WHERE name = ?', (SITES_CONFIG_NAME,))
+        if cursor.fetchone():
+            return
+        now = datetime.now(JST).isoformat()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO sites (name, position, definition, updated_at) VALUES (?, ?, ?, ?)
+        ''', [
+            (site['name'], position, json.dumps(site, ensure_ascii=False), now)
+            for position, site in enumerate(sites)
+        ])
+        _bump_config_version(cursor, SITES_CONFIG_NAME)
+
+@metrics.timed('db_query_seconds')
+def save_site(site, position=None):
+    """
+    サイト設定を追加・更新し、新しいバージョン番号を返す
+    position 省略時は既存のサイトは表示順を変えず、新しいサイトは末尾に追加する
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if position is None:
+            cursor.execute('''
+                SELECT COALESCE(
+                    (SELECT position FROM sites WHERE name = ?),
+                    (SELECT MAX(position) + 1 FROM sites),
+                    0
+                ) AS position
+            ''', (site['name'],))
+            position = cursor.fetchone()['position']
+        cursor.execute('''
+            INSERT INTO sites (name, position, definition, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET 
+                position = excluded.position,
+                definition = excluded.definition,
+                updated_at = excluded.updated_at
+        ''', (site['name'], position, json.dumps(site, ensure_ascii=False), datetime.now(JST).isoformat()))
+        return _bump_config_version(cursor, SITES_CONFIG_NAME)
+
+@metrics.timed('db_query_seconds')
+def delete_site(name):
+    """サイト設定を削除し、新しいバージョン番号を返す（存在しなければNone）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM sites WHERE name = ?', (name,))
+        if cursor.rowcount == 0:
+            return None
+        return _bump_config_version(cursor, SITES_CONFIG_NAME)
 
 if __name__ == '__main__':
     # テスト実行
@@ -0,0 +1,162 @@
+"""
+掲示板ホストごとの流量制限とサーキットブレーカー
+落ちている・遅いホストに毎回タイムアウトまで待たされないよう、失敗が続いたホストへの取得を一時的に止める
+"""
+import threading
+import time
+import requests
+import metrics
+from config import (
+    HTTP_RATE_LIMIT,
+    HTTP_RATE_BURST,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    CIRCUIT_MAX_RESET_TIMEOUT
+)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """サーキットブレーカーが開いているため取得しなかった"""
+
+
+class TokenBucket:
+    """トークンバケットによる流量制限（rate 件/秒、最大 burst 件まで連続して取得できる）"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得（無ければ補充されるまで待つ）。待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    連続して failure_threshold 回失敗すると開き、reset_timeout 秒間は取得を止める
+    その後は1件だけ試行（半開）し、成功すれば閉じ、失敗すれば待ち時間を倍にして再び開く
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout, max_reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """取得してよいか（開いている間はFalse、半開では試行1件のみTrue）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        """失敗を記録し、ブレーカーが開いた場合はTrueを返す"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            else:
+                self.failures += 1
+                if self.state == self.OPEN or self.failures < self.failure_threshold:
+                    return False
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            return True
+
+    def retry_after(self):
+        """次に試行できるまでの秒数"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class HostGuard:
+    """1ホスト分の流量制限とサーキットブレーカー"""
+
+    def __init__(self, host):
+        self.host = host
+        self.bucket = TokenBucket(HTTP_RATE_LIMIT, HTTP_RATE_BURST)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_MAX_RESET_TIMEOUT)
+
+    def before_request(self, site):
+        """取得前に呼び出す。ブレーカーが開いていれば待たずにCircuitOpenError"""
+        if not self.breaker.allow():
+            metrics.inc('http_circuit_rejected_total', site=site)
+            raise CircuitOpenError(
+                f"Circuit open for {self.host} (retry in {self.breaker.retry_after():.0f}s)"
+            )
+        waited = self.bucket.acquire()
+        if waited:
+            metrics.observe('http_rate_limit_wait_seconds', waited, site=site)
+
+    def record_success(self):
+        self.breaker.record_success()
+
+    def record_failure(self, site):
+        if self.breaker.record_failure():
+            metrics.inc('http_circuit_opened_total', site=site)
+            print(f"Circuit opened for {self.host} (retry in {self.breaker.reset_timeout:.0f}s)")
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_host_guard(host):
+    """ホストの流量制限・サーキットブレーカーを取得"""
+    with _guards_lock:
+        if host not in _guards:
+            _guards[host] = HostGuard(host)
+        return _guards[host]
+
+
+def get_circuit_states():
+    """ホストごとのブレーカーの状態"""
+    with _guards_lock:
+        guards = list(_guards.values())
+    return {
+        guard.host: {
+            'state': guard.breaker.state,
+            'failures': guard.breaker.failures,
+            'retry_after': round(guard.breaker.retry_after(), 1)
+        }
+        for guard in guards
+    }
+
+
+def reset_host_guards():
+    """全ホストの状態を破棄"""
+    with _guards_lock:
+        _guards.clear()
@@ -0,0 +1,159 @@
+"""
+HTTP取得の共通処理
+ホストごとのセッション（keep-alive接続プール）と条件付きGETを提供
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import requests
+import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from host_guard import get_host_guard, get_circuit_states
+from config import (
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_RETRY_TOTAL,
+    HTTP_RETRY_BACKOFF,
+    HTTP_VALIDATOR_CACHE_SIZE
+)
+
+# ホストごとのセッション
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# URLごとの検証子（ETag/Last-Modified）と前回の結果（解析結果、parse未指定時は本文）
+# 最近使った HTTP_VALIDATOR_CACHE_SIZE 件だけを保持する
+_validators = OrderedDict()
+_validators_lock = threading.Lock()
+
+def _create_session():
+    """接続プールと再試行を設定したセッションを作成"""
+    retry = Retry(
+        total=HTTP_RETRY_TOTAL,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        # Retry-After の秒数は上限が無く締め切りを超えて待つことがあるため、backoff の間隔で再試行する
+        respect_retry_after_header=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url):
+    """URLのホストに対応するセッションを取得"""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        if host not in _sessions:
+            _sessions[host] = _create_session()
+        return _sessions[host]
+
+
+def fetch(url, headers=None, parse=None, parse_key=None, site=None):
+    """
+    条件付きGETでページを取得し、本文（parse指定時はその結果）を返す
+    304の場合は前回の結果を再利用し、再ダウンロードも再解析もしない
+    前回の結果は1つの形（parse指定時は解析結果、未指定時は本文）だけを保持し、別の形を求められた場合は再取得する
+    失敗が続いているホストには取得せず、直ちにCircuitOpenErrorを送出する
+    siteは計測用のラベル（サイト名）
+    """
+    host = urlsplit(url).netloc
+    site = site or host
+    guard = get_host_guard(host)
+    request_headers = dict(headers or {})
+    key = None if parse is None else (parse_key if parse_key is not None else parse)
+    with _validators_lock:
+        entry = _validators.get(url)
+        if entry is not None and entry['parse_key'] == key:
+            _validators.move_to_end(url)
+        else:
+            entry = None
+    if entry:
+        if entry['etag']:
+            request_headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request_headers['If-Modified-Since'] = entry['last_modified']
+
+    guard.before_request(site)
+    started = time.perf_counter()
+    try:
+        response = get_session(url).get(url, headers=request_headers, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT))
+    except requests.exceptions.RequestException:
+        guard.record_failure(site)
+        raise
+    if response.status_code >= 500 or response.status_code == 429:
+        guard.record_failure(site)
+    else:
+        guard.record_success()
+    # elapsedはリクエスト送信からヘッダー受信まで（名前解決・接続・応答待ち）、残りを本文のダウンロードとみなす
+    connect_seconds = response.elapsed.total_seconds()
+    metrics.observe('scrape_stage_seconds', connect_seconds, site=site, stage='connect')
+    metrics.observe('scrape_stage_seconds', max(time.perf_counter() - started - connect_seconds, 0), site=site, stage='download')
+    metrics.inc('http_responses_total', site=site, status=response.status_code)
+
+    if response.status_code == 304 and entry:
+        metrics.inc('http_bytes_total', entry['size'], site=site, kind='saved')
+        if parse is not None:
+            metrics.inc('parse_cache_hits_total', site=site)
+        return entry['body']
+
+    response.raise_for_status()
+    metrics.inc('http_bytes_total', len(response.content), site=site, kind='downloaded')
+    if parse is None:
+        body = response.text
+    else:
+        with metrics.timer('scrape_stage_seconds', site=site, stage='parse'):
+            body = parse(response.text)
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    with _validators_lock:
+        if etag or last_modified:
+            _validators[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'size': len(response.content),
+                'parse_key': key,
+                'body': body
+            }
+            _validators.move_to_end(url)
+            while len(_validators) > HTTP_VALIDATOR_CACHE_SIZE:
+                _validators.popitem(last=False)
+        else:
+            _validators.pop(url, None)
+    return body
+
+
+def clear_conditional_cache():
+    """保存している検証子と前回の結果を破棄（次回は全ページを再取得する）"""
+    with _validators_lock:
+        _validators.clear()
+
+
+def get_http_stats():
+    """取得状況（ダウンロード数・304の数・解析結果の再利用数など）を返す"""
+    downloaded = metrics.get_counter_total('http_responses_total', status=200)
+    not_modified = metrics.get_counter_total('http_responses_total', status=304)
+    answered = downloaded + not_modified
+    return {
+        'requests': metrics.get_counter_total('http_responses_total'),
+        'downloaded': downloaded,
+        'not_modified': not_modified,
+        'parse_cache_hits': metrics.get_counter_total('parse_cache_hits_total'),
+        'bytes_downloaded': metrics.get_counter_total('http_bytes_total', kind='downloaded'),
+        'bytes_saved': metrics.get_counter_total('http_bytes_total', kind='saved'),
+        'not_modified_rate': not_modified / answered if answered else None,
+        'circuit_rejected': metrics.get_counter_total('http_circuit_rejected_total'),
+        'hosts': get_circuit_states()
+    }
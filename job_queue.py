@@ -0,0 +1,91 @@
+"""
+バックグラウンドジョブのキュー
+手動のバッチ実行・強制更新をリクエストのスレッドで実行せず、登録してジョブIDを返す
+ジョブはSQLiteの jobs テーブルに保存し、gunicornのいずれかのワーカーのスケジューラーが取り出して実行する
+"""
+import threading
+import db_manager
+import metrics
+from config import JOB_TIMEOUT, JOB_RETENTION_DAYS
+
+# ジョブの種類ごとの処理
+JOB_HANDLERS = {}
+
+# このプロセスで同時に1つだけ取り出して実行する
+_run_lock = threading.Lock()
+
+
+def register_job(kind):
+    """
+    ジョブの処理を登録するデコレーター
+    処理は進捗を報告する関数 progress({サイト名: 状態}) と、登録時の引数（キーワード引数）を受け取り、
+    JSONにできる結果を返す
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, params=None):
+    """
+    ジョブを登録する。同じ種類・同じ引数のジョブが待機中・実行中であれば新たに登録せずにそれを返す
+    params: 処理に渡す引数（JSONにできる辞書）
+    戻り値: (ジョブ, 新規に登録したか)
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job, created = db_manager.enqueue_job(kind, JOB_TIMEOUT, params)
+    metrics.inc('job_enqueued_total', kind=kind, result='created' if created else 'deduplicated')
+    return job, created
+
+
+def run_job(job):
+    """取り出したジョブを1件実行し、結果を保存する"""
+    def progress(statuses):
+        db_manager.update_job_progress(job['id'], statuses)
+
+    print(f"Job {job['id']} ({job['kind']}) started")
+    try:
+        with metrics.timer('job_seconds', kind=job['kind']):
+            result = JOB_HANDLERS[job['kind']](progress, **job['params'])
+    except Exception as e:
+        db_manager.finish_job(job['id'], 'error', error=str(e))
+        metrics.inc('job_finished_total', kind=job['kind'], status='error')
+        print(f"✗ Job {job['id']} ({job['kind']}) failed: {e}")
+        return
+    db_manager.finish_job(job['id'], 'done', result=result)
+    metrics.inc('job_finished_total', kind=job['kind'], status='done')
+    print(f"Job {job['id']} ({job['kind']}) finished")
+
+
+def run_pending_jobs():
+    """待機中のジョブが無くなるまで順に取り出して実行する（スケジューラーから呼ばれる）"""
+    if not _run_lock.acquire(blocking=False):
+        return
+    try:
+        owner = db_manager.make_lease_owner()
+        while True:
+            job = db_manager.claim_next_job(owner, JOB_TIMEOUT)
+            if job is None:
+                break
+            run_job(job)
+        db_manager.delete_finished_jobs(JOB_RETENTION_DAYS)
+    finally:
+        _run_lock.release()
+
+
+def is_running():
+    """このプロセスでジョブを取り出して実行中か（実行中ならキューが空になるまで続けて取り出す）"""
+    return _run_lock.locked()
+
+
+def get_job_status(job_id):
+    """ジョブの状態と、サイトごとの進捗の集計を返す（無ければNone）"""
+    job = db_manager.get_job(job_id)
+    if job is None:
+        return None
+    finished = sum(1 for status in job['progress'].values() if status != 'pending')
+    job['completed'] = finished
+    job['total'] = len(job['progress'])
+    return job
@@ -0,0 +1,178 @@
+"""
+処理時間・件数の計測
+カウンターとヒストグラムをメモリ上に集計し、Prometheus形式またはJSONで出力する
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from config import METRICS_ENABLED
+
+# ヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# 各指標の説明（Prometheusの HELP 行）
+DESCRIPTIONS = {
+    'scrape_stage_seconds': 'Time spent per site and stage (connect = DNS/connect/TTFB, download, parse, count, total)',
+    'scrape_pages_total': 'Board pages fetched per site',
+    'scrape_stop_total': 'Reasons a paging crawl stopped',
+    'scrape_prefetch_unused_total': 'Pages fetched ahead in parallel but not needed',
+    'http_responses_total': 'HTTP responses per site and status',
+    'http_bytes_total': 'Response bytes downloaded or saved by 304 per site',
+    'http_rate_limit_wait_seconds': 'Time spent waiting for the per-host rate limiter',
+    'http_circuit_opened_total': 'Times a host circuit breaker opened',
+    'http_circuit_rejected_total': 'Fetches skipped because the host circuit breaker was open',
+    'parse_cache_hits_total': 'Pages whose previous parse result was reused',
+    'result_cache_requests_total': 'Snapshot cache lookups by result (fresh, stale, miss)',
+    'db_query_seconds': 'Time spent in db_manager functions',
+    'job_enqueued_total': 'Background jobs requested (created or deduplicated against an active job)',
+    'job_finished_total': 'Background jobs finished by status',
+    'job_seconds': 'Time spent running background jobs',
+    'analytics_cache_total': 'Analytics lookups served from the cache (hit) or recomputed (miss)',
+    'analytics_seconds': 'Time spent recomputing analytics over daily_posts',
+}
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """カウンターを加算"""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """ヒストグラムに値を記録"""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(DEFAULT_BUCKETS)}
+        histogram['count'] += 1
+        histogram['sum'] += value
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """ブロックの処理時間をヒストグラムに記録"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    """関数の処理時間をヒストグラムに記録するデコレーター（関数名をfuncラベルに入れる）"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, func=func.__name__, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_counter_total(name, **labels):
+    """指定したラベルに一致するカウンターの合計"""
+    wanted = set(labels.items())
+    with _lock:
+        return sum(
+            value for (counter_name, counter_labels), value in _counters.items()
+            if counter_name == name and wanted <= set(counter_labels)
+        )
+
+
+def snapshot():
+    """現在の集計値のコピー"""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'histograms': {key: {'count': h['count'], 'sum': h['sum']} for key, h in _histograms.items()}
+        }
+
+
+def summarize(before, after):
+    """
+    2つのスナップショットの差分を、サイトごと・指標ごとのJSONにまとめる
+    戻り値: {'sites': {site: {指標: 値}}, 'other': {指標: 値}}
+    """
+    summary = {'sites': {}, 'other': {}}
+
+    def add(key, value):
+        name, labels = key
+        labels = dict(labels)
+        site = labels.pop('site', None)
+        label_text = ','.join(f'{k}={v}' for k, v in sorted(labels.items()))
+        field = f'{name}{{{label_text}}}' if label_text else name
+        target = summary['sites'].setdefault(site, {}) if site else summary['other']
+        target[field] = round(value, 4) if isinstance(value, float) else value
+
+    for key, value in after['counters'].items():
+        delta = value - before['counters'].get(key, 0)
+        if delta:
+            add(key, delta)
+    for key, histogram in after['histograms'].items():
+        previous = before['histograms'].get(key, {'count': 0, 'sum': 0.0})
+        count = histogram['count'] - previous['count']
+        if count:
+            add((f'{key[0]}_sum', key[1]), histogram['sum'] - previous['sum'])
+            add((f'{key[0]}_count', key[1]), count)
+    return summary
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_prometheus():
+    """Prometheusのテキスト形式で出力"""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(h, buckets=list(h['buckets']))) for key, h in _histograms.items())
+
+    lines = []
+    described = set()
+
+    def header(name, metric_type):
+        if name not in described:
+            described.add(name)
+            if name in DESCRIPTIONS:
+                lines.append(f'# HELP {name} {DESCRIPTIONS[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+    for (name, labels), value in counters:
+        header(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    for (name, labels), histogram in histograms:
+        header(name, 'histogram')
+        # バケットは記録時に累積済み
+        for bound, count in zip(DEFAULT_BUCKETS, histogram['buckets']):
+            lines.append(f'{name}_bucket{_format_labels(labels, {"le": bound})} {count}')
+        lines.append(f'{name}_bucket{_format_labels(labels, {"le": "+Inf"})} {histogram["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,138 @@
+"""
+掲示板ページの解析処理
+selectolax / lxml がインストールされていれば使用し、無ければ html.parser で解析する
+"""
+import re
+from functools import lru_cache
+from bs4 import BeautifulSoup, SoupStrainer
+from config import PARSER_BACKEND
+
+# SoupStrainerに変換できる単純なセレクター（tag / tag.class / tag#id / .class / #id）
+_SIMPLE_SELECTOR = re.compile(r'^(?P<tag>[a-zA-Z][a-zA-Z0-9]*)?(?:(?P<kind>[.#])(?P<value>[\w-]+))?$')
+
+# 自動選択時の優先順位
+BACKEND_PRIORITY = ['selectolax', 'lxml', 'html.parser']
+
+
+@lru_cache(maxsize=128)
+def build_strainer(selector):
+    """セレクターから対象要素だけを解析するSoupStrainerを作成（変換できない場合はNone）。同じセレクターは使い回す"""
+    match = _SIMPLE_SELECTOR.match(selector.strip())
+    if not match or not (match.group('tag') or match.group('kind')):
+        return None
+
+    attrs = {}
+    if match.group('kind') == '.':
+        attrs['class'] = match.group('value')
+    elif match.group('kind') == '#':
+        attrs['id'] = match.group('value')
+    return SoupStrainer(match.group('tag'), attrs=attrs)
+
+
+class SoupBackend:
+    """BeautifulSoupによる解析（対象の投稿要素のみを解析）"""
+
+    def __init__(self, features):
+        self.name = features
+        self.features = features
+
+    def _soup(self, html, selector):
+        return BeautifulSoup(html, self.features, parse_only=build_strainer(selector))
+
+    def select_text(self, html, selector):
+        element = self._soup(html, selector).select_one(selector)
+        return element.text.strip() if element else None
+
+    def parse_posts(self, html, post_selector, field_selectors, include_text=False):
+        posts = []
+        for post in self._soup(html, post_selector).select(post_selector):
+            fields = {}
+            for field, selector in field_selectors.items():
+                element = post.select_one(selector)
+                fields[field] = element.text.strip() if element else None
+            if include_text:
+                fields['text'] = post.text.strip()
+            posts.append(fields)
+        return posts
+
+
+class SelectolaxBackend:
+    """selectolaxによる解析"""
+
+    name = 'selectolax'
+
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser
+        except ImportError:
+            # 古いselectolaxにはlexborバックエンドが無い
+            from selectolax.parser import HTMLParser
+        self._parser = HTMLParser
+
+    def select_text(self, html, selector):
+        node = self._parser(html).css_first(selector)
+        return node.text().strip() if node else None
+
+    def parse_posts(self, html, post_selector, field_selectors, include_text=False):
+        posts = []
+        for post in self._parser(html).css(post_selector):
+            fields = {}
+            for field, selector in field_selectors.items():
+                node = post.css_first(selector)
+                fields[field] = node.text().strip() if node else None
+            if include_text:
+                fields['text'] = post.text().strip()
+            posts.append(fields)
+        return posts
+
+
+def _create_backend(name):
+    """指定された解析バックエンドを作成（利用できない場合はImportError）"""
+    if name == 'selectolax':
+        return SelectolaxBackend()
+    if name == 'lxml':
+        import lxml  # noqa: F401  BeautifulSoupのlxmlパーサーが使えるか確認
+        return SoupBackend('lxml')
+    if name == 'html.parser':
+        return SoupBackend('html.parser')
+    raise ValueError(f"Unknown parser backend: {name}")
+
+
+def available_backends():
+    """この環境で利用できる解析バックエンド名を優先順に返す"""
+    names = []
+    for name in BACKEND_PRIORITY:
+        try:
+            _create_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+_backends = {}
+
+
+def get_backend(name=None):
+    """解析バックエンドを取得（'auto'の場合は利用可能な中で最速のもの）"""
+    name = name or PARSER_BACKEND
+    if name not in _backends:
+        if name == 'auto':
+            _backends[name] = _create_backend(available_backends()[0])
+        else:
+            try:
+                _backends[name] = _create_backend(name)
+            except ImportError:
+                print(f"Parser backend '{name}' is not installed. Falling back to html.parser.")
+                _backends[name] = _create_backend('html.parser')
+    return _backends[name]
+
+
+def select_text(html, selector, backend=None):
+    """ページ内の指定要素のテキストを取得（見つからない場合はNone）"""
+    return get_backend(backend).select_text(html, selector)
+
+
+def parse_posts(html, post_selector, field_selectors, include_text=False, backend=None):
+    """ページ内の各投稿から指定フィールドのテキストを抽出（include_text指定時は投稿全体のテキストも'text'に格納）"""
+    return get_backend(backend).parse_posts(html, post_selector, field_selectors, include_text)
@@ -0,0 +1,104 @@
+"""
+掲示板のページ送りの計画
+サイト・曜日ごとに1回の巡回で何ページ取得したかを学習し、その分のページを先に並列取得する
+全件の巡回（1日分の投稿のページ数）と、差分クロール（前回の巡回以降の投稿のページ数）は別々に学習する
+差分クロールで取得するページ数は前回からの間隔で決まるため、巡回した時刻（JSTの時）ごとに分ける
+取得したページは必ずページ順に処理するため、先読みしても集計結果は変わらない
+"""
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import db_manager
+import metrics
+from scraper_utils import get_jst_now
+from config import (
+    PAGINATION_ADAPTIVE,
+    PAGINATION_PREFETCH_MAX,
+    PAGINATION_PREFETCH_WORKERS,
+    PAGINATION_LEARNING_RATE
+)
+
+# 巡回を最後まで行った（学習に使える）停止理由（差分クロールは既知の投稿に達した場合も含む）
+COMPLETE_STOP_REASONS = ('older_post', 'no_target_posts', 'no_posts', 'max_page')
+INCREMENTAL_STOP_REASONS = COMPLETE_STOP_REASONS + ('known_post',)
+
+# 全件の巡回の学習結果の時間帯（差分クロールは巡回した時の 0〜23）
+FULL_CRAWL_SLOT = -1
+
+# ページの先読みに使う共有スレッドプール（初回使用時に生成）
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """先読み用のスレッドプールを取得"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=PAGINATION_PREFETCH_WORKERS,
+                thread_name_prefix='prefetch'
+            )
+        return _executor
+
+
+class PagePlanner:
+    """
+    1回の巡回のページ取得を計画する
+    pages() はページ順に (ページ番号, URL, 投稿) を返し、呼び出し側が不要になった時点で打ち切ってよい
+    """
+
+    def __init__(self, site_name, page_urls, fetch_page, target_date=None, incremental=False):
+        self.site_name = site_name
+        self.page_urls = list(page_urls)
+        self.fetch_page = fetch_page
+        self.weekday = target_date.weekday() if target_date is not None else None
+        self.incremental = incremental
+        self.slot = get_jst_now().hour if incremental else FULL_CRAWL_SLOT
+        self.prefetch = self._plan_prefetch() if PAGINATION_ADAPTIVE else 1
+        self.pages_used = 0
+        self._futures = []
+
+    def _plan_prefetch(self):
+        """先に並列取得するページ数（学習結果が無ければ1ページずつ取得する）"""
+        if self.weekday is None:
+            return 1
+        stats = db_manager.get_page_stats(self.site_name, self.weekday, self.slot)
+        if not stats:
+            return 1
+        return max(1, min(math.ceil(stats['avg_pages']), PAGINATION_PREFETCH_MAX, len(self.page_urls)))
+
+    def pages(self):
+        """ページ順に取得結果を返す（先頭の数ページは並列に取得済み）"""
+        if self.prefetch > 1:
+            executor = _get_executor()
+            self._futures = [
+                executor.submit(self.fetch_page, url)
+                for _, url in self.page_urls[:self.prefetch]
+            ]
+
+        for index, (page_num, url) in enumerate(self.page_urls):
+            if index < len(self._futures):
+                posts = self._futures[index].result()
+            else:
+                posts = self.fetch_page(url)
+            self.pages_used = index + 1
+            yield page_num, url, posts
+
+    def finish(self, stop_reason):
+        """巡回の終了時に呼び出し、使わなかった先読みを破棄して今回取得したページ数を学習する"""
+        unused = 0
+        for future in self._futures[self.pages_used:]:
+            if not future.cancel():
+                unused += 1
+        if unused:
+            metrics.inc('scrape_prefetch_unused_total', unused, site=self.site_name)
+
+        complete = INCREMENTAL_STOP_REASONS if self.incremental else COMPLETE_STOP_REASONS
+        if PAGINATION_ADAPTIVE and self.weekday is not None and stop_reason in complete and self.pages_used:
+            try:
+                db_manager.record_page_count(
+                    self.site_name, self.weekday, self.slot, self.pages_used, PAGINATION_LEARNING_RATE
+                )
+            except Exception as e:
+                print(f"Failed to record page count for {self.site_name}: {e}")
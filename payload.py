@@ -0,0 +1,71 @@
+"""
+APIレスポンスの事前エンコード
+JSONを1度だけバイト列に変換し、圧縮結果とETagも使い回す
+brotli がインストールされていれば br、無ければ gzip で圧縮する
+"""
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# これより小さいレスポンスは圧縮しない（バイト）
+MIN_COMPRESS_SIZE = 512
+
+
+def choose_encoding(accept_encoding):
+    """Accept-Encodingヘッダーから使用する圧縮方式を選ぶ（圧縮しない場合はNone）"""
+    accepted = {item.split(';')[0].strip().lower() for item in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+class EncodedPayload:
+    """エンコード済みのJSON本文と、そのETag・圧縮結果"""
+
+    __slots__ = ('key', 'body', 'etag', 'expires_at', '_compressed')
+
+    def __init__(self, body, key=None):
+        # 作成元のデータのバージョン（同じなら作り直さない）
+        self.key = key
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        # 内容が古くなる時刻（Noneは不明）
+        self.expires_at = None
+        self._compressed = {}
+
+    def encode(self, encoding):
+        """指定方式で圧縮した本文とその方式を返す（小さい本文・未対応の方式はそのまま）"""
+        if encoding is None or len(self.body) < MIN_COMPRESS_SIZE:
+            return self.body, None
+        if encoding not in self._compressed:
+            if encoding == 'br':
+                self._compressed[encoding] = brotli.compress(self.body)
+            elif encoding == 'gzip':
+                self._compressed[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+            else:
+                return self.body, None
+        return self._compressed[encoding], encoding
+
+    def etag_for(self, encoding):
+        """圧縮方式ごとのETag（同じ内容でも圧縮方式が異なれば別の値にする）"""
+        return f"{self.etag}-{encoding}" if encoding else self.etag
+
+
+def make_etag(*parts):
+    """データのバージョンなどからETagの値を作成"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:20]
+
+
+def encode_json(data, key=None):
+    """データをJSONのバイト列にエンコード"""
+    return EncodedPayload(
+        json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        key
+    )
@@ -0,0 +1,356 @@
+"""
+スクレイピング結果のキャッシュ
+期限切れでも古い結果を即座に返し、更新はバックグラウンドで1本だけ実行する（stale-while-revalidate）
+結果はSQLiteの scrape_cache テーブルに保存し、gunicornの全ワーカーで共有する
+"""
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import db_manager
+import metrics
+from config import JST, CACHE_EXPIRATION, SCRAPE_LEASE_TTL, INTRADAY_SAMPLING, DAILY_TOP_UP
+from scraper_utils import get_jst_now
+import site_registry
+from payload import encode_json
+
+# 他のワーカーの更新完了を待つ際の確認間隔（秒）
+LEASE_POLL_INTERVAL = 0.5
+
+
+def get_site_ttl(site):
+    """サイトごとのキャッシュ有効期限（秒）"""
+    return site.get('cache_ttl', CACHE_EXPIRATION)
+
+
+def get_lease_name(site):
+    """サイトごとの更新リース名"""
+    return f"scrape:{site['name']}"
+
+
+class ScrapeResultCache:
+    """サイトごとに鮮度を管理するスクレイピング結果のキャッシュ"""
+
+    def __init__(self, sites=None):
+        # 対象サイト（Noneの場合はDBのサイト設定に従い、変更は稼働中に反映する）
+        self._sites = sites
+        self._lock = threading.Lock()
+        # このプロセスで実行中の更新（同時に1本のみ）
+        self._refresh_done = None
+        self._refresh_sites = set()
+        # 更新の進捗を受け取るキュー（(更新の完了イベント, サイト名) 、更新の終了時はサイト名がNone）
+        self._subscribers = set()
+        # エンコード済みのスナップショットと作成時の世代（キャッシュの内容が変わるまで使い回す）
+        self._encoded = None
+
+    @property
+    def sites(self):
+        return site_registry.get_sites() if self._sites is None else self._sites
+
+    @property
+    def sites_version(self):
+        """対象サイトの設定のバージョン番号（サイトを固定で指定した場合は0）"""
+        return site_registry.get_sites_version() if self._sites is None else 0
+
+    def _publish(self, done, site_name):
+        """更新の進捗を購読中のストリームに通知。呼び出し時はロックを保持していること"""
+        for subscriber in self._subscribers:
+            subscriber.put((done, site_name))
+
+    def _is_stale(self, entries, site, now):
+        entry = entries.get(site['name'])
+        if entry is None:
+            return True
+        return (now - entry['checked_at']).total_seconds() > get_site_ttl(site)
+
+    def _load_last_known(self, site):
+        """キャッシュが無いサイトの取得に失敗した場合、DBに保存済みの最新の日次データから結果を作成"""
+        row = db_manager.get_latest_daily_data(site['name'])
+        if row is None:
+            return None, None
+        from site_adapters import get_adapter
+        result = get_adapter(site).build_result(
+            (row['total_count'], row['male_count'], row['female_count'], row['unknown_count'])
+        )
+        # created_at はSQLiteの CURRENT_TIMESTAMP（UTC）
+        saved_at = datetime.fromisoformat(row['created_at']).replace(tzinfo=timezone.utc).astimezone(JST)
+        return result, saved_at
+
+    def _wait_for_other_workers(self, sites):
+        """他のワーカーが更新中のサイトについて、リースが解放されるまで待つ"""
+        deadline = time.monotonic() + SCRAPE_LEASE_TTL
+        pending = list(sites)
+        while pending and time.monotonic() < deadline:
+            pending = [site for site in pending if db_manager.is_lease_held(get_lease_name(site))]
+            if pending:
+                time.sleep(LEASE_POLL_INTERVAL)
+
+    def _run_refresh(self, sites, done):
+        """バックグラウンドで指定サイトを更新（リースを取得できたサイトのみ自分で取得する）"""
+        # 取得処理（requests・BeautifulSoup）は実際に更新する時に読み込む（アプリの起動を速くする）
+        from scrape_engine import iter_scrape_sites
+
+        owner = db_manager.make_lease_owner()
+        acquired = []
+        try:
+            for site in sites:
+                if db_manager.acquire_lease(get_lease_name(site), owner, SCRAPE_LEASE_TTL):
+                    acquired.append(site)
+            others = [site for site in sites if site not in acquired]
+            if others:
+                print(f"Another worker is refreshing: {', '.join(site['name'] for site in others)}")
+
+            if acquired:
+                entries = db_manager.get_cached_results()
+                results = []
+                # 終わったサイトから保存し、ストリームに通知する
+                for site, result in iter_scrape_sites(acquired):
+                    now = get_jst_now()
+                    results.append(result)
+                    self._save_result(site, result, entries, now)
+                    with self._lock:
+                        self._publish(done, site['name'])
+
+                if INTRADAY_SAMPLING:
+                    db_manager.record_intraday_samples(
+                        [result for result in results if not result.error],
+                        now.timestamp()
+                    )
+                if DAILY_TOP_UP:
+                    db_manager.top_up_daily_data(results)
+
+            if others:
+                self._wait_for_other_workers(others)
+        except Exception as e:
+            print(f"Background refresh failed: {e}")
+        finally:
+            for site in acquired:
+                try:
+                    db_manager.release_lease(get_lease_name(site), owner)
+                except Exception as e:
+                    print(f"Failed to release lease for {site['name']}: {e}")
+            with self._lock:
+                self._refresh_done = None
+                self._refresh_sites = set()
+                self._publish(done, None)
+            done.set()
+
+    def _save_result(self, site, result, entries, now):
+        """1サイト分の結果を共有キャッシュに保存"""
+        if result.error:
+            # 取得に失敗した場合は前回の結果を残し、確認時刻だけ更新する（結果は古いものとして返す）
+            if result.site_name in entries:
+                print(f"Keeping stale data for {result.display_name}: {result.error}")
+                db_manager.touch_cached_result(result.site_name, now)
+            else:
+                last_known, saved_at = self._load_last_known(site)
+                if last_known is not None:
+                    print(f"Using last saved data for {result.display_name}: {result.error}")
+                    db_manager.save_cached_result(last_known, saved_at, now)
+                else:
+                    db_manager.save_cached_result(result, now, now)
+        else:
+            db_manager.save_cached_result(result, now, now)
+
+    def _start_refresh(self, sites):
+        """更新を開始（実行中の更新があればそれを返す）。呼び出し時はロックを保持していること"""
+        if self._refresh_done is not None:
+            return self._refresh_done, self._refresh_sites
+
+        done = threading.Event()
+        self._refresh_done = done
+        self._refresh_sites = {site['name'] for site in sites}
+        print(f"Starting background refresh: {', '.join(sorted(self._refresh_sites))}")
+        threading.Thread(
+            target=self._run_refresh,
+            args=(sites, done),
+            name='scrape-refresh',
+            daemon=True
+        ).start()
+        return done, self._refresh_sites
+
+    def _refresh_and_wait(self, sites):
+        """指定サイトの更新を実行中のものに合流させて完了まで待つ"""
+        remaining = {site['name'] for site in sites}
+        while remaining:
+            with self._lock:
+                done, refreshing = self._start_refresh([s for s in sites if s['name'] in remaining])
+            done.wait()
+            remaining -= refreshing
+
+    def _revalidate(self):
+        """
+        期限切れのサイトはバックグラウンドで更新し、結果が1件も無いサイトがある場合のみ更新を待つ
+        キャッシュの各サイトの更新・確認時刻を返す
+        """
+        now = get_jst_now()
+        entries = db_manager.get_cache_versions()
+        stale_sites = [site for site in self.sites if self._is_stale(entries, site, now)]
+        missing_sites = [site for site in self.sites if site['name'] not in entries]
+        missing_names = {site['name'] for site in missing_sites}
+        stale_names = {site['name'] for site in stale_sites}
+        for site in self.sites:
+            if site['name'] in missing_names:
+                metrics.inc('result_cache_requests_total', result='miss')
+            elif site['name'] in stale_names:
+                metrics.inc('result_cache_requests_total', result='stale')
+            else:
+                metrics.inc('result_cache_requests_total', result='fresh')
+
+        if missing_sites:
+            self._refresh_and_wait(stale_sites)
+            entries = db_manager.get_cache_versions()
+        elif stale_sites:
+            with self._lock:
+                self._start_refresh(stale_sites)
+        return entries
+
+    def get_snapshot(self):
+        """キャッシュされた結果を返す"""
+        self._revalidate()
+        return self.build_snapshot()
+
+    def _get_expires_at(self, entries, now):
+        """いずれかのサイトが期限切れになる時刻（既に期限切れ・結果の無いサイトがあれば現在時刻）"""
+        expires_at = None
+        for site in self.sites:
+            entry = entries.get(site['name'])
+            if entry is None:
+                return now
+            site_expires_at = entry['checked_at'] + timedelta(seconds=get_site_ttl(site))
+            if expires_at is None or site_expires_at < expires_at:
+                expires_at = site_expires_at
+        return max(expires_at, now) if expires_at else now
+
+    def get_encoded_snapshot(self):
+        """
+        キャッシュされた結果をエンコード済みのJSON（EncodedPayload）で返す
+        前回エンコードしたものが期限内で、その後どのワーカーも共有キャッシュに保存していなければ
+        （共有キャッシュのバージョン番号が同じなら）結果を読まずにそのまま返す
+        各サイトの更新・確認時刻と鮮度が前回と同じ場合も、エンコードし直さずに使い回す
+        """
+        now = get_jst_now()
+        cached = self._encoded
+        generation = (db_manager.get_scrape_cache_version(), self.sites_version)
+        if cached is not None and cached[1] == generation and now < cached[0].expires_at:
+            for _ in self.sites:
+                metrics.inc('result_cache_requests_total', result='fresh')
+            return cached[0]
+
+        versions = self._revalidate()
+        # 世代はスナップショットを読む前に控える（以降の保存は次回の呼び出しで反映する）
+        generation = (db_manager.get_scrape_cache_version(), self.sites_version)
+        now = get_jst_now()
+        key = generation[1], tuple(
+            (site['name'], entry['updated_at'], entry['checked_at'], self._is_result_stale(site, entry, now))
+            for site in self.sites
+            for entry in [versions.get(site['name'])]
+            if entry is not None
+        )
+        if cached is not None and cached[0].key == key:
+            encoded = cached[0]
+        else:
+            encoded = encode_json(self.build_snapshot(now=now), key)
+        encoded.expires_at = self._get_expires_at(versions, now)
+        self._encoded = (encoded, generation)
+        return encoded
+
+    def refresh(self):
+        """全サイトを更新して結果を返す（実行中の更新があればそれに合流する）"""
+        self._refresh_and_wait(self.sites)
+        return self.build_snapshot()
+
+    def stream(self, force=False, include_cached=True):
+        """
+        サイトごとの結果を用意できたものから順に返すジェネレーター
+        キャッシュ済みの結果をまず返し、期限切れ（force指定時は全サイト）のサイトは更新が終わり次第もう一度返す
+        include_cached=False の場合は更新したサイトの結果のみ返す
+        """
+        now = get_jst_now()
+        entries = db_manager.get_cached_results()
+        if include_cached:
+            for site in self.sites:
+                if site['name'] in entries:
+                    yield self.build_site_result(site, entries[site['name']], now)
+
+        remaining = {
+            site['name'] for site in self.sites
+            if force or self._is_stale(entries, site, now)
+        }
+        if not remaining:
+            return
+
+        subscriber = queue.Queue()
+        try:
+            while remaining:
+                with self._lock:
+                    self._subscribers.add(subscriber)
+                    done, refreshing = self._start_refresh([site for site in self.sites if site['name'] in remaining])
+                    refreshing = set(refreshing)
+                while True:
+                    try:
+                        refresh_done, site_name = subscriber.get(timeout=SCRAPE_LEASE_TTL * 2)
+                    except queue.Empty:
+                        # 更新が終わらない場合は手元の結果を返して終える
+                        yield from self._build_site_results(remaining)
+                        return
+                    if site_name is None:
+                        if refresh_done is done:
+                            break
+                        continue
+                    if site_name in remaining:
+                        remaining.discard(site_name)
+                        yield from self._build_site_results([site_name])
+                # 購読を始める前に保存されたサイト・他のワーカーが更新したサイト
+                finished = refreshing & remaining
+                remaining -= finished
+                yield from self._build_site_results(finished)
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def _build_site_results(self, site_names):
+        """指定サイトの最新のキャッシュから結果を作成"""
+        if not site_names:
+            return
+        now = get_jst_now()
+        entries = db_manager.get_cached_results()
+        for site in self.sites:
+            if site['name'] in site_names and site['name'] in entries:
+                yield self.build_site_result(site, entries[site['name']], now)
+
+    def _is_result_stale(self, site, entry, now):
+        """結果が古いか（有効期限切れ、または最後の確認で取得に失敗した）"""
+        return (
+            (now - entry['updated_at']).total_seconds() > get_site_ttl(site)
+            or entry['checked_at'] > entry['updated_at']
+        )
+
+    def build_site_result(self, site, entry, now):
+        """1サイト分の結果（SiteResult）に現在のサイト設定の表示名等と、更新時刻・鮮度を付けて返す"""
+        result = entry['result']
+        result.display_name = site['display_name']
+        result.image_url = site['image_url']
+        result.last_updated = entry['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
+        result.stale = self._is_result_stale(site, entry, now)
+        return result
+
+    def build_snapshot(self, entries=None, now=None):
+        """APIで返す形式の結果を作成"""
+        if entries is None:
+            entries = db_manager.get_cached_results()
+        now = now or get_jst_now()
+        post_data = []
+        last_updated = None
+        for site in self.sites:
+            entry = entries.get(site['name'])
+            if entry is None:
+                continue
+            post_data.append(self.build_site_result(site, entry, now).to_dict())
+            if last_updated is None or entry['updated_at'] > last_updated:
+                last_updated = entry['updated_at']
+
+        return {
+            'last_updated': last_updated.strftime('%Y-%m-%d %H:%M:%S') if last_updated else None,
+            'post_data': post_data
+        }
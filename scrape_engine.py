@@ -0,0 +1,109 @@
+"""
+サイト横断のスクレイピング実行エンジン
+app.pyとdaily_batch.pyの両方で使用
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+import metrics
+from config import (
+    SCRAPE_MAX_WORKERS,
+    SCRAPE_PER_SITE_CONCURRENCY,
+    SCRAPE_DEADLINE
+)
+from scraper_utils import get_jst_now
+from site_adapters import get_adapter, build_error_result
+from site_registry import get_sites
+
+# 全体の同時実行数を制限する共有スレッドプール（初回使用時に生成）
+_executor = None
+_executor_lock = threading.Lock()
+
+# サイトごとの同時実行数を制限するセマフォ
+_site_semaphores = {}
+_site_semaphores_lock = threading.Lock()
+
+
+def _get_executor():
+    """共有スレッドプールを取得"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=SCRAPE_MAX_WORKERS,
+                thread_name_prefix='scrape'
+            )
+        return _executor
+
+
+def _get_site_semaphore(site_name):
+    """サイトごとのセマフォを取得"""
+    with _site_semaphores_lock:
+        if site_name not in _site_semaphores:
+            _site_semaphores[site_name] = threading.BoundedSemaphore(SCRAPE_PER_SITE_CONCURRENCY)
+        return _site_semaphores[site_name]
+
+
+def scrape_site(site, target_date=None, deadline_at=None):
+    """1サイト分のスクレイピングを実行"""
+    adapter = get_adapter(site)
+
+    target_date_str = None
+    if target_date is not None and 'date_format' in site:
+        target_date_str = target_date.strftime(site['date_format'])
+
+    semaphore = _get_site_semaphore(site['name'])
+    timeout = None if deadline_at is None else max(0, deadline_at - time.monotonic())
+    if not semaphore.acquire(timeout=timeout):
+        return build_error_result(site, 'タイムアウト')
+    try:
+        with metrics.timer('scrape_stage_seconds', site=site['name'], stage='total'):
+            return adapter.scrape(target_date_str)
+    finally:
+        semaphore.release()
+
+
+def iter_scrape_sites(sites=None, target_date=None, deadline=SCRAPE_DEADLINE):
+    """
+    複数サイトを並列にスクレイピングし、終わったサイトから順に (サイト, 結果) を返す
+    締め切りまでに終わらなかったサイトは最後にタイムアウトとして返す
+    """
+    if sites is None:
+        sites = get_sites()
+    if target_date is None:
+        target_date = get_jst_now().date()
+
+    deadline_at = None if deadline is None else time.monotonic() + deadline
+    executor = _get_executor()
+    futures = {executor.submit(scrape_site, site, target_date, deadline_at): site for site in sites}
+
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            site = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"An unexpected error occurred for {site['display_name']}: {e}")
+                result = build_error_result(site, '処理エラー')
+            yield site, result
+    except FuturesTimeoutError:
+        pass
+
+    for future, site in futures.items():
+        future.cancel()
+        print(f"Timed out waiting for {site['display_name']}")
+        yield site, build_error_result(site, 'タイムアウト')
+
+
+def scrape_sites(sites=None, target_date=None, deadline=SCRAPE_DEADLINE):
+    """
+    複数サイトを並列にスクレイピングし、サイト順に結果を返す
+    締め切りまでに終わらなかったサイトはタイムアウトとして返す
+    """
+    if sites is None:
+        sites = get_sites()
+    results = {
+        site['name']: result
+        for site, result in iter_scrape_sites(sites, target_date, deadline)
+    }
+    return [results[site['name']] for site in sites]
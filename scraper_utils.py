@@ -1,12 +1,17 @@
 """
 スクレイピング処理の共通関数
-app.pyとdaily_batch.pyの両方で使用
+サイト種別ごとの処理は site_adapters.py を参照
 """
-import requests
-from bs4 import BeautifulSoup
+import hashlib
+import json
+import logging
 from datetime import datetime
-from math import gcd
-from config import JST
+import db_manager
+import metrics
+from config import JST, CRAWL_INCREMENTAL, CRAWL_ANCHOR_SIZE
+
+# ページごとの経過はデバッグ時のみ出力する
+logger = logging.getLogger(__name__)
 
 def get_jst_now():
     """現在の日本時間を取得"""
@@ -16,201 +21,70 @@ def get_jst_today_str(date_format='%Y/%m/%d'):
     """今日の日付を日本時間で取得"""
     return get_jst_now().strftime(date_format)
 
-def get_post_count_from_element(site):
-    """単一の要素から直接書き込み数を取得"""
-    print(f"Checking '{site['display_name']}'...")
-    headers = {'User-Agent': 'MyScraper/1.0'}
-    
-    try:
-        response = requests.get(site['url'], headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        count_element = soup.select_one(site['selector'])
-        
-        if count_element:
-            count_text = count_element.text.strip()
-            # 数字のみ抽出
-            try:
-                count = int(''.join(filter(str.isdigit, count_text)))
-            except ValueError:
-                count = 0
-                display_text = count_text
-        else:
-            count = 0
-            display_text = '取得失敗'
-            
-    except requests.exceptions.RequestException as e:
-        print(f"  -> Error fetching {site['url']}: {e}")
-        count = 0
-        display_text = 'エラー'
-    except Exception as e:
-        print(f"  -> Unexpected error: {e}")
-        count = 0
-        display_text = '処理エラー'
-
-    return {
-        'display_name': site['display_name'],
-        'count': display_text if 'display_text' in locals() else f"{count}件",
-        'url': site['url'],
-        'type': 'simple',
-        'image_url': site['image_url'],
-        'total_count': count,
-        'male_count': 0,
-        'female_count': 0,
-        'unknown_count': 0
-    }
-
-def get_today_post_count_from_paging_site(site):
-    """ ページングされた掲示板を巡回し、今日の投稿数を集計する """
-    today_str = get_jst_today_str(site['date_format'])
-    today_post_count = 0
-    headers = {'User-Agent': 'MyPagingScraper/1.0'}
-
-    print(f"Checking '{site['display_name']}' (Date: {today_str})...")
-
-    try:
-        for page_num in range(site['start_page'], site['max_page'] + 1, site['step']):
-            target_url = site['base_url'] if page_num == site['start_page'] else f"{site['page_url_prefix']}{page_num}"
-            print(f"  -> page {page_num} ({target_url})")
-
-            response = requests.get(target_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            posts = soup.select('table.layer_pop')
-            
-            if not posts:
-                print("    -> No date info found. Stopping.")
-                break
-
-            is_today_post_found_on_page = False
-            for post in posts:
-                if site['name'] == '440':
-                    post_user_name = post.select_one('div.user-name').text.strip()
-                    post_datetime_str = post.select_one(site['date_selector']).text.strip()
-                    if '440' in post_user_name:
-                        # お店の書き込みは除く
-                        continue
-
-                if today_str in post_datetime_str:
-                    today_post_count += 1
-                    is_today_post_found_on_page = True
-            
-            if not is_today_post_found_on_page and page_num > site['start_page']:
-                print("    -> No more posts for today. Stopping.")
-                break
-    except requests.exceptions.RequestException as e:
-        print(f"    -> Error: {e}")
-    except Exception as e:
-        print(f"    -> Unexpected error: {e}")
-    
-    return {
-        'display_name': site['display_name'],
-        'count': f"{today_post_count}件",
-        'url': site['base_url'],
-        'type': 'simple',
-        'image_url': site['image_url'],
-        'total_count': today_post_count,
-        'male_count': 0,
-        'female_count': 0,
-        'unknown_count': 0
-    }
-
-def get_today_post_count_with_gender(site, target_date_str=None):
-    """性別ごとに指定日の投稿数を集計"""
-    if target_date_str is None:
-        target_date_str = get_jst_today_str(site['date_format'])
-    
-    gender_count = {'男性': 0, '女性': 0, '不明': 0}
-    headers = {'User-Agent': 'MyPagingScraper/1.0'}
-
-    print(f"Checking '{site['display_name']}' with gender (Date: {target_date_str})...")
-
-    try:
-        for page_num in range(site['start_page'], site['max_page'] + 1, site['step']):
-            target_url = site['base_url'] if page_num == site['start_page'] else f"{site['page_url_prefix']}{page_num}"
-            print(f"  -> page {page_num}")
-
-            response = requests.get(target_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            posts = soup.select('dl.contributor')
-            
-            if not posts:
-                print("    -> No posts found. Stopping.")
-                break
-
-            is_target_post_found = False
-            
-            for post in posts:
-                date_element = post.select_one(site['date_selector'])
-                if not date_element:
-                    continue
-                    
-                post_date_str = date_element.text.strip()
-                
-                if target_date_str in post_date_str:
-                    is_target_post_found = True
-                    
-                    gender_element = post.select_one(site['gender_selector'])
-                    if gender_element:
-                        gender_text = gender_element.text.strip()
-                        
-                        if '男' in gender_text or 'male' in gender_text.lower():
-                            gender_count['男性'] += 1
-                        elif '女' in gender_text or 'female' in gender_text.lower():
-                            gender_count['女性'] += 1
-                        else:
-                            gender_count['不明'] += 1
-                    else:
-                        gender_count['不明'] += 1
-                
-                # 古い日付に達したら停止
-                try:
-                    if datetime.strptime(post_date_str, site['date_format']) < datetime.strptime(target_date_str, site['date_format']):
-                        break
-                except ValueError:
-                    continue
-            
-            if not is_target_post_found and page_num > site['start_page']:
-                print("    -> No more posts for today. Stopping.")
-                break
-    except requests.exceptions.RequestException as e:
-        print(f"    -> Error: {e}")
-    except Exception as e:
-        print(f"    -> Unexpected error: {e}")
-
-    total = sum(gender_count.values())
-    
-    # 男女比を計算（最小の自然数比）
-    ratio = "計算不可"
-    if gender_count['男性'] > 0 and gender_count['女性'] > 0:
-        common_divisor = gcd(gender_count['男性'], gender_count['女性'])
-        male_ratio = gender_count['男性'] // common_divisor
-        female_ratio = gender_count['女性'] // common_divisor
-        ratio = f"{male_ratio}:{female_ratio}"
-    elif gender_count['男性'] > 0:
-        ratio = "男性のみ"
-    elif gender_count['女性'] > 0:
-        ratio = "女性のみ"
-    
-    print(f"  -> Total: {total}, Male: {gender_count['男性']}, Female: {gender_count['女性']}, Unknown: {gender_count['不明']}, Ratio: {ratio}")
-    
-    return {
-        'display_name': site['display_name'],
-        'count': f"{total}件",
-        'url': site['base_url'],
-        'type': 'gender',
-        'image_url': site['image_url'],
-        'total_count': total,
-        'male_count': gender_count['男性'],
-        'female_count': gender_count['女性'],
-        'unknown_count': gender_count['不明'],
-        'gender_detail': {
-            'male': gender_count['男性'],
-            'female': gender_count['女性'],
-            'unknown': gender_count['不明'],
-            'ratio': ratio
-        }
-    }
\ No newline at end of file
+def fetch_posts(url, headers, post_selector, field_selectors, site_name=None, parse_key=None):
+    """ページを取得して投稿を抽出（未更新のページは前回の抽出結果を再利用）"""
+    # requests・BeautifulSoup は実際に取得する時に読み込む（get_jst_now だけを使うバッチ・CLIの起動を速くする）
+    from http_client import fetch
+    from page_parser import parse_posts
+
+    metrics.inc('scrape_pages_total', site=site_name)
+    if parse_key is None:
+        parse_key = ('posts', post_selector, tuple(sorted(field_selectors.items())))
+    return fetch(
+        url,
+        headers=headers,
+        parse=lambda html: parse_posts(html, post_selector, field_selectors, include_text=True),
+        parse_key=parse_key,
+        site=site_name
+    )
+
+def get_post_key(post):
+    """投稿を識別するためのキー（抽出した内容のハッシュ）"""
+    return hashlib.sha1(json.dumps(post, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+class IncrementalCrawl:
+    """前回の巡回で見た最新の投稿（high-water mark）に達した時点で巡回を打ち切る差分クロール"""
+
+    def __init__(self, site, target_date_str, enabled=None):
+        self.site_name = site['name']
+        self.target_date_str = target_date_str
+        self.enabled = CRAWL_INCREMENTAL if enabled is None else enabled
+        self.state = db_manager.get_crawl_state(self.site_name, target_date_str) if self.enabled else None
+        self.newest_keys = []
+        self.reached_known_post = False
+
+    def page_keys(self, posts):
+        """ページ内の投稿キーを計算し、今回の最新投稿として記録"""
+        keys = [get_post_key(post) for post in posts]
+        if len(self.newest_keys) < CRAWL_ANCHOR_SIZE:
+            self.newest_keys.extend(keys[:CRAWL_ANCHOR_SIZE - len(self.newest_keys)])
+        return keys
+
+    def is_known_post(self, keys, index):
+        """index番目以降の投稿が前回の最新投稿の並びと一致するか"""
+        if not self.state:
+            return False
+        known_keys = self.state['newest_keys']
+        following = keys[index:index + len(known_keys)]
+        if following and following == known_keys[:len(following)]:
+            self.reached_known_post = True
+        return self.reached_known_post
+
+    def finish(self, total_count, male_count=0, female_count=0, unknown_count=0):
+        """
+        巡回完了時に呼び出し、前回の集計に今回の差分を加えた件数を返す
+        既知の投稿に達しなかった場合（日付が変わった・投稿が削除された等）は今回の全件数をそのまま使う
+        """
+        counts = [total_count, male_count, female_count, unknown_count]
+        newest_keys = self.newest_keys
+        if self.reached_known_post:
+            logger.debug("    -> Reached known post. Added %d new post(s).", total_count)
+            counts[0] += self.state['total_count']
+            counts[1] += self.state['male_count']
+            counts[2] += self.state['female_count']
+            counts[3] += self.state['unknown_count']
+            newest_keys = (self.newest_keys + self.state['newest_keys'])[:CRAWL_ANCHOR_SIZE]
+
+        if self.enabled and newest_keys:
+            db_manager.save_crawl_state(self.site_name, self.target_date_str, newest_keys, *counts)
+        return counts
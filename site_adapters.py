@@ -0,0 +1,485 @@
+"""
+サイト種別ごとのスクレイピング処理（アダプター）
+サイト設定の 'type' に対応するアダプタークラスで取得・解析・集計を行う
+
+新しい店舗はサイト設定の追加（site_registry）だけで対応でき、
+独自の処理が必要な場合のみ SiteAdapter のサブクラスを register_adapter で登録する
+"""
+import logging
+import re
+import threading
+import time
+from datetime import date, timedelta
+import requests
+import metrics
+from http_client import fetch
+from page_parser import select_text
+from pagination import PagePlanner
+from site_result import SiteResult
+from scraper_utils import get_jst_today_str, fetch_posts, get_post_key, IncrementalCrawl
+from config import DAILY_TOP_UP_MAX_DAYS
+
+logger = logging.getLogger(__name__)
+
+# サイト種別 -> アダプタークラス
+ADAPTERS = {}
+
+# 日付書式の各指定子に対応する正規表現
+_DATE_DIRECTIVES = {
+    '%Y': r'(?P<year>\d{4})',
+    '%m': r'(?P<month>\d{1,2})',
+    '%d': r'(?P<day>\d{1,2})',
+}
+
+
+def register_adapter(cls):
+    """アダプタークラスをサイト種別（cls.type）に登録するデコレーター"""
+    ADAPTERS[cls.type] = cls
+    return cls
+
+
+def build_error_result(site, message):
+    """取得に失敗したサイトの結果を作成"""
+    return SiteResult(
+        site['name'],
+        site['display_name'],
+        site.get('url') or site.get('base_url', 'N/A'),
+        site['image_url'],
+        type=site['type'],
+        error=message
+    )
+
+
+class DateParser:
+    """
+    日付書式（%Y/%m/%d等）から作成した正規表現で日付を読み取る
+    投稿ごとに strptime で書式を解釈し直さないよう、サイトごとに1度だけ作成する
+    """
+
+    def __init__(self, date_format):
+        self.date_format = date_format
+        pattern = ''
+        for token in re.split(r'(%.)', date_format):
+            if token in _DATE_DIRECTIVES:
+                pattern += _DATE_DIRECTIVES[token]
+            elif token.startswith('%'):
+                raise ValueError(f"Unsupported date directive '{token}' in {date_format}")
+            else:
+                pattern += re.escape(token)
+        self.pattern = re.compile(pattern)
+
+    def parse(self, text):
+        """文字列中の最初の日付を返す（前後に曜日・時刻等があってもよい。読み取れない場合はNone）"""
+        match = self.pattern.search(text)
+        if not match:
+            return None
+        try:
+            return date(int(match.group('year')), int(match.group('month')), int(match.group('day')))
+        except ValueError:
+            return None
+
+
+class SiteAdapter:
+    """サイト種別ごとのスクレイピング処理の基底クラス"""
+
+    type = None
+    result_type = 'simple'
+    user_agent = 'MyScraper/1.0'
+    # 過去の日付の件数を取得できるか（現在値しか分からないサイトはFalse）
+    supports_backfill = False
+    # サイト設定に必須の項目
+    required_fields = ('name', 'display_name', 'type', 'image_url')
+
+    def __init__(self, site):
+        self.site = site
+        self.name = site['name']
+        self.headers = {'User-Agent': site.get('user_agent', self.user_agent)}
+
+    def validate(self):
+        """サイト設定の値を検証（誤りがあればValueError）"""
+        if not isinstance(self.name, str) or not self.name:
+            raise ValueError("'name' must be a non-empty string")
+
+    @property
+    def url(self):
+        """結果に表示するURL"""
+        return self.site['url']
+
+    def scrape(self, target_date_str=None):
+        """指定日（省略時は今日）の書き込み数を取得して結果を返す"""
+        raise NotImplementedError
+
+    def build_result(self, counts, count_text=None):
+        """APIとバッチで使う結果を作成（countsは 合計, 男性, 女性, 不明）"""
+        total, male, female, unknown = counts
+        return SiteResult(
+            self.name,
+            self.site['display_name'],
+            self.url,
+            self.site['image_url'],
+            type=self.result_type,
+            total_count=total,
+            male_count=male,
+            female_count=female,
+            unknown_count=unknown,
+            count_text=count_text
+        )
+
+
+@register_adapter
+class ElementAdapter(SiteAdapter):
+    """ページ内の1つの要素から現在の書き込み数を直接取得（現在値のみのため日付指定は無視）"""
+
+    type = 'element'
+    required_fields = SiteAdapter.required_fields + ('url', 'selector')
+
+    def __init__(self, site):
+        super().__init__(site)
+        self.selector = site['selector']
+        self.parse_key = ('element', self.selector)
+
+    def _select(self, html):
+        return select_text(html, self.selector)
+
+    def scrape(self, target_date_str=None):
+        print(f"Checking '{self.site['display_name']}'...")
+        count = 0
+        count_text = None
+        try:
+            text = fetch(self.url, headers=self.headers, parse=self._select, parse_key=self.parse_key, site=self.name)
+            if text is None:
+                count_text = '取得失敗'
+            else:
+                # 数字のみ抽出
+                try:
+                    count = int(''.join(filter(str.isdigit, text)))
+                except ValueError:
+                    count_text = text
+        except requests.exceptions.RequestException as e:
+            print(f"  -> Error fetching {self.url}: {e}")
+            return build_error_result(self.site, 'エラー')
+        except Exception as e:
+            print(f"  -> Unexpected error: {e}")
+            return build_error_result(self.site, '処理エラー')
+
+        return self.build_result((count, 0, 0, 0), count_text)
+
+
+@register_adapter
+class PagingBBSAdapter(SiteAdapter):
+    """
+    ページングされた掲示板を巡回し、指定日の投稿数を集計
+    サイト設定の 'exclude' に {'selector': ..., 'contains': ...} を指定すると、
+    その要素に文字列を含む投稿（お店の書き込み等）を除外する
+    """
+
+    type = 'paging_bbs'
+    user_agent = 'MyPagingScraper/1.0'
+    supports_backfill = True
+    post_selector = 'table.layer_pop'
+    # 指定日より古い投稿に達したら巡回を打ち切るか（新しい順に並ぶ掲示板のみ）
+    stop_at_older = True
+    required_fields = SiteAdapter.required_fields + (
+        'base_url', 'page_url_prefix', 'start_page', 'max_page', 'step', 'date_selector', 'date_format'
+    )
+
+    def __init__(self, site):
+        super().__init__(site)
+        self.post_selector = site.get('post_selector', self.post_selector)
+        self.exclude = site.get('exclude')
+        self.field_selectors = self.build_field_selectors()
+        self.parse_key = ('posts', self.post_selector, tuple(sorted(self.field_selectors.items())))
+        self.date_format = site['date_format']
+        self.date_parser = DateParser(self.date_format)
+        self.stop_at_older = site.get('stop_at_older', self.stop_at_older)
+
+    @property
+    def url(self):
+        return self.site['base_url']
+
+    def validate(self):
+        super().validate()
+        site = self.site
+        for field in ('start_page', 'max_page', 'step'):
+            if not isinstance(site[field], int) or site[field] < 0:
+                raise ValueError(f"'{field}' must be a non-negative integer")
+        if site['step'] == 0:
+            raise ValueError("'step' must be positive")
+        if site['max_page'] < site['start_page']:
+            raise ValueError("'max_page' must not be less than 'start_page'")
+        if self.exclude and not {'selector', 'contains'} <= set(self.exclude):
+            raise ValueError("'exclude' needs 'selector' and 'contains'")
+
+    def build_field_selectors(self):
+        """投稿から抽出するフィールドとそのセレクター"""
+        fields = {'date': self.site['date_selector']}
+        if self.exclude:
+            fields['exclude'] = self.exclude['selector']
+        return fields
+
+    def page_urls(self, max_page=None):
+        """巡回するページ番号とURLを順に返す（max_page省略時はサイト設定の上限まで）"""
+        site = self.site
+        if max_page is None:
+            max_page = site['max_page']
+        for page_num in range(site['start_page'], max_page + 1, site['step']):
+            if page_num == site['start_page']:
+                yield page_num, site['base_url']
+            else:
+                yield page_num, f"{site['page_url_prefix']}{page_num}"
+
+    def fetch_page(self, url):
+        """1ページを取得して投稿を抽出"""
+        return fetch_posts(url, self.headers, self.post_selector, self.field_selectors,
+                           self.name, parse_key=self.parse_key)
+
+    def is_excluded(self, post):
+        """集計から除外する投稿か"""
+        return bool(self.exclude) and self.exclude['contains'] in (post.get('exclude') or '')
+
+    def count_post(self, post, counts):
+        """指定日の投稿を集計に加える"""
+        counts[0] += 1
+
+    def scrape(self, target_date_str=None):
+        target_date_str = target_date_str or get_jst_today_str(self.date_format)
+        target_date = self.date_parser.parse(target_date_str)
+        counts = [0, 0, 0, 0]
+        # 同じページに載っている指定日より前の投稿も日付ごとに数える
+        day_counts = {}
+        # 巡回が達した日付（最後に巡回したページの最後の投稿の日付。これより新しい日は全て数え終えている）
+        reached_date = None
+
+        self.log_start(target_date_str)
+        crawl = IncrementalCrawl(self.site, target_date_str)
+        # 差分クロールで前回の続きから巡回する場合は、時間帯ごとに学習した差分のページ数だけ先読みする
+        planner = PagePlanner(self.name, self.page_urls(), self.fetch_page, target_date, incremental=bool(crawl.state))
+        stop_reason = 'max_page'
+
+        try:
+            for page_num, target_url, posts in planner.pages():
+                logger.debug("  -> page %s (%s)", page_num, target_url)
+
+                if not posts:
+                    logger.debug("    -> No posts found. Stopping.")
+                    stop_reason = 'no_posts'
+                    break
+
+                count_started = time.perf_counter()
+                keys = crawl.page_keys(posts)
+                is_target_post_found = False
+                # ページ内で最後に数えた投稿の日付（固定表示の古い投稿がページの先頭にある場合もあるため最後の投稿で判断する）
+                page_last_date = None
+                for index, post in enumerate(posts):
+                    if crawl.is_known_post(keys, index):
+                        break
+
+                    post_date = self.date_parser.parse(post['date']) if post['date'] is not None else None
+                    if post_date is None:
+                        continue
+                    if self.is_excluded(post):
+                        continue
+                    page_last_date = post_date
+
+                    if target_date is not None and post_date < target_date:
+                        self.count_post(post, day_counts.setdefault(post_date, [0, 0, 0, 0]))
+                    elif post_date == target_date:
+                        self.count_post(post, counts)
+                        is_target_post_found = True
+                metrics.observe('scrape_stage_seconds', time.perf_counter() - count_started, site=self.name, stage='count')
+                if page_last_date is not None:
+                    reached_date = page_last_date
+
+                if crawl.reached_known_post:
+                    stop_reason = 'known_post'
+                    break
+                # 新しい順に並んでいるため、ページの最後の投稿が指定日より古ければ次のページは取得しない
+                if (self.stop_at_older and target_date is not None
+                        and page_last_date is not None and page_last_date < target_date):
+                    logger.debug("    -> Reached posts older than the target date. Stopping.")
+                    stop_reason = 'older_post'
+                    break
+                if not is_target_post_found and page_num > self.site['start_page']:
+                    logger.debug("    -> No more posts for today. Stopping.")
+                    stop_reason = 'no_target_posts'
+                    break
+
+            counts = crawl.finish(*counts)
+        except requests.exceptions.RequestException as e:
+            print(f"    -> Error: {e}")
+            stop_reason = 'error'
+            error = 'エラー'
+        except Exception as e:
+            print(f"    -> Unexpected error: {e}")
+            stop_reason = 'error'
+            error = '処理エラー'
+        planner.finish(stop_reason)
+        metrics.inc('scrape_stop_total', site=self.name, reason=stop_reason)
+        if stop_reason == 'error':
+            # 途中までの件数は返さない（前回の結果を使う）
+            return build_error_result(self.site, error)
+
+        result = self.build_result(counts)
+        result.day_counts = self.complete_day_counts(day_counts, reached_date, target_date)
+        return result
+
+    def complete_day_counts(self, day_counts, reached_date, target_date):
+        """
+        前日以前の件数のうち、その日の投稿をすべて数え終えた日の分を返す
+        新しい順に並ぶ掲示板で、巡回が達した日付（reached_date）より新しい日（投稿が無かった日は0件）が対象
+        ページの先頭の固定表示の古い投稿では巡回が達したとみなさない（その間の日を0件にしない）
+        """
+        if not self.stop_at_older or reached_date is None or target_date is None:
+            return {}
+        first_day = max(reached_date + timedelta(days=1), target_date - timedelta(days=DAILY_TOP_UP_MAX_DAYS))
+        completed = {}
+        day = first_day
+        while day < target_date:
+            completed[day] = tuple(day_counts.get(day, (0, 0, 0, 0)))
+            day += timedelta(days=1)
+        return completed
+
+    def backfill(self, start_date, end_date, max_pages, checkpoint=None, save_checkpoint=None):
+        """
+        1回の巡回で start_date〜end_date の投稿を日付ごとに集計する
+        checkpoint（save_checkpointに渡された途中経過）を指定するとその続きから巡回する
+        戻り値: {'buckets': {日付: [合計, 男性, 女性, 不明]}, 'complete_from': 集計が確定した最も古い日付（無ければNone）}
+        """
+        state = checkpoint or {'next_index': 0, 'buckets': {}, 'last_keys': [], 'oldest_date': None}
+        buckets = state['buckets']
+        oldest_date = date.fromisoformat(state['oldest_date']) if state['oldest_date'] else None
+        last_keys = set(state['last_keys'])
+        max_page = self.site['start_page'] + self.site['step'] * (max_pages - 1)
+        page_urls = list(self.page_urls(max_page))
+        stop_reason = 'max_page'
+
+        print(f"Backfilling '{self.site['display_name']}' ({start_date} - {end_date}) from page {state['next_index'] + 1}...")
+        for index in range(state['next_index'], len(page_urls)):
+            page_num, target_url = page_urls[index]
+            logger.debug("  -> page %s (%s)", page_num, target_url)
+            posts = self.fetch_page(target_url)
+            if not posts:
+                stop_reason = 'no_posts'
+                break
+
+            keys = [get_post_key(post) for post in posts]
+            for key, post in zip(keys, posts):
+                # 中断後の再開時に、新しい投稿で後ろにずれた前ページの投稿を二重に数えない
+                if key in last_keys or post['date'] is None or self.is_excluded(post):
+                    continue
+                post_date = self.date_parser.parse(post['date'])
+                if post_date is None:
+                    continue
+                # 巡回が達した日付はページの最後の投稿で決める（固定表示の古い投稿がページの先頭にある場合もある）
+                oldest_date = post_date
+                if start_date <= post_date <= end_date:
+                    self.count_post(post, buckets.setdefault(post_date.isoformat(), [0, 0, 0, 0]))
+
+            last_keys = set(keys)
+            if save_checkpoint:
+                save_checkpoint({
+                    'next_index': index + 1,
+                    'buckets': buckets,
+                    'last_keys': keys,
+                    'oldest_date': oldest_date.isoformat() if oldest_date else None
+                })
+            if self.stop_at_older and oldest_date is not None and oldest_date < start_date:
+                stop_reason = 'older_post'
+                break
+
+        if stop_reason == 'older_post':
+            # 開始日より古い投稿に達した場合は期間内を全て数えている
+            complete_from = start_date
+        else:
+            # 上限のページ・掲示板の最後に達した場合、巡回が達した日付は途中までしか数えていない可能性がある
+            # （それより前の日付は件数が分からないため保存しない）
+            complete_from = oldest_date + timedelta(days=1) if oldest_date else None
+        print(f"  -> {sum(counts[0] for counts in buckets.values())} posts on {len(buckets)} day(s), stopped by {stop_reason}")
+        return {'buckets': buckets, 'complete_from': complete_from, 'stop_reason': stop_reason}
+
+    def log_start(self, target_date_str):
+        print(f"Checking '{self.site['display_name']}' (Date: {target_date_str})...")
+
+
+@register_adapter
+class GenderPagingBBSAdapter(PagingBBSAdapter):
+    """投稿者の性別ごとに指定日の投稿数を集計する掲示板"""
+
+    type = 'paging_bbs_gender'
+    result_type = 'gender'
+    post_selector = 'dl.contributor'
+    required_fields = PagingBBSAdapter.required_fields + ('gender_selector',)
+    # 性別欄の文字列 -> 集計先（countsの添字）。先に一致したものを採用し、どれにも一致しなければ不明
+    gender_keywords = ((1, ('男', 'male')), (2, ('女', 'female')))
+
+    def build_field_selectors(self):
+        fields = super().build_field_selectors()
+        fields['gender'] = self.site['gender_selector']
+        return fields
+
+    def count_post(self, post, counts):
+        counts[0] += 1
+        counts[self.classify_gender(post['gender'])] += 1
+
+    def classify_gender(self, gender_text):
+        """性別欄の文字列から集計先の添字を返す"""
+        if gender_text is not None:
+            lowered = gender_text.lower()
+            for index, keywords in self.gender_keywords:
+                if any(keyword in lowered for keyword in keywords):
+                    return index
+        return 3
+
+    def log_start(self, target_date_str):
+        print(f"Checking '{self.site['display_name']}' with gender (Date: {target_date_str})...")
+
+    def build_result(self, counts, count_text=None):
+        result = super().build_result(counts, count_text)
+        print(f"  -> Total: {result.total_count}, Male: {result.male_count}, Female: {result.female_count}, "
+              f"Unknown: {result.unknown_count}, Ratio: {result.ratio}")
+        return result
+
+
+# サイト名 -> 作成済みのアダプター（セレクター・日付書式の準備はサイトごとに1度だけ）
+_adapters = {}
+_adapters_lock = threading.Lock()
+
+
+def create_adapter(site):
+    """サイト設定に対応するアダプターを作成"""
+    cls = ADAPTERS.get(site['type'])
+    if cls is None:
+        raise ValueError(f"Unknown site type: {site['type']}")
+    return cls(site)
+
+
+def validate_site(site):
+    """サイト設定を検証し、作成したアダプターを返す（誤りがあればValueError）"""
+    if not isinstance(site, dict):
+        raise ValueError("Site definition must be an object")
+    cls = ADAPTERS.get(site.get('type'))
+    if cls is None:
+        raise ValueError(f"Unknown site type: {site.get('type')}")
+    missing = [field for field in cls.required_fields if field not in site]
+    if missing:
+        raise ValueError(f"Missing fields for {site.get('name')}: {', '.join(missing)}")
+    try:
+        adapter = cls(site)
+        adapter.validate()
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid site definition for {site.get('name')}: {e}") from e
+    return adapter
+
+
+def get_adapter(site):
+    """サイトのアダプターを取得（サイト設定が差し替えられた場合は作り直す）"""
+    with _adapters_lock:
+        adapter = _adapters.get(site['name'])
+        if adapter is None or adapter.site is not site:
+            adapter = _adapters[site['name']] = create_adapter(site)
+        return adapter
+
+
+def build_adapters(sites):
+    """起動時に全サイトのアダプターを作成（設定の誤りをここで検出する）"""
+    return [get_adapter(site) for site in sites]
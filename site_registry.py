@@ -0,0 +1,136 @@
+"""
+店舗（サイト）設定の管理
+サイト設定はDBの sites テーブルに保存し、稼働中のワーカーもバージョン番号の変化を検出して再読み込みする
+（再起動しないため、スクレイピング結果のキャッシュやスケジューラーはそのまま使い続ける）
+config.TARGET_SITES はテーブルが空の場合の初期値としてのみ使う
+
+使い方:
+  python site_registry.py list
+  python site_registry.py set site.json [--position 3]
+  python site_registry.py delete <name>
+"""
+import argparse
+import json
+import threading
+import time
+import db_manager
+from config import SITES_RELOAD_INTERVAL
+
+# 読み込み済みのサイト設定とそのバージョン番号
+_sites = None
+_version = None
+# 最後にバージョン番号を確認した時刻（time.monotonic）
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _load(version):
+    """
+    サイト設定を読み込む
+    アダプターは取得時（site_adapters.get_adapter）に作成するため、ここでは requests 等を読み込まない
+    """
+    global _sites, _version
+    previous = {site['name']: site for site in _sites or []}
+    sites = []
+    for site in db_manager.get_sites():
+        # 変更の無いサイトは同じ設定オブジェクトを使い続け、作成済みのアダプターを再利用する
+        old = previous.get(site['name'])
+        sites.append(old if old == site else site)
+    if _version is not None:
+        print(f"Site configuration reloaded (version {_version} -> {version})")
+    _sites, _version = sites, version
+
+
+def get_sites():
+    """
+    現在のサイト設定の一覧
+    DBのバージョン番号は SITES_RELOAD_INTERVAL 秒に1回だけ確認し、変わっていれば読み直す
+    """
+    global _checked_at
+    now = time.monotonic()
+    if _sites is not None and now - _checked_at < SITES_RELOAD_INTERVAL:
+        return _sites
+    with _lock:
+        if _sites is None or now - _checked_at >= SITES_RELOAD_INTERVAL:
+            version = db_manager.get_config_version(db_manager.SITES_CONFIG_NAME)
+            if _sites is None or version != _version:
+                _load(version)
+            _checked_at = now
+    return _sites
+
+
+def get_sites_version():
+    """読み込み済みのサイト設定のバージョン番号"""
+    get_sites()
+    return _version
+
+
+def get_site(name):
+    """サイト名に対応する設定（無ければNone）"""
+    for site in get_sites():
+        if site['name'] == name:
+            return site
+    return None
+
+
+def reload_sites():
+    """次の get_sites() でバージョン番号を確認し直す"""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def save_site(site, position=None):
+    """サイト設定を検証して保存し、新しいバージョン番号を返す（誤りがあればValueError）"""
+    from site_adapters import validate_site
+
+    validate_site(site)
+    version = db_manager.save_site(site, position)
+    reload_sites()
+    return version
+
+
+def delete_site(name):
+    """サイト設定を削除し、新しいバージョン番号を返す（存在しなければValueError）"""
+    version = db_manager.delete_site(name)
+    if version is None:
+        raise ValueError(f"不明なサイトです: {name}")
+    reload_sites()
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description='サイト設定の管理（稼働中のワーカーにも反映される）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='サイト設定を表示')
+    set_parser = subparsers.add_parser('set', help='JSONファイルのサイト設定を追加・更新')
+    set_parser.add_argument('file', help='サイト設定のJSONファイル（1サイト分のオブジェクト）')
+    set_parser.add_argument('--position', type=int, help='表示順（省略時は既存の順番・末尾）')
+    delete_parser = subparsers.add_parser('delete', help='サイト設定を削除')
+    delete_parser.add_argument('name', help='サイト名')
+    args = parser.parse_args()
+
+    db_manager.init_db()
+    if args.command == 'list':
+        print(json.dumps(
+            {'version': get_sites_version(), 'sites': get_sites()},
+            ensure_ascii=False,
+            indent=2
+        ))
+        return
+
+    try:
+        if args.command == 'set':
+            with open(args.file, encoding='utf-8') as f:
+                site = json.load(f)
+            version = save_site(site, args.position)
+            print(f"Saved {site['name']} (version {version})")
+        else:
+            version = delete_site(args.name)
+            print(f"Deleted {args.name} (version {version})")
+    except ValueError as e:
+        print(f"✗ {e}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+1サイト分のスクレイピング結果
+スクレイパー・キャッシュ・DB・APIで共通に使う。表示用の文字列や男女比は保存せず、出力時に計算する
+"""
+from math import gcd
+
+
+class SiteResult:
+    """1サイト分のスクレイピング結果"""
+
+    __slots__ = (
+        'site_name',
+        'display_name',
+        'url',
+        'image_url',
+        'type',
+        'total_count',
+        'male_count',
+        'female_count',
+        'unknown_count',
+        'count_text',
+        'error',
+        'day_counts',
+        'last_updated',
+        'stale'
+    )
+
+    # キャッシュに保存するフィールド（前日以前の件数と、表示時の状態 last_updated / stale は保存しない）
+    RECORD_FIELDS = __slots__[:-3]
+
+    def __init__(self, site_name, display_name, url, image_url, type='simple',
+                 total_count=0, male_count=0, female_count=0, unknown_count=0,
+                 count_text=None, error=None, day_counts=None, last_updated=None, stale=False):
+        self.site_name = site_name
+        self.display_name = display_name
+        self.url = url
+        self.image_url = image_url
+        self.type = type
+        self.total_count = total_count
+        self.male_count = male_count
+        self.female_count = female_count
+        self.unknown_count = unknown_count
+        # 件数の代わりに表示する文字列（数値を読み取れなかった場合など）
+        self.count_text = count_text
+        self.error = error
+        # 同じ巡回で全件を数え終えた前日以前の件数 {date: (合計, 男性, 女性, 不明)}
+        self.day_counts = day_counts
+        self.last_updated = last_updated
+        self.stale = stale
+
+    def __repr__(self):
+        return f"SiteResult({self.site_name!r}, total={self.total_count}, error={self.error!r})"
+
+    @property
+    def counts(self):
+        """(合計, 男性, 女性, 不明)"""
+        return self.total_count, self.male_count, self.female_count, self.unknown_count
+
+    @property
+    def count(self):
+        """表示用の件数"""
+        if self.error is not None:
+            return self.error
+        if self.count_text is not None:
+            return self.count_text
+        return f"{self.total_count}件"
+
+    @property
+    def ratio(self):
+        """男女比（最小の自然数比）"""
+        male, female = self.male_count, self.female_count
+        if male > 0 and female > 0:
+            common_divisor = gcd(male, female)
+            return f"{male // common_divisor}:{female // common_divisor}"
+        if male > 0:
+            return "男性のみ"
+        if female > 0:
+            return "女性のみ"
+        return "計算不可"
+
+    def to_record(self):
+        """キャッシュに保存する形式（値が既定値のフィールドは省く）"""
+        record = {
+            'site_name': self.site_name,
+            'display_name': self.display_name,
+            'url': self.url,
+            'image_url': self.image_url,
+            'type': self.type,
+            'total_count': self.total_count
+        }
+        for field in ('male_count', 'female_count', 'unknown_count'):
+            value = getattr(self, field)
+            if value:
+                record[field] = value
+        if self.count_text is not None:
+            record['count_text'] = self.count_text
+        if self.error is not None:
+            record['error'] = self.error
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        """to_record() の形式から復元"""
+        return cls(**{field: record[field] for field in cls.RECORD_FIELDS if field in record})
+
+    def to_dict(self):
+        """APIで返す形式"""
+        data = {
+            'site_name': self.site_name,
+            'display_name': self.display_name,
+            'count': self.count,
+            'url': self.url,
+            'type': self.type,
+            'image_url': self.image_url
+        }
+        if self.error is not None:
+            data['error'] = self.error
+        else:
+            data['total_count'] = self.total_count
+            data['male_count'] = self.male_count
+            data['female_count'] = self.female_count
+            data['unknown_count'] = self.unknown_count
+            if self.type == 'gender':
+                data['gender_detail'] = {
+                    'male': self.male_count,
+                    'female': self.female_count,
+                    'unknown': self.unknown_count,
+                    'ratio': self.ratio
+                }
+        if self.last_updated is not None:
+            data['last_updated'] = self.last_updated
+            data['stale'] = self.stale
+        return data
@@ -1,113 +1,186 @@
 // APIからデータを取得して画面に表示するJavaScript
-async function fetchData(forceRefresh = false) {
-    const postList = document.getElementById('post-list');
-    const updatedTime = document.getElementById('updated-time');
-    const reloadButton = document.getElementById('reload');
-    
-    // ローディング表示
+
+// 同じ曜日の平常値との比較の行を作成（比較と同じ日の分析結果がある場合のみ）
+function createAnalyticsRow(comparison, analysis) {
+    if (!analysis || analysis.zscore === null || analysis.date !== comparison.today.record_date) return '';
+
+    const label = analysis.anomaly === 'high' ? 'いつもより多い' : analysis.anomaly === 'low' ? 'いつもより少ない' : '平常どおり';
+    const className = analysis.anomaly === 'high' ? 'positive' : analysis.anomaly === 'low' ? 'negative' : 'neutral';
+    const zscore = analysis.zscore > 0 ? `+${analysis.zscore.toFixed(1)}` : analysis.zscore.toFixed(1);
+    return `
+        <div class="comparison-row">
+            <span class="comparison-label">同曜日平均比:</span>
+            <span class="comparison-value ${className}">${label} (${zscore}σ)</span>
+        </div>
+    `;
+}
+
+// 比較情報の表示部分を作成
+function createComparisonInfo(comparison, analysis) {
+    const comparisonDiv = document.createElement('div');
+    comparisonDiv.className = 'comparison-info';
+
+    const yesterdayComp = comparison.yesterday_comparison;
+    const lastWeekComp = comparison.last_week_comparison;
+
+    comparisonDiv.innerHTML = `
+        <div class="comparison-row">
+            <span class="comparison-label">前日比:</span>
+            <span class="comparison-value ${yesterdayComp.diff > 0 ? 'positive' : yesterdayComp.diff < 0 ? 'negative' : 'neutral'}">
+                ${yesterdayComp.diff_text} (${yesterdayComp.rate_text})
+            </span>
+        </div>
+        <div class="comparison-row">
+            <span class="comparison-label">前週比:</span>
+            <span class="comparison-value ${lastWeekComp.diff > 0 ? 'positive' : lastWeekComp.diff < 0 ? 'negative' : 'neutral'}">
+                ${lastWeekComp.diff_text} (${lastWeekComp.rate_text})
+            </span>
+        </div>
+        ${createAnalyticsRow(comparison, analysis)}
+    `;
+    return comparisonDiv;
+}
+
+// 1サイト分のカードを作成
+function createCard(site) {
+    const card = document.createElement('div');
+    card.className = 'card';
+    card.dataset.siteName = site.site_name;
+    card.style.backgroundImage = `url('${site.image_url}')`;
+
+    const cardContent = document.createElement('div');
+    cardContent.className = 'card-content';
+
+    // 店名
+    const titleElement = document.createElement('div');
+    titleElement.className = 'card-title';
+    if (site.url) {
+        titleElement.innerHTML = `<a href="${site.url}" target="_blank" rel="noopener noreferrer">${site.display_name}</a>`;
+    } else {
+        titleElement.textContent = site.display_name;
+    }
+
+    // 件数
+    const countElement = document.createElement('div');
+    countElement.className = 'card-count';
+    countElement.textContent = site.count === undefined ? '取得中...' : site.count;
+
+    cardContent.appendChild(titleElement);
+    cardContent.appendChild(countElement);
+
+    // 性別詳細がある場合
+    if (site.type === 'gender' && site.gender_detail) {
+        const detail = site.gender_detail;
+
+        const genderDiv = document.createElement('div');
+        genderDiv.className = 'gender-detail';
+
+        genderDiv.innerHTML = `
+            <span class="gender-item">👨 ${detail.male}件</span>
+            <span class="gender-item">👩 ${detail.female}件</span>
+            <span class="gender-item">❓ ${detail.unknown}件</span>
+        `;
+
+        const ratioElement = document.createElement('div');
+        ratioElement.className = 'gender-ratio';
+        ratioElement.textContent = `男女比率 ${detail.ratio}`;
+
+        cardContent.appendChild(genderDiv);
+        cardContent.appendChild(ratioElement);
+    }
+
+    if (site.comparison) {
+        cardContent.appendChild(createComparisonInfo(site.comparison));
+    }
+
+    card.appendChild(cardContent);
+    return card;
+}
+
+// サイトのカードを表示（既にあれば置き換える）
+function renderCard(postList, site) {
+    const card = createCard(site);
+    const existing = postList.querySelector(`.card[data-site-name="${CSS.escape(site.site_name)}"]`);
+    if (existing) {
+        // 取得済みの比較情報は引き継ぐ
+        const comparison = existing.querySelector('.comparison-info');
+        if (comparison && !card.querySelector('.comparison-info')) {
+            card.querySelector('.card-content').appendChild(comparison);
+        }
+        postList.replaceChild(card, existing);
+    } else {
+        postList.appendChild(card);
+    }
+}
+
+function showLoading(postList, updatedTime, reloadButton) {
     postList.innerHTML = '<div class="card loading-card"><div class="card-content"><p>データを読み込んでいます...</p></div></div>';
     updatedTime.textContent = '';
     reloadButton.disabled = true;
     reloadButton.textContent = '読み込み中...';
-    
+}
+
+function finishLoading(reloadButton) {
+    reloadButton.disabled = false;
+    reloadButton.textContent = '更新';
+}
+
+// 強制更新などのジョブが終わるまで待つ
+async function waitForJob(statusUrl) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        if (!response.ok) {
+            throw new Error('更新状況の取得に失敗しました。');
+        }
+        const job = await response.json();
+        if (job.status === 'done') return job;
+        if (job.status === 'error') {
+            throw new Error(job.error || '更新に失敗しました。');
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+// 全サイトの結果をまとめて取得（ストリームが使えない場合）
+async function fetchData(forceRefresh = false) {
+    const postList = document.getElementById('post-list');
+    const updatedTime = document.getElementById('updated-time');
+    const reloadButton = document.getElementById('reload');
+
+    showLoading(postList, updatedTime, reloadButton);
+
     try {
-        const endpoint = forceRefresh ? '/api/refresh' : '/api/posts';
-        const response = await fetch(endpoint);
-        
+        if (forceRefresh) {
+            // 強制更新はジョブとして実行されるため、終わるのを待ってから取得する
+            const refreshResponse = await fetch('/api/refresh');
+            if (!refreshResponse.ok) {
+                throw new Error('更新の開始に失敗しました。');
+            }
+            const job = await refreshResponse.json();
+            await waitForJob(job.status_url);
+        }
+
+        const response = await fetch('/api/posts');
+
         if (!response.ok) {
             throw new Error('データの取得に失敗しました。');
         }
-        
-        const result = await response.json();
-        console.log('API Response:', result);
-        
-        const data = forceRefresh && result.data ? result.data : result;
-        
+
+        const data = await response.json();
+        console.log('API Response:', data);
+
         if (!data || !data.post_data) {
             throw new Error('データ形式が正しくありません。');
         }
 
         updatedTime.textContent = `最終更新: ${data.last_updated}`;
-        
+
         // カードグリッドをクリア
         postList.innerHTML = '';
         postList.className = 'card-grid'
 
         // 各サイトのカードを作成
-        data.post_data.forEach(site => {
-            const card = document.createElement('div');
-            card.className = 'card';
-            card.style.backgroundImage = `url('${site.image_url}')`;
-
-            const cardContent = document.createElement('div');
-            cardContent.className = 'card-content';
-            
-            // 店名
-            const titleElement = document.createElement('div');
-            titleElement.className = 'card-title';
-            if (site.url) {
-                titleElement.innerHTML = `<a href="${site.url}" target="_blank" rel="noopener noreferrer">${site.display_name}</a>`;
-            } else {
-                titleElement.textContent = site.display_name;
-            }
-            
-            // 件数
-            const countElement = document.createElement('div');
-            countElement.className = 'card-count';
-            countElement.textContent = site.count;
-            
-            cardContent.appendChild(titleElement);
-            cardContent.appendChild(countElement);
-            
-            // 性別詳細がある場合
-            if (site.type === 'gender' && site.gender_detail) {
-                const detail = site.gender_detail;
-                
-                const genderDiv = document.createElement('div');
-                genderDiv.className = 'gender-detail';
-                
-                genderDiv.innerHTML = `
-                    <span class="gender-item">👨 ${detail.male}件</span>
-                    <span class="gender-item">👩 ${detail.female}件</span>
-                    <span class="gender-item">❓ ${detail.unknown}件</span>
-                `;
-                
-                const ratioElement = document.createElement('div');
-                ratioElement.className = 'gender-ratio';
-                ratioElement.textContent = `男女比率 ${detail.ratio}`;
-                
-                cardContent.appendChild(genderDiv);
-                cardContent.appendChild(ratioElement);
-            }
-
-            if (site.comparison) {
-                const comparisonDiv = document.createElement('div');
-                comparisonDiv.className = 'comparison-info';
-                
-                const yesterdayComp = site.comparison.yesterday_comparison;
-                const lastWeekComp = site.comparison.last_week_comparison;
-                
-                comparisonDiv.innerHTML = `
-                    <div class="comparison-row">
-                        <span class="comparison-label">前日比:</span>
-                        <span class="comparison-value ${yesterdayComp.diff > 0 ? 'positive' : yesterdayComp.diff < 0 ? 'negative' : 'neutral'}">
-                            ${yesterdayComp.diff_text} (${yesterdayComp.rate_text})
-                        </span>
-                    </div>
-                    <div class="comparison-row">
-                        <span class="comparison-label">前週比:</span>
-                        <span class="comparison-value ${lastWeekComp.diff > 0 ? 'positive' : lastWeekComp.diff < 0 ? 'negative' : 'neutral'}">
-                            ${lastWeekComp.diff_text} (${lastWeekComp.rate_text})
-                        </span>
-                    </div>
-                `;
-                
-                cardContent.appendChild(comparisonDiv);
-            }
-
-            card.appendChild(cardContent);
-            postList.appendChild(card);
-        });
+        data.post_data.forEach(site => renderCard(postList, site));
 
         // 比較データも取得
         fetchComparison();
@@ -115,54 +188,90 @@ async function fetchData(forceRefresh = false) {
         postList.innerHTML = `<div class="card error-card"><div class="card-content"><p>エラー: ${error.message}</p></div></div>`;
         console.error('Fetch error:', error);
     } finally {
-        reloadButton.disabled = false;
-        reloadButton.textContent = '更新';
+        finishLoading(reloadButton);
     }
 }
 
+// サイトごとの結果を取得でき次第表示（Server-Sent Events）
+let currentStream = null;
+
+function streamData(forceRefresh = false) {
+    if (!window.EventSource) {
+        fetchData(forceRefresh);
+        return;
+    }
+
+    const postList = document.getElementById('post-list');
+    const updatedTime = document.getElementById('updated-time');
+    const reloadButton = document.getElementById('reload');
+
+    if (currentStream) currentStream.close();
+    showLoading(postList, updatedTime, reloadButton);
+
+    const stream = new EventSource(forceRefresh ? '/api/stream?refresh=1' : '/api/stream');
+    currentStream = stream;
+    let received = false;
+
+    // サイト一覧が届いたら取得中のカードを並べる
+    stream.addEventListener('sites', event => {
+        postList.innerHTML = '';
+        postList.className = 'card-grid';
+        JSON.parse(event.data).forEach(site => renderCard(postList, site));
+    });
+
+    stream.addEventListener('site', event => {
+        const site = JSON.parse(event.data);
+        received = true;
+        renderCard(postList, site);
+    });
+
+    stream.addEventListener('done', event => {
+        const data = JSON.parse(event.data);
+        stream.close();
+        currentStream = null;
+        if (data.last_updated) {
+            updatedTime.textContent = `最終更新: ${data.last_updated}`;
+        }
+        finishLoading(reloadButton);
+        fetchComparison();
+    });
+
+    stream.onerror = () => {
+        // 接続できなかった場合はまとめて取得する
+        stream.close();
+        currentStream = null;
+        if (!received) {
+            fetchData(forceRefresh);
+        } else {
+            finishLoading(reloadButton);
+        }
+    };
+}
+
 async function fetchComparison() {
     try {
-        const response = await fetch('/api/comparison');
+        const [response, analyticsResponse] = await Promise.all([fetch('/api/comparison'), fetch('/api/analytics')]);
         if (!response.ok) return;
-        
+
         const comparisons = await response.json();
         console.log('Comparison data:', comparisons);
-        
-        // 各カードに比較情報を追加
+
+        // 分析結果（同じ曜日の平常値との比較）は取得できなければ表示しない
+        const analysis = analyticsResponse.ok ? (await analyticsResponse.json()).sites : {};
+
+        // 各カードに比較情報を追加（比較データはサイト名で対応付ける）
         const cards = document.querySelectorAll('.card');
         cards.forEach(card => {
-            const siteName = card.querySelector('.card-title')?.textContent.trim();
+            const siteName = card.dataset.siteName;
             if (!siteName || !comparisons[siteName]) return;
-            
-            const comp = comparisons[siteName];
+
             const cardContent = card.querySelector('.card-content');
-            
+
             // 既存の比較情報を削除
             const existingComp = cardContent.querySelector('.comparison-info');
             if (existingComp) existingComp.remove();
-            
-            const comparisonDiv = document.createElement('div');
-            comparisonDiv.className = 'comparison-info';
-            
-            const yesterdayComp = comp.yesterday_comparison;
-            const lastWeekComp = comp.last_week_comparison;
-            
-            comparisonDiv.innerHTML = `
-                <div class="comparison-row">
-                    <span class="comparison-label">前日比:</span>
-                    <span class="comparison-value ${yesterdayComp.diff > 0 ? 'positive' : yesterdayComp.diff < 0 ? 'negative' : 'neutral'}">
-                        ${yesterdayComp.diff_text} (${yesterdayComp.rate_text})
-                    </span>
-                </div>
-                <div class="comparison-row">
-                    <span class="comparison-label">前週比:</span>
-                    <span class="comparison-value ${lastWeekComp.diff > 0 ? 'positive' : lastWeekComp.diff < 0 ? 'negative' : 'neutral'}">
-                        ${lastWeekComp.diff_text} (${lastWeekComp.rate_text})
-                    </span>
-                </div>
-            `;
-            
-            cardContent.appendChild(comparisonDiv);
+
+            cardContent.appendChild(createComparisonInfo(comparisons[siteName], analysis[siteName]));
         });
     } catch (error) {
         console.error('Comparison fetch error:', error);
@@ -170,10 +279,10 @@ async function fetchComparison() {
 }
 
 window.addEventListener('DOMContentLoaded', () => {
-    fetchData(false);
+    streamData(false);
 });
 
 const reloadButton = document.getElementById('reload');
 reloadButton.addEventListener('click', () => {
-    fetchData(true);
-});
\ No newline at end of file
+    streamData(true);
+});
@@ -0,0 +1,24 @@
+"""
+テスト共通の設定
+リポジトリのモジュールを読み込めるようにし、DBはテストごとに一時ディレクトリに作成する
+"""
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_manager
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """一時ディレクトリのDB（スキーマ作成済み）を使う"""
+    monkeypatch.setattr(db_manager, 'DB_PATH', str(tmp_path / 'posts_data.db'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_manager.init_db()
+    yield db_manager
+    db_manager.close_thread_connection()
@@ -0,0 +1,20 @@
+"""定時バッチのジョブのテスト"""
+import app
+
+
+def test_scheduled_batch_releases_lease_when_batch_is_busy(db, monkeypatch):
+    monkeypatch.setattr(app, 'run_daily_batch', lambda: None)
+    today = app.get_jst_now().strftime('%Y-%m-%d')
+
+    app.scheduled_batch_job()
+
+    assert not db.is_lease_held(f"scheduled_batch:{today}")
+
+
+def test_scheduled_batch_keeps_lease_after_running(db, monkeypatch):
+    monkeypatch.setattr(app, 'run_daily_batch', lambda: [])
+    today = app.get_jst_now().strftime('%Y-%m-%d')
+
+    app.scheduled_batch_job()
+
+    assert db.is_lease_held(f"scheduled_batch:{today}")
@@ -0,0 +1,44 @@
+"""daily_batch のシャード分割のテスト"""
+import pytest
+
+from config import TARGET_SITES
+from daily_batch import get_site_host, shard_sites
+
+
+def make_site(name, host):
+    return {'name': name, 'type': 'element', 'url': f'https://{host}/{name}'}
+
+
+@pytest.mark.parametrize('count', [2, 3])
+def test_configured_sites_are_balanced(count):
+    shards = [shard_sites(TARGET_SITES, index, count) for index in range(count)]
+    sizes = [len(shard) for shard in shards]
+
+    assert sorted(site['name'] for shard in shards for site in shard) == sorted(site['name'] for site in TARGET_SITES)
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_workflow_matrix_splits_configured_sites_evenly():
+    # .github/workflows/main.yml は --shard i/2 の2シャードで実行する
+    assert [len(shard_sites(TARGET_SITES, index, 2)) for index in range(2)] == [3, 3]
+
+
+def test_same_host_sites_share_a_shard():
+    sites = [
+        make_site('a1', 'a.example'),
+        make_site('a2', 'a.example'),
+        make_site('a3', 'a.example'),
+        make_site('b', 'b.example'),
+        make_site('c', 'c.example'),
+        make_site('d', 'd.example'),
+    ]
+    shards = [shard_sites(sites, index, 2) for index in range(2)]
+
+    host_shards = {}
+    for index, shard in enumerate(shards):
+        for site in shard:
+            host_shards.setdefault(get_site_host(site), set()).add(index)
+    assert all(len(indexes) == 1 for indexes in host_shards.values())
+    assert sorted(len(shard) for shard in shards) == [3, 3]
+    # 同じサイト設定なら毎回同じ振り分けになる
+    assert [shard_sites(sites, index, 2) for index in range(2)] == shards
@@ -0,0 +1,82 @@
+"""PagingBBSAdapter の巡回（ページ送りの打ち切り・前日以前の件数）のテスト"""
+import copy
+from datetime import date, timedelta
+
+import pytest
+
+from config import TARGET_SITES
+import site_adapters
+
+TARGET_DATE = date(2026, 10, 16)
+PINNED_DATE = date(2024, 1, 1)
+
+
+def make_adapter(name, pages):
+    """サイト設定の1店舗のアダプターを作成し、pages（ページごとの投稿の日付のリスト）を返すようにする"""
+    site = copy.deepcopy(next(site for site in TARGET_SITES if site['name'] == name))
+    adapter = site_adapters.create_adapter(site)
+    urls = [url for _, url in adapter.page_urls()]
+    fetched = []
+
+    def fetch_page(url):
+        index = urls.index(url)
+        fetched.append(index)
+        if index >= len(pages):
+            return []
+        return [
+            {'date': day.strftime(adapter.date_format), 'gender': '男性', 'text': f'{index}-{position}'}
+            for position, day in enumerate(pages[index])
+        ]
+
+    adapter.fetch_page = fetch_page
+    return adapter, fetched
+
+
+def scrape(adapter):
+    return adapter.scrape(TARGET_DATE.strftime(adapter.date_format))
+
+
+@pytest.mark.usefixtures('db')
+def test_pinned_old_post_does_not_stop_paging():
+    # 1ページ目の先頭に固定表示の古い投稿があり、指定日の投稿が2ページ目まで続く
+    yesterday = TARGET_DATE - timedelta(days=1)
+    adapter, fetched = make_adapter('canelo', [
+        [PINNED_DATE] + [TARGET_DATE] * 10,
+        [TARGET_DATE] * 13 + [yesterday] * 3,
+    ])
+
+    result = scrape(adapter)
+
+    assert result.total_count == 23
+    assert fetched == [0, 1]
+
+
+def test_pinned_old_post_does_not_complete_past_days(db):
+    # 固定表示の古い投稿が1ページ目の先頭にあっても、巡回が達していない日を0件として扱わない
+    days_ago = [TARGET_DATE - timedelta(days=offset) for offset in range(8)]
+    adapter, _ = make_adapter('canelo', [
+        [PINNED_DATE] + [TARGET_DATE] * 5 + [days_ago[1]] * 3 + [days_ago[2]] * 2,
+    ])
+    db.save_daily_data_many([
+        {
+            'site_name': 'canelo',
+            'record_date': day.isoformat(),
+            'total_count': 9,
+            'male_count': 9,
+            'female_count': 0,
+            'unknown_count': 0
+        }
+        for day in days_ago[2:]
+    ])
+
+    result = scrape(adapter)
+
+    # 2日前は巡回が途中までしか達していないため、数え終えたのは前日のみ
+    assert result.total_count == 5
+    assert result.day_counts == {days_ago[1]: (3, 3, 0, 0)}
+    db.top_up_daily_data([result])
+    rows = {
+        row['record_date']: row['total_count']
+        for row in db.get_daily_data_range(days_ago[7].isoformat(), days_ago[1].isoformat())
+    }
+    assert rows == {days_ago[1].isoformat(): 3, **{day.isoformat(): 9 for day in days_ago[2:]}}